@@ -6,6 +6,8 @@ import threading
 
 class PressureReceiver:
     _latest_pressures = [0.0, 0.0, 0.0, 0.0]
+    # Callbacks fed every sample as it arrives: callback(time.monotonic(), (p0, p1, p2, p3))
+    _listeners = ()
 
     def __init__(self, host='0.0.0.0', port=65432):
         self.host = host
@@ -47,6 +49,14 @@ class PressureReceiver:
                 p2 = sensors.get("channel_2", 0.0)
                 p3 = sensors.get("channel_3", 0.0)
                 PressureReceiver._latest_pressures = [p0, p1, p2, p3]
+                if PressureReceiver._listeners:
+                    t = time.monotonic()
+                    pressures = (p0, p1, p2, p3)
+                    for callback in PressureReceiver._listeners:
+                        try:
+                            callback(t, pressures)
+                        except Exception as e:
+                            print(f"[SERVER] Listener error: {e}")
             else:
                 print("[SERVER] Invalid data: missing 'sensors'")
         except json.JSONDecodeError as e:
@@ -56,6 +66,15 @@ class PressureReceiver:
     def getpressures(cls):
         return tuple(cls._latest_pressures)
 
+    @classmethod
+    def add_listener(cls, callback):
+        # Replace the tuple rather than mutating it, so handle_line can iterate without a lock
+        cls._listeners = cls._listeners + (callback,)
+
+    @classmethod
+    def remove_listener(cls, callback):
+        cls._listeners = tuple(c for c in cls._listeners if c is not callback)
+
     def status(self):
         """
         Returns a string indicating the status of the connection.
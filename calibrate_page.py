@@ -17,6 +17,9 @@ class CalibratePage(ctk.CTkFrame):
         super().__init__(master, *args, **kwargs)
         self.app = app
         self.trial_stop_event = None  # Event to signal thread termination
+        # after() ids of the periodic updaters; they only run while the page is shown
+        self._sensor_after_id = None
+        self._graph_after_id = None
 
         # --- Header ---
         self.header_label = ctk.CTkLabel(self, text="Calibrate", font=("Arial", 20, "bold"))
@@ -63,7 +66,6 @@ class CalibratePage(ctk.CTkFrame):
             self.sensor_values_frame, text="Sensor 3: N/A", font=("Arial", 16)
         )
         self.sensor2_label.grid(row=0, column=2, padx=5, pady=5)
-        self.update_sensor_values()  # Start updating sensor labels
 
         # --- Graph Frame ---
         self.graph_frame = ctk.CTkFrame(self)
@@ -110,8 +112,22 @@ class CalibratePage(ctk.CTkFrame):
 
         self.sensor_selected = [False, False, False]
 
-        # Start the graph update loop.
-        self.update_graph()
+        # The sensor label and graph loops are started by on_show().
+
+    def on_show(self):
+        """Resume the sensor label and graph updaters when the page becomes visible."""
+        if self._sensor_after_id is None:
+            self.update_sensor_values()
+        if self._graph_after_id is None:
+            self.update_graph()
+
+    def on_hide(self):
+        """Pause the updaters while the page is hidden; the page itself is kept."""
+        for after_id in (self._sensor_after_id, self._graph_after_id):
+            if after_id is not None:
+                self.after_cancel(after_id)
+        self._sensor_after_id = None
+        self._graph_after_id = None
 
     def update_sensor_values(self):
         try:
@@ -127,7 +143,7 @@ class CalibratePage(ctk.CTkFrame):
             self.sensor2_label.configure(text=f"Sensor 2: {value2}")
         except Exception as e:
             print(f"Error updating sensor values: {e}")
-        self.after(500, self.update_sensor_values)
+        self._sensor_after_id = self.after(500, self.update_sensor_values)
 
     def toggle_sensor(self, sensor_index):
         self.sensor_selected[sensor_index] = not self.sensor_selected[sensor_index]
@@ -201,7 +217,7 @@ class CalibratePage(ctk.CTkFrame):
             self.canvas.draw()
         except Exception as e:
             print(f"Error updating calibrate page graph: {e}")
-        self.after(50, self.update_graph)
+        self._graph_after_id = self.after(50, self.update_graph)
 
     def prompt_measured_pressure_before(self, target_pressure):
         """
@@ -230,6 +246,8 @@ class CalibratePage(ctk.CTkFrame):
         return result[0] if result else 0
 
     def start_check_calibration(self):
+        if not self.app.subsystems_ready(["valves", "calibration"], "Check calibration"):
+            return
         popup = ctk.CTkToplevel(self)
         popup.title("Check Calibration")
         tk.Label(popup, text="Enter Reference Pressure (max 100 psi):").pack(padx=10, pady=5)
@@ -329,6 +347,8 @@ class CalibratePage(ctk.CTkFrame):
         ctk.CTkButton(popup, text="OK", command=popup.destroy).pack(pady=10)
 
     def start_sensor_calibration(self):
+        if not self.app.subsystems_ready(["valves", "lps"], "Sensor calibration"):
+            return
         popup = ctk.CTkToplevel(self)
         popup.title("Calibrate Sensors (0 psi)")
         desired_pressures = [round(i * 7.25, 2) for i in range(int(100 / 7.25) + 1)]
@@ -419,6 +439,11 @@ class CalibratePage(ctk.CTkFrame):
             current_pressure += increment
 
         print("Full sensor calibration complete. All data saved.")
+        try:
+            from calibrating_pressure_transducers.calibration_store import CalibrationStore
+            CalibrationStore(os.path.join(base_folder, "store")).ingest([calibration_folder])
+        except Exception as e:
+            print(f"Could not add the calibration files to the store: {e}")
         complete_popup = ctk.CTkToplevel(self)
         complete_popup.title("Calibration Complete")
         tk.Label(complete_popup, text="Sensor calibration is complete and all data has been saved.").pack(padx=10, pady=10)
@@ -450,6 +475,8 @@ class CalibratePage(ctk.CTkFrame):
         return result['value']
 
     def start_pressure_trials(self):
+        if not self.app.subsystems_ready(["valves", "calibration"], "Pressure trials"):
+            return
         # Initialize stop event
         self.trial_stop_event = threading.Event()
         threading.Thread(target=self._pressure_trials_thread, daemon=True).start()
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+Accuracy vs. conversion cost of the pressure calibrator families.
+
+Every candidate is fitted per sensor on the same training rows and scored
+on the same held-out rows:
+
+- mlp, mlp_log, mlp_scaled: the sklearn pipelines of getCalibrationData.py,
+  getCalibrationDatav2.py and scale_data.py (built by parallel_train.py)
+- keras: modelv2.PressureCalibratorKeras's network, converted the way its
+  pressure_sensor_converter does, with model.predict per sample (skipped
+  when TensorFlow is not installed)
+- poly1..poly3: least-squares polynomials of the reading
+- pwl: piecewise-linear interpolation through the median reading and
+  pressure of `knots` quantile bins
+
+For each it reports held-out RMSE/MAE, the time of one conversion the way
+read_sensors does it (one reading at a time) and per sample in a batch, and
+the time and peak memory of loading the saved artifact in a fresh
+interpreter, imports included. Candidates whose worst-sensor RMSE meets
+--max-rmse are ranked by single-conversion time; the rest follow by RMSE.
+
+Usage (from the repository root):
+    python -m calibrating_pressure_transducers.benchmark_calibrators --store calibration_data/store [--max-rmse 0.5]
+    python -m calibrating_pressure_transducers.benchmark_calibrators <data folder> --candidates pwl poly2 mlp
+"""
+import abc
+import argparse
+import bisect
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+# The load probe imports this module in a fresh interpreter, so pandas and sklearn are only
+# imported where a candidate needs them
+SENSORS = ("pressure0", "pressure1", "pressure2")
+
+
+class Candidate(abc.ABC):
+    name = ""
+    suffix = ".joblib"
+    extra_features = ()
+
+    def features(self, sensor):
+        return [sensor, *self.extra_features]
+
+    @abc.abstractmethod
+    def fit(self, X, y):
+        """Fit on the feature rows X and the reference pressures y."""
+
+    @abc.abstractmethod
+    def predict_one(self, row):
+        """One conversion of a single reading (a list of feature values)."""
+
+    @abc.abstractmethod
+    def predict(self, X):
+        """Conversions of every row of X."""
+
+    def save(self, path):
+        from joblib import dump
+        dump(self.model, path)
+
+    @staticmethod
+    def load(path):
+        from joblib import load
+        return load(path)
+
+
+class SklearnCandidate(Candidate):
+    def __init__(self, name, variant, **model_options):
+        from calibrating_pressure_transducers import parallel_train
+
+        self.name = name
+        self.variant = variant
+        self.extra_features = parallel_train.VARIANTS[variant]["features"]
+        self.model_options = model_options
+
+    def fit(self, X, y):
+        from calibrating_pressure_transducers import parallel_train
+
+        self.model = parallel_train.build_model(self.variant, **self.model_options).fit(X, y)
+
+    def predict_one(self, row):
+        return self.model.predict([row])[0]
+
+    def predict(self, X):
+        return self.model.predict(X)
+
+
+class KerasCandidate(Candidate):
+    name = "keras"
+    suffix = ".keras"
+
+    def __init__(self, epochs=100, batch_size=32):
+        self.epochs = epochs
+        self.batch_size = batch_size
+
+    def fit(self, X, y):
+        import tensorflow as tf
+        from calibrating_pressure_transducers.modelv2 import PressureCalibratorKeras
+
+        self.model = PressureCalibratorKeras(data_folder=None).build_model()
+        self.model.compile(optimizer=tf.keras.optimizers.Adam(), loss='mse')
+        early_stop = tf.keras.callbacks.EarlyStopping(monitor='val_loss', patience=10, restore_best_weights=True)
+        reduce_lr = tf.keras.callbacks.ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=5, min_lr=1e-6)
+        self.model.fit(X, y, validation_split=0.2, epochs=self.epochs, batch_size=self.batch_size,
+                       callbacks=[early_stop, reduce_lr], verbose=0)
+
+    def predict_one(self, row):
+        return self.model.predict(np.array([row]), verbose=0).flatten()[0]
+
+    def predict(self, X):
+        return self.model.predict(X, batch_size=4096, verbose=0).flatten()
+
+    def save(self, path):
+        self.model.save(path)
+
+    @staticmethod
+    def load(path):
+        import tensorflow as tf
+        return tf.keras.models.load_model(path)
+
+
+class PolynomialCandidate(Candidate):
+    suffix = ".npz"
+
+    def __init__(self, degree):
+        self.name = f"poly{degree}"
+        self.degree = degree
+
+    def fit(self, X, y):
+        self.coefficients = np.polyfit(X[:, 0], y, self.degree)
+        self._coefficients = [float(c) for c in self.coefficients]
+
+    def predict_one(self, row):
+        x = row[0]
+        result = 0.0
+        for c in self._coefficients:  # Horner
+            result = result * x + c
+        return result
+
+    def predict(self, X):
+        return np.polyval(self.coefficients, X[:, 0])
+
+    def save(self, path):
+        np.savez(path, coefficients=self.coefficients)
+
+    @staticmethod
+    def load(path):
+        with np.load(path) as data:
+            return data["coefficients"]
+
+
+class PiecewiseLinearCandidate(Candidate):
+    name = "pwl"
+    suffix = ".npz"
+
+    def __init__(self, knots=32):
+        self.knots = knots
+
+    def fit(self, X, y):
+        x = X[:, 0]
+        order = np.argsort(x, kind="stable")
+        xs, ys = [], []
+        for chunk in np.array_split(order, min(self.knots, len(order))):
+            if len(chunk):
+                xs.append(np.median(x[chunk]))
+                ys.append(np.median(y[chunk]))
+        # Readings rise with pressure; a non-monotonic knot would only be noise
+        self.x = np.asarray(xs)
+        self.y = np.maximum.accumulate(np.asarray(ys))
+        self._x, self._y = self.x.tolist(), self.y.tolist()
+
+    def predict_one(self, row):
+        xs, ys = self._x, self._y
+        x = row[0]
+        i = bisect.bisect_right(xs, x)
+        if i <= 0:
+            return ys[0]
+        if i >= len(xs):
+            return ys[-1]
+        x0, x1 = xs[i - 1], xs[i]
+        return ys[i - 1] + (ys[i] - ys[i - 1]) * (x - x0) / (x1 - x0) if x1 > x0 else ys[i]
+
+    def predict(self, X):
+        return np.interp(X[:, 0], self.x, self.y)
+
+    def save(self, path):
+        np.savez(path, x=self.x, y=self.y)
+
+    @staticmethod
+    def load(path):
+        with np.load(path) as data:
+            return data["x"], data["y"]
+
+
+def candidates(names=None, epochs=100):
+    everything = {
+        "mlp": lambda: SklearnCandidate("mlp", "single"),
+        "mlp_log": lambda: SklearnCandidate("mlp_log", "log"),
+        "mlp_scaled": lambda: SklearnCandidate("mlp_scaled", "scaled"),
+        "keras": lambda: KerasCandidate(epochs=epochs),
+        "poly1": lambda: PolynomialCandidate(1),
+        "poly2": lambda: PolynomialCandidate(2),
+        "poly3": lambda: PolynomialCandidate(3),
+        "pwl": lambda: PiecewiseLinearCandidate(),
+    }
+    for name in names or everything:
+        if name == "keras":
+            try:
+                import tensorflow  # noqa: F401
+            except ImportError:
+                if names:
+                    print("Skipping keras: TensorFlow is not installed")
+                continue
+        yield everything[name]()
+
+
+def split(data, test_size=0.2, test_days=None, seed=42):
+    """Boolean test mask: the `test_days` (needs the store's day column) or a seeded random fraction."""
+    if test_days:
+        return data["day"].isin(test_days).to_numpy()
+    rng = np.random.default_rng(seed)
+    return rng.random(len(data)) < test_size
+
+
+def time_single(candidate, X, repeats):
+    rows = X[np.linspace(0, len(X) - 1, min(repeats, len(X))).astype(int)].tolist()
+    start = time.perf_counter()
+    for row in rows:
+        candidate.predict_one(row)
+    return (time.perf_counter() - start) / len(rows)
+
+
+def time_batch(candidate, X):
+    start = time.perf_counter()
+    candidate.predict(X)
+    return (time.perf_counter() - start) / len(X)
+
+
+def measure_load(candidate, path):
+    """Load time and peak RSS of a fresh interpreter that loads `path`, imports included."""
+    probe = [sys.executable, "-m", "calibrating_pressure_transducers.benchmark_calibrators",
+             "--load-probe", type(candidate).__name__, str(path)]
+    root = Path(__file__).resolve().parent.parent
+    result = subprocess.run(probe, capture_output=True, text=True, cwd=root)
+    if result.returncode:
+        print(f"{candidate.name}: load probe failed: {result.stderr.strip().splitlines()[-1:]}")
+        return float("nan"), float("nan")
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    return report["load_s"], report["rss_mb"]
+
+
+def load_probe(kind, path):
+    import resource
+    start = time.perf_counter()
+    globals()[kind].load(path)
+    load_s = time.perf_counter() - start
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_mb = rss / (1 << 20) if sys.platform == "darwin" else rss / 1024  # bytes on macOS, KiB on Linux
+    print(json.dumps({"load_s": load_s, "rss_mb": rss_mb}))
+
+
+def run(data, names=None, test_size=0.2, test_days=None, repeats=1000, epochs=100, measure=True):
+    """
+    Fit and score every candidate on every sensor.
+
+    :return: list of per-sensor result dicts
+    """
+    test = split(data, test_size, test_days)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for candidate in candidates(names, epochs):
+            for sensor in SENSORS:
+                columns = candidate.features(sensor)
+                rows = data.dropna(subset=columns + ["Measured_pressure"])
+                mask = test[rows.index.to_numpy()]
+                X = rows[columns].to_numpy(float)
+                y = rows["Measured_pressure"].to_numpy(float)
+                if mask.all() or not mask.any():
+                    print(f"{candidate.name} {sensor}: no train/test split possible ({len(rows)} rows)")
+                    continue
+                start = time.perf_counter()
+                candidate.fit(X[~mask], y[~mask])
+                fit_s = time.perf_counter() - start
+                residuals = y[mask] - candidate.predict(X[mask])
+                path = Path(tmp) / f"{candidate.name}_{sensor}{candidate.suffix}"
+                candidate.save(path)
+                load_s, rss_mb = measure_load(candidate, path) if measure else (float("nan"), float("nan"))
+                result = {
+                    "candidate": candidate.name, "sensor": sensor, "train_rows": int((~mask).sum()),
+                    "test_rows": int(mask.sum()), "fit_s": fit_s,
+                    "rmse": float(np.sqrt((residuals ** 2).mean())), "mae": float(np.abs(residuals).mean()),
+                    "single_us": time_single(candidate, X[mask], repeats) * 1e6,
+                    "batch_us": time_batch(candidate, X[mask]) * 1e6,
+                    "load_s": load_s, "rss_mb": rss_mb, "artifact_kb": os.path.getsize(path) / 1024,
+                }
+                results.append(result)
+                print(f"{candidate.name:<10} {sensor}: RMSE {result['rmse']:.3f}  {result['single_us']:.1f} us/conversion")
+    return results
+
+
+def rank(results, max_rmse):
+    """Per candidate: worst-sensor RMSE, mean of the rest; passing candidates first, fastest first."""
+    summary = {}
+    for r in results:
+        summary.setdefault(r["candidate"], []).append(r)
+    rows = []
+    for name, per_sensor in summary.items():
+        rows.append({
+            "candidate": name,
+            "rmse": max(r["rmse"] for r in per_sensor),
+            **{key: float(np.mean([r[key] for r in per_sensor]))
+               for key in ("mae", "single_us", "batch_us", "load_s", "rss_mb", "artifact_kb", "fit_s")},
+        })
+    for row in rows:
+        row["passes"] = row["rmse"] <= max_rmse
+    return sorted(rows, key=lambda row: (not row["passes"], row["single_us"] if row["passes"] else row["rmse"]))
+
+
+def print_report(ranked, max_rmse):
+    print(f"\nRanked at worst-sensor RMSE <= {max_rmse} PSI")
+    print(f"{'#':>2} {'candidate':<10} {'RMSE':>7} {'MAE':>7} {'single us':>10} {'batch us':>9} "
+          f"{'load s':>7} {'RSS MB':>7} {'size KB':>8} {'fit s':>7}")
+    for i, row in enumerate(ranked, 1):
+        print(f"{i:>2} {row['candidate']:<10} {row['rmse']:>7.3f} {row['mae']:>7.3f} {row['single_us']:>10.1f} "
+              f"{row['batch_us']:>9.3f} {row['load_s']:>7.3f} {row['rss_mb']:>7.1f} {row['artifact_kb']:>8.1f} "
+              f"{row['fit_s']:>7.1f}{'' if row['passes'] else '  (fails accuracy bar)'}")
+    passing = [row for row in ranked if row["passes"]]
+    if passing:
+        print(f"\nFastest calibrator meeting the bar: {passing[0]['candidate']}")
+    else:
+        print("\nNo candidate meets the accuracy bar")
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == "--load-probe":
+        load_probe(sys.argv[2], sys.argv[3])
+        return
+    parser = argparse.ArgumentParser(description="Benchmark the calibrator families on held-out calibration data.")
+    parser.add_argument("data", nargs="?", help="Folder with the calibration CSVs")
+    parser.add_argument("--store", help="Read the readings from this calibration store instead")
+    parser.add_argument("--candidates", nargs="*", help="Subset of: mlp mlp_log mlp_scaled keras poly1 poly2 poly3 pwl")
+    parser.add_argument("--max-rmse", type=float, default=0.5, help="Accuracy bar in PSI")
+    parser.add_argument("--test-size", type=float, default=0.2, help="Random held-out fraction")
+    parser.add_argument("--test-days", nargs="*", help="With --store: hold out these YYYYMMDD days instead")
+    parser.add_argument("--repeats", type=int, default=1000, help="Single conversions timed per sensor")
+    parser.add_argument("--epochs", type=int, default=100, help="Keras training epochs")
+    parser.add_argument("--no-load", action="store_true", help="Skip the load time/memory probes")
+    parser.add_argument("--csv", help="Write the per-sensor results to this CSV")
+    parser.add_argument("--json", help="Write the ranked report to this JSON file")
+    args = parser.parse_args()
+
+    from calibrating_pressure_transducers import parallel_train
+
+    if args.store:
+        data, _ = parallel_train.load_store(args.store)
+    elif args.data:
+        data, _ = parallel_train.load_dataset(args.data)
+    else:
+        parser.error("give a data folder or --store")
+    if args.test_days and "day" not in data.columns:
+        parser.error("--test-days needs --store")
+    data = data.reset_index(drop=True)
+
+    results = run(data, names=args.candidates, test_size=args.test_size, test_days=args.test_days,
+                  repeats=args.repeats, epochs=args.epochs, measure=not args.no_load)
+    ranked = rank(results, args.max_rmse)
+    print_report(ranked, args.max_rmse)
+    if args.csv:
+        import pandas as pd
+        pd.DataFrame(results).to_csv(args.csv, index=False)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump({"max_rmse": args.max_rmse, "ranked": ranked, "per_sensor": results}, file, indent=2)
+            file.write("\n")
+
+
+if __name__ == "__main__":
+    main()
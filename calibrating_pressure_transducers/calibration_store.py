@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Append-only, partitioned store of the calibration readings.
+
+CalibratePage.perform_sensor_calibration writes one small
+calibration_<psi>_<timestamp>.csv per reference pressure, combined_csv.py
+used to re-read and rewrite a whole day of them into one CSV, and the
+trainers then re-read all of those again. The store keeps the readings once,
+as NumPy column files:
+
+    calibration_data/store/
+        manifest.json                   ingested files (size, mtime, sha256, rows)
+        <YYYYMMDD>/<sensor>/part-000001.npz
+
+- ingest() only opens files whose size or modification time is not in the
+  manifest, and skips files whose contents were ingested under another name
+- every sensor's non-empty readings go to the partition of the day (taken
+  from the file or folder name) and the sensor; a row identical to one an
+  existing part already holds is dropped, so a combined CSV of files that
+  are already in the store adds nothing. Repeated rows within the new files
+  are kept: with quantized ADC readings they are real repeated samples, and
+  combine_csv_files kept them too
+- new rows are written as new part files; existing parts are never
+  rewritten, except by compact()
+- read() picks partitions by day and sensor from the directory names, loads
+  only their column arrays and filters time and pressure with array masks
+
+Usage:
+    python -m calibrating_pressure_transducers.calibration_store ingest calibration_data
+    python -m calibrating_pressure_transducers.calibration_store info
+    python -m calibrating_pressure_transducers.calibration_store export pressure1 out.csv --days 20250420
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import re
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+STORE_DIR = Path("calibration_data") / "store"
+SENSORS = ("pressure0", "pressure1", "pressure2", "pressure3")
+# Columns every partition holds next to the sensor's own reading
+COLUMNS = ("time", "Measured_pressure", "LPS_pressure", "LPS_temperature")
+REQUIRED_COLUMNS = ["Measured_pressure", "LPS_pressure", "LPS_temperature"]
+# combined_csv.py dropped the first half second of every recording, while the valves open
+SETTLE_TIME = 0.5
+
+_DAY = re.compile(r"(20\d{6})")
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def day_of(path):
+    """YYYYMMDD of a calibration file: from its name, its folder's name, else its modification date."""
+    for part in (path.name, path.parent.name):
+        match = _DAY.search(part)
+        if match:
+            return match.group(1)
+    return datetime.date.fromtimestamp(path.stat().st_mtime).strftime("%Y%m%d")
+
+
+class CalibrationStore:
+    def __init__(self, root=STORE_DIR):
+        self.root = Path(root)
+        self.manifest_path = self.root / "manifest.json"
+        self.manifest = self._read_manifest()
+
+    def _read_manifest(self):
+        if not self.manifest_path.exists():
+            return {"files": {}, "next_part": 1}
+        with open(self.manifest_path) as file:
+            return json.load(file)
+
+    def _write_manifest(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix(".json.tmp")
+        with open(tmp_path, "w") as file:
+            json.dump(self.manifest, file, indent=2, sort_keys=True)
+            file.write("\n")
+        os.replace(tmp_path, self.manifest_path)
+
+    # ---- writing ----
+
+    def ingest(self, paths):
+        """
+        Add the calibration CSVs in `paths` (files or folders, searched recursively) that are not in the store.
+
+        :return: number of rows added
+        """
+        files = []
+        for path in map(Path, paths):
+            files.extend(sorted(path.rglob("*.csv")) if path.is_dir() else [path])
+        known = self.manifest["files"]
+        hashes = {entry["sha256"] for entry in known.values()}
+        batches = {}  # (day, sensor) -> list of frames
+        added = {}
+        for path in files:
+            key = str(path.resolve())
+            stat = path.stat()
+            stamp = [stat.st_size, stat.st_mtime_ns]
+            if key in known and known[key]["stamp"] == stamp:
+                continue
+            sha256 = file_sha256(path)
+            if sha256 in hashes:
+                known[key] = {"stamp": stamp, "sha256": sha256, "day": day_of(path), "rows": 0}
+                continue
+            try:
+                frame = pd.read_csv(path)
+            except Exception as e:
+                print(f"Error reading CSV file {path}: {e}")
+                continue
+            if not all(col in frame.columns for col in REQUIRED_COLUMNS):
+                print(f"Skipping {path}: not a calibration file")
+                continue
+            frame = frame.dropna(subset=REQUIRED_COLUMNS)
+            if "time" not in frame.columns:
+                frame = frame.assign(time=np.nan)
+            day = day_of(path)
+            for sensor in SENSORS:
+                if sensor in frame.columns:
+                    rows = frame.loc[frame[sensor].notna(), [*COLUMNS, sensor]]
+                    if len(rows):
+                        batches.setdefault((day, sensor), []).append(rows.rename(columns={sensor: "reading"}))
+            added[key] = {"stamp": stamp, "sha256": sha256, "day": day, "rows": len(frame)}
+            hashes.add(sha256)
+
+        total = 0
+        for (day, sensor), frames in sorted(batches.items()):
+            total += self._append(day, sensor, pd.concat(frames, ignore_index=True))
+        known.update(added)
+        if files:
+            self._write_manifest()
+        print(f"Ingested {len(added)} new files, {total} new rows into {self.root}")
+        return total
+
+    def _append(self, day, sensor, rows):
+        """Write the rows the (day, sensor) partition's parts do not hold yet as a new part; returns their count."""
+        rows = rows.astype(float)
+        row_hash = pd.util.hash_pandas_object(rows, index=False).to_numpy(np.uint64)
+        keep = np.ones(len(row_hash), bool)
+        existing = [self._load_part(part)["row_hash"] for part in self.parts(day, sensor)]
+        if existing:
+            keep &= ~np.isin(row_hash, np.concatenate(existing))
+        if not keep.any():
+            return 0
+        folder = self.root / day / sensor
+        folder.mkdir(parents=True, exist_ok=True)
+        part = self.manifest["next_part"]
+        self.manifest["next_part"] = part + 1
+        arrays = {column: rows[column].to_numpy(float)[keep] for column in (*COLUMNS, "reading")}
+        np.savez(folder / f"part-{part:06d}.npz", row_hash=row_hash[keep], **arrays)
+        return int(keep.sum())
+
+    def compact(self):
+        """Merge the parts of every partition into one file."""
+        for day in self.days():
+            for sensor in SENSORS:
+                parts = self.parts(day, sensor)
+                if len(parts) < 2:
+                    continue
+                loaded = [self._load_part(part) for part in parts]
+                merged = {key: np.concatenate([arrays[key] for arrays in loaded]) for key in loaded[0]}
+                part = self.manifest["next_part"]
+                self.manifest["next_part"] = part + 1
+                np.savez(self.root / day / sensor / f"part-{part:06d}.npz", **merged)
+                self._write_manifest()
+                for old in parts:
+                    old.unlink()
+
+    # ---- reading ----
+
+    def days(self):
+        if not self.root.exists():
+            return []
+        return sorted(p.name for p in self.root.iterdir() if p.is_dir() and _DAY.fullmatch(p.name))
+
+    def parts(self, day, sensor):
+        return sorted((self.root / day / sensor).glob("part-*.npz"))
+
+    @staticmethod
+    def _load_part(path):
+        with np.load(path) as data:
+            return {key: data[key] for key in data.files}
+
+    def read(self, sensor, days=None, min_time=SETTLE_TIME, pressure_range=None):
+        """
+        One sensor's readings as a DataFrame with the columns time, <sensor>, Measured_pressure,
+        LPS_pressure, LPS_temperature and day.
+
+        :param days: YYYYMMDD strings (or a (first, last) range as a tuple) to read; None for all.
+        :param min_time: Drop readings taken earlier than this in their recording (None keeps all).
+        :param pressure_range: (low, high) of Measured_pressure to keep.
+        """
+        selected = self.days()
+        if isinstance(days, tuple):
+            selected = [day for day in selected if days[0] <= day <= days[1]]
+        elif days is not None:
+            wanted = set(days)
+            selected = [day for day in selected if day in wanted]
+        frames = []
+        for day in selected:
+            for part in self.parts(day, sensor):
+                arrays = self._load_part(part)
+                mask = np.ones(len(arrays["reading"]), bool)
+                if min_time is not None:
+                    mask &= arrays["time"] > min_time
+                if pressure_range is not None:
+                    mask &= (arrays["Measured_pressure"] >= pressure_range[0]) & \
+                            (arrays["Measured_pressure"] <= pressure_range[1])
+                columns = {"time": arrays["time"][mask], sensor: arrays["reading"][mask]}
+                columns.update({c: arrays[c][mask] for c in COLUMNS[1:]})
+                frames.append(pd.DataFrame(columns).assign(day=day))
+        if not frames:
+            return pd.DataFrame(columns=["time", sensor, *COLUMNS[1:], "day"])
+        return pd.concat(frames, ignore_index=True)
+
+    def read_all(self, sensors=SENSORS[:3], **filters):
+        """The readings of `sensors` in one frame, each row holding one sensor's reading (the others NaN)."""
+        return pd.concat([self.read(sensor, **filters) for sensor in sensors], ignore_index=True)
+
+    def files(self):
+        """Every part file, for hashing what a model was trained on."""
+        return sorted(self.root.glob("*/*/part-*.npz"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest calibration CSVs into the partitioned store and read them back.")
+    parser.add_argument("--store", default=str(STORE_DIR))
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest = commands.add_parser("ingest", help="Add new calibration CSVs")
+    ingest.add_argument("paths", nargs="+", help="CSV files or folders")
+    commands.add_parser("info", help="Rows per day and sensor")
+    commands.add_parser("compact", help="Merge each partition's parts")
+    export = commands.add_parser("export", help="Write one sensor's readings to a CSV")
+    export.add_argument("sensor", choices=SENSORS)
+    export.add_argument("out")
+    export.add_argument("--days", nargs="*")
+    export.add_argument("--min-time", type=float, default=SETTLE_TIME)
+    args = parser.parse_args()
+
+    store = CalibrationStore(args.store)
+    start = time.perf_counter()
+    if args.command == "ingest":
+        store.ingest(args.paths)
+    elif args.command == "compact":
+        store.compact()
+    elif args.command == "export":
+        rows = store.read(args.sensor, days=args.days, min_time=args.min_time)
+        rows.to_csv(args.out, index=False)
+        print(f"{len(rows)} rows written to {args.out}")
+    else:
+        for day in store.days():
+            counts = {sensor: sum(len(store._load_part(p)["reading"]) for p in store.parts(day, sensor))
+                      for sensor in SENSORS}
+            print(day, "  ".join(f"{sensor}={count}" for sensor, count in counts.items() if count))
+    print(f"Done in {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,33 @@
+import argparse
 import os
+
 import pandas as pd
 
-def combine_csv_files(folder_path, output_file):
-    # List to hold dataframes
-    dataframes = []
+from calibrating_pressure_transducers.calibration_store import CalibrationStore, STORE_DIR, SENSORS, SETTLE_TIME
 
-    # Iterate through all files in the folder
-    for filename in os.listdir(folder_path):
-        if filename.endswith('.csv'):
-            file_path = os.path.join(folder_path, filename)
-            # Read the CSV file into a dataframe
-            df = pd.read_csv(file_path)
-            # Filter rows where 'time' column is greater than 0.5
-            df_filtered = df[df['time'] > 0.5]
-            dataframes.append(df_filtered)
 
-    # Concatenate all dataframes
-    combined_df = pd.concat(dataframes, ignore_index=True)
+def combine_csv_files(folder_path, output_file, store_dir=STORE_DIR):
+    """
+    Ingest a day's calibration CSVs into the calibration store (only the files it does not hold yet)
+    and write that day's readings, past the first SETTLE_TIME seconds, to one CSV.
 
-    # Write the combined dataframe to a new CSV file
+    The trainers can read the store directly (parallel_train.py --store); the combined CSV is for
+    the older scripts that take a folder of CSVs.
+    """
+    store = CalibrationStore(store_dir)
+    store.ingest([folder_path])
+    days = sorted({entry["day"] for path, entry in store.manifest["files"].items()
+                   if os.path.dirname(path) == os.path.abspath(folder_path)})
+    frames = [store.read(sensor, days=days, min_time=SETTLE_TIME) for sensor in SENSORS]
+    combined_df = pd.concat([frame for frame in frames if len(frame)], ignore_index=True)
     combined_df.to_csv(output_file, index=False)
     print(f"Combined CSV file saved as {output_file}")
 
-# Example usage
-folder_path = '/Users/colehanan/Desktop/WashuClasses/MeshAlyzer/betterData_150_PSI/calibration_20250420'
-output_file = '/Users/colehanan/Desktop/WashuClasses/MeshAlyzer/betterData_150_PSI/daily_combined_csv/combined_output_20250420.csv'
-combine_csv_files(folder_path, output_file)
\ No newline at end of file
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Combine a day of calibration CSVs through the calibration store.")
+    parser.add_argument("folder", help="e.g. calibration_data/calibration_20250420")
+    parser.add_argument("output", help="e.g. daily_combined_csv/combined_output_20250420.csv")
+    parser.add_argument("--store", default=str(STORE_DIR))
+    args = parser.parse_args()
+    combine_csv_files(args.folder, args.output, args.store)
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Dependency-free export of the trained pressure calibrators.
+
+Loading trained_pressure_calibrator_multioutput.joblib unpickles three
+sklearn Pipelines, which imports scikit-learn and scipy at startup, and the
+Keras calibrators of modelv2.py need TensorFlow. What a conversion actually
+uses is a few small arrays per sensor: the input scaler's mean and scale,
+the MLP's weights and biases, and the target transform. CompactCalibrator
+holds exactly those and evaluates the network with NumPy.
+
+- sklearn: StandardScaler -> MLPRegressor, optionally wrapped in a
+  TransformedTargetRegressor with a StandardScaler (getCalibrationData) or
+  log1p/expm1 (getCalibrationDatav2) target transform
+- Keras: Dense/Activation layers; BatchNormalization is folded into the
+  Dense layer before it and Dropout is dropped, which is what inference does
+
+The export is saved as <model>.compact.npz next to the joblib (one set of
+"<sensor>.<array>" entries per sensor, no pickled objects) and has the same
+models / pressure_sensor_converter_main interface as PressureCalibrator, so
+the app uses it without importing scikit-learn. Predictions agree with the
+originals to floating-point rounding; main() checks that before saving.
+
+Usage (from the repository root):
+    python -m calibrating_pressure_transducers.compact_calibrator [trained_pressure_calibrator_multioutput.joblib]
+    (without a model: the latest registered pressure_calibrator)
+    python -m calibrating_pressure_transducers.compact_calibrator --keras pressure0_calibration_model.keras \\
+        pressure1_calibration_model.keras pressure2_calibration_model.keras --out keras_calibrator.compact.npz
+"""
+import argparse
+import os
+import time
+import zipfile
+
+import numpy as np
+
+SENSORS = ("pressure0", "pressure1", "pressure2")
+TARGET_TRANSFORMS = ("none", "standard", "log1p")
+ACTIVATIONS = {
+    "identity": lambda x: x,
+    "tanh": np.tanh,
+    "relu": lambda x: np.maximum(x, 0.0),
+    "logistic": lambda x: 1.0 / (1.0 + np.exp(-x)),
+}
+# Keras activation names -> the ones above
+_KERAS_ACTIVATIONS = {"linear": "identity", "tanh": "tanh", "relu": "relu", "sigmoid": "logistic"}
+
+
+class CompactNetwork:
+    """One sensor's scaler + MLP + target transform as plain arrays."""
+
+    def __init__(self, weights, biases, activations, x_mean, x_scale, y_transform="none", y_mean=0.0,
+                 y_scale=1.0, features=()):
+        if y_transform not in TARGET_TRANSFORMS:
+            raise ValueError(f"unknown target transform {y_transform!r}")
+        self.weights = [np.asarray(w, dtype=np.float64) for w in weights]
+        self.biases = [np.asarray(b, dtype=np.float64) for b in biases]
+        self.activations = list(activations)
+        self.x_mean = np.asarray(x_mean, dtype=np.float64)
+        self.x_scale = np.asarray(x_scale, dtype=np.float64)
+        self.y_transform = y_transform
+        self.y_mean = float(y_mean)
+        self.y_scale = float(y_scale)
+        self.features = list(features)
+        self._functions = [ACTIVATIONS[name] for name in self.activations]
+
+    @classmethod
+    def from_sklearn(cls, pipeline, features=()):
+        """Extract a fitted Pipeline([("scaler", StandardScaler), ("regressor", MLP or TransformedTargetRegressor)])."""
+        scaler = pipeline.named_steps["scaler"]
+        regressor = pipeline.named_steps["regressor"]
+        y_transform, y_mean, y_scale = "none", 0.0, 1.0
+        if hasattr(regressor, "regressor_"):  # TransformedTargetRegressor
+            transformer = regressor.transformer_
+            if hasattr(transformer, "scale_"):
+                y_transform, y_mean, y_scale = "standard", transformer.mean_[0], transformer.scale_[0]
+            elif getattr(transformer, "func", None) is np.log1p:
+                y_transform = "log1p"
+            else:
+                raise ValueError(f"unsupported target transform {transformer!r}")
+            regressor = regressor.regressor_
+        if not hasattr(regressor, "coefs_"):
+            raise ValueError(f"{type(regressor).__name__} is not a fitted MLP")
+        layers = len(regressor.coefs_)
+        activations = [regressor.activation] * (layers - 1) + [regressor.out_activation_]
+        names = getattr(scaler, "feature_names_in_", None)
+        x_mean = scaler.mean_ if scaler.mean_ is not None else np.zeros(scaler.n_features_in_)
+        x_scale = scaler.scale_ if scaler.scale_ is not None else np.ones(scaler.n_features_in_)
+        return cls(regressor.coefs_, regressor.intercepts_, activations, x_mean, x_scale, y_transform,
+                   y_mean, y_scale, list(names) if names is not None else features)
+
+    @classmethod
+    def from_keras(cls, model, features=()):
+        """Extract a Sequential of Dense, BatchNormalization, Activation and Dropout layers."""
+        weights, biases, activations = [], [], []
+        for layer in model.layers:
+            kind = type(layer).__name__
+            if kind == "Dense":
+                kernel, bias = layer.get_weights()
+                weights.append(kernel)
+                biases.append(bias)
+                activations.append(_KERAS_ACTIVATIONS[layer.get_config()["activation"]])
+            elif kind == "BatchNormalization":
+                if not weights or activations[-1] != "identity":
+                    raise ValueError("BatchNormalization must follow a Dense layer without activation")
+                config = layer.get_config()
+                values = iter(layer.get_weights())
+                gamma = next(values) if config.get("scale", True) else 1.0
+                beta = next(values) if config.get("center", True) else 0.0
+                moving_mean, moving_variance = next(values), next(values)
+                factor = gamma / np.sqrt(moving_variance + layer.epsilon)
+                weights[-1] = weights[-1] * factor
+                biases[-1] = (biases[-1] - moving_mean) * factor + beta
+            elif kind == "Activation":
+                if not weights or activations[-1] != "identity":
+                    raise ValueError("Activation must follow a Dense layer without activation")
+                activations[-1] = _KERAS_ACTIVATIONS[layer.get_config()["activation"]]
+            elif kind not in ("Dropout", "InputLayer"):
+                raise ValueError(f"unsupported Keras layer {kind}")
+        n_inputs = weights[0].shape[0]
+        return cls(weights, biases, activations, np.zeros(n_inputs), np.ones(n_inputs), features=features)
+
+    def predict(self, rows):
+        """Same call shape as sklearn: rows of features -> 1-D array of pressures."""
+        h = (np.asarray(rows, dtype=np.float64) - self.x_mean) / self.x_scale
+        for w, b, function in zip(self.weights, self.biases, self._functions):
+            h = function(h @ w + b)
+        y = h[:, 0]
+        if self.y_transform == "standard":
+            return y * self.y_scale + self.y_mean
+        if self.y_transform == "log1p":
+            return np.expm1(y)
+        return y
+
+    def arrays(self, prefix):
+        arrays = {f"{prefix}.activations": np.asarray(self.activations),
+                  f"{prefix}.x_mean": self.x_mean, f"{prefix}.x_scale": self.x_scale,
+                  f"{prefix}.y_transform": np.asarray(TARGET_TRANSFORMS.index(self.y_transform)),
+                  f"{prefix}.y_mean": np.asarray(self.y_mean), f"{prefix}.y_scale": np.asarray(self.y_scale),
+                  f"{prefix}.features": np.asarray(self.features, dtype=str)}
+        for i, (w, b) in enumerate(zip(self.weights, self.biases)):
+            arrays[f"{prefix}.W{i}"] = w
+            arrays[f"{prefix}.b{i}"] = b
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, data, prefix):
+        layers = len(data[f"{prefix}.activations"])
+        return cls([data[f"{prefix}.W{i}"] for i in range(layers)], [data[f"{prefix}.b{i}"] for i in range(layers)],
+                   data[f"{prefix}.activations"].tolist(), data[f"{prefix}.x_mean"], data[f"{prefix}.x_scale"],
+                   TARGET_TRANSFORMS[int(data[f"{prefix}.y_transform"])], float(data[f"{prefix}.y_mean"]),
+                   float(data[f"{prefix}.y_scale"]), data[f"{prefix}.features"].tolist())
+
+
+class CompactCalibrator:
+    """Drop-in for getCalibrationData.PressureCalibrator at runtime: `models` plus the converter."""
+
+    def __init__(self, models):
+        self.models = dict(models)  # sensor -> CompactNetwork
+
+    @classmethod
+    def from_sklearn(cls, models):
+        return cls({sensor: CompactNetwork.from_sklearn(model, [sensor]) for sensor, model in models.items()})
+
+    @classmethod
+    def from_keras(cls, models):
+        return cls({sensor: CompactNetwork.from_keras(model, [sensor]) for sensor, model in models.items()})
+
+    def pressure_sensor_converter_main(self, pressure0, pressure1, pressure2, LPS_pressure=None,
+                                       LPS_temperature=None):
+        """Calibrated pressures; networks trained with the LPS inputs (scale_data.py) also get those."""
+        extra = [LPS_pressure, LPS_temperature]
+        converted = []
+        for sensor, value in zip(SENSORS, (pressure0, pressure1, pressure2)):
+            network = self.models[sensor]
+            row = [value] + extra[:len(network.x_mean) - 1]
+            converted.append(float(network.predict([row])[0]))
+        return tuple(converted)
+
+    def save(self, path):
+        arrays = {}
+        for sensor, network in sorted(self.models.items()):
+            arrays.update(network.arrays(sensor))
+        # Same layout as np.savez, but with fixed timestamps so equal exports give identical files
+        with zipfile.ZipFile(path, "w") as archive:
+            for name, array in arrays.items():
+                with archive.open(zipfile.ZipInfo(f"{name}.npy", date_time=(1980, 1, 1, 0, 0, 0)), "w",
+                                  force_zip64=True) as member:
+                    np.lib.format.write_array(member, np.asarray(array), allow_pickle=False)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files}
+        sensors = sorted({name.split(".", 1)[0] for name in arrays})
+        return cls({sensor: CompactNetwork.from_arrays(arrays, sensor) for sensor in sensors})
+
+
+def compact_path(model_path):
+    """<model>.compact.npz next to the joblib."""
+    return os.path.splitext(str(model_path))[0] + ".compact.npz"
+
+
+def load_calibrator(model_path):
+    """
+    Load a calibrator artifact as a CompactCalibrator.
+
+    An .npz is loaded as it is. For a joblib, the compact file next to it is used when it is at least as
+    new; otherwise the joblib is loaded (this needs scikit-learn), exported and the result saved for the
+    next start.
+    """
+    if str(model_path).endswith(".npz"):
+        return CompactCalibrator.load(model_path)
+    path = compact_path(model_path)
+    if os.path.exists(path) and (not os.path.exists(model_path)
+                                 or os.path.getmtime(path) >= os.path.getmtime(model_path)):
+        return CompactCalibrator.load(path)
+    import joblib
+    calibrator = CompactCalibrator.from_sklearn(joblib.load(model_path))
+    try:
+        calibrator.save(path)
+    except OSError as e:
+        print(f"Could not save compact calibrator {path}: {e}")
+    return calibrator
+
+
+def verify(models, calibrator, samples=2000, seed=0, keras=False, reading_range=(0.0, 4096.0)):
+    """
+    Compare the original and compact predictions on readings spread over each input scaler's range
+    (Keras models have no scaler: `reading_range` is used instead).
+
+    :return: (largest absolute difference in psi, original µs per conversion, compact µs per conversion)
+    """
+    rng = np.random.default_rng(seed)
+    worst, original_s, compact_s, n = 0.0, 0.0, 0.0, min(200, samples)
+    for sensor, model in models.items():
+        network = calibrator.models[sensor]
+        if keras:
+            low, high = np.full(len(network.x_mean), reading_range[0]), np.full(len(network.x_mean), reading_range[1])
+        else:
+            low, high = network.x_mean - 3 * network.x_scale, network.x_mean + 3 * network.x_scale
+        rows = rng.uniform(low, high, size=(samples, len(low)))
+        expected = np.asarray(model.predict(rows, verbose=0) if keras else model.predict(rows)).reshape(-1)
+        worst = max(worst, float(np.max(np.abs(expected - network.predict(rows)))))
+
+        start = time.perf_counter()
+        for row in rows[:n]:
+            model.predict(row[None, :], verbose=0) if keras else model.predict(row[None, :])
+        original_s += time.perf_counter() - start
+        start = time.perf_counter()
+        for row in rows[:n].tolist():
+            network.predict([row])
+        compact_s += time.perf_counter() - start
+    count = n * len(models)
+    return worst, original_s / count * 1e6, compact_s / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export trained calibrators to a NumPy-only .npz.")
+    parser.add_argument("model", nargs="?",
+                        help="joblib dict of sensor -> sklearn Pipeline (default: the registered pressure_calibrator)")
+    parser.add_argument("--keras", nargs=3, metavar="KERAS_FILE",
+                        help="Export modelv2's pressure0/1/2 .keras models instead")
+    parser.add_argument("--range", type=float, nargs=2, default=(0.0, 4096.0), metavar=("LOW", "HIGH"),
+                        help="Raw reading range the Keras models are compared on")
+    parser.add_argument("--out", help="Output .npz (default: <model>.compact.npz)")
+    parser.add_argument("--tolerance", type=float, default=1e-6, help="Largest allowed difference in psi")
+    parser.add_argument("--register", action="store_true",
+                        help="Register the export as the next pressure_calibrator version")
+    args = parser.parse_args()
+
+    if args.keras:
+        import tensorflow as tf
+        models = {sensor: tf.keras.models.load_model(path) for sensor, path in zip(SENSORS, args.keras)}
+        calibrator = CompactCalibrator.from_keras(models)
+        out = args.out or compact_path(args.keras[0])
+    else:
+        import joblib
+        import warnings
+        if args.model is None:
+            from model_registry import ModelRegistry
+            registry = ModelRegistry()
+            args.model = str(registry.root / registry.get("pressure_calibrator").path)
+        # The models were fitted on DataFrames; predicting on plain rows only warns about feature names
+        warnings.filterwarnings("ignore", message="X does not have valid feature names")
+        models = joblib.load(args.model)
+        calibrator = CompactCalibrator.from_sklearn(models)
+        out = args.out or compact_path(args.model)
+
+    worst, original_us, compact_us = verify(models, calibrator, keras=bool(args.keras), reading_range=args.range)
+    if worst > args.tolerance:
+        print(f"Compact predictions differ by up to {worst:.3g} psi, not saved")
+        return
+    calibrator.save(out)
+    print(f"{len(models)} sensors -> {out} ({os.path.getsize(out) / 1024:.1f} KB); max difference {worst:.2g} psi, "
+          f"{original_us:.0f} µs -> {compact_us:.1f} µs per conversion")
+    if args.register:
+        from model_registry import ModelRegistry
+        ModelRegistry().register("pressure_calibrator", out, loader="compact", features=list(SENSORS),
+                                 target="Measured_pressure")
+
+
+if __name__ == "__main__":
+    main()
@@ -139,6 +139,23 @@ class PressureCalibrator:
         dump(self.models, 'trained_pressure_calibrator_multioutput.joblib')
         print("Models saved")
 
+    def train_parallel(self, jobs=None, plots_dir=None, **model_options):
+        """
+        Same models as train(), but the sensors are fitted in parallel processes that stop on
+        convergence, the CSVs are read through a cache and the plots are written to plots_dir
+        instead of shown. See parallel_train.py.
+        """
+        from calibrating_pressure_transducers import parallel_train
+
+        if self.data_folder is None:
+            raise ValueError("data_folder is not specified.")
+        data, files = parallel_train.load_dataset(self.data_folder)
+        self.models, reports = parallel_train.train(data, variant="single", jobs=jobs, plots_dir=plots_dir,
+                                                    random_state=self.random_state, **model_options)
+        parallel_train.save_models(self.models, reports, files,
+                                   'trained_pressure_calibrator_multioutput.joblib', register=False)
+        return reports
+
     def _plot_evaluation(self, y_true, y_pred, sensor, dataset='Validation'):
         """
         Generate evaluation plots: scatter, residual plot, and histogram of residuals.
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Parallel training of the per-sensor pressure calibrators.
+
+getCalibrationData.PressureCalibrator.train (and the scale_data.py variant)
+fit pressure0, pressure1 and pressure2 one after another with an effectively
+unbounded lbfgs max_iter, re-read every CSV on each run and stop at every
+evaluation plot. This mode:
+
+- reads the rows it needs from the calibration store (--store), or
+  reads the calibration CSVs once into one frame and caches every file's
+  rows in .calibration_dataset.pkl next to the data, keyed by size and
+  modification time, so a retrain only parses new or changed files
+- fits the three sensors in separate worker processes
+- stops on convergence instead of an iteration count: lbfgs stops once the
+  gradient is below `tol` (bounded by `max_iter`), adam holds out
+  `validation_fraction` of the training rows and stops after
+  `n_iter_no_change` epochs without improving on them
+- writes the evaluation plots to PNG files with the Agg backend instead of
+  opening windows
+
+The artifact is the same {sensor: Pipeline} joblib dict as before, saved
+with its NumPy-only export (compact_calibrator.py) and registered as the
+next version of the variant's registry name. Only "single" is registered
+as "pressure_calibrator", the model the App loads; the LPS-compensated
+calibrators need the LPS readings as inputs and go to
+"pressure_calibrator_lps".
+
+Usage (from the repository root):
+    python -m calibrating_pressure_transducers.parallel_train <data folder> [--variant single|scaled|log]
+    python -m calibrating_pressure_transducers.parallel_train --store calibration_data/store [--days 20250420]
+"""
+import argparse
+import concurrent.futures
+import os
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+HERE = Path(__file__).parent
+CACHE_NAME = ".calibration_dataset.pkl"
+
+SENSORS = ("pressure0", "pressure1", "pressure2")
+REQUIRED_COLUMNS = ["Measured_pressure", "LPS_pressure", "LPS_temperature"]
+
+# The calibrator families of this folder:
+#   single - getCalibrationData.py: the sensor reading only, standardized target
+#   scaled - scale_data.py: sensor reading plus the LPS pressure and temperature
+#   log    - getCalibrationDatav2.py: deeper ReLU network on a log1p target
+VARIANTS = {
+    "single": {"features": (), "hidden": (10,), "activation": "tanh", "target": "standard",
+               "test_size": 0.05, "val_size": 0.05},
+    "scaled": {"features": ("LPS_pressure", "LPS_temperature"), "hidden": (10,), "activation": "tanh",
+               "target": None, "test_size": 0.30, "val_size": 0.0},
+    "log": {"features": (), "hidden": (50, 25), "activation": "relu", "target": "log1p",
+            "test_size": 0.20, "val_size": 0.20},
+}
+MODEL_PATHS = {
+    "single": HERE / "trained_pressure_calibrator_multioutput.joblib",
+    "scaled": HERE / "trained_pressure_calibrators.joblib",
+    "log": HERE / "trained_pressure_calibrator_log.joblib",
+}
+REGISTRY_NAMES = {
+    "single": "pressure_calibrator",
+    "scaled": "pressure_calibrator_lps",
+    "log": "pressure_calibrator_log",
+}
+
+
+def _read_file(path):
+    """One calibration CSV, without the rows missing a required value."""
+    df = pd.read_csv(path)
+    for col in REQUIRED_COLUMNS:
+        if col not in df.columns:
+            raise ValueError(f"Required column '{col}' not found in file {path}.")
+    if df[REQUIRED_COLUMNS].isnull().any().any():
+        print(f"Warning: Missing values in {REQUIRED_COLUMNS} in file {path}. Dropping those rows.")
+        df = df.dropna(subset=REQUIRED_COLUMNS).reset_index(drop=True)
+    return df
+
+
+def load_dataset(folder, use_cache=True):
+    """
+    All calibration CSVs of `folder` as one DataFrame, read through the per-file cache.
+
+    :return: (DataFrame, sorted list of the files it was read from)
+    """
+    folder = Path(folder)
+    files = sorted(folder.glob("*.csv"))
+    if not files:
+        raise ValueError(f"No CSV files were loaded from {folder}.")
+    cache_path = folder / CACHE_NAME
+    cache = {}
+    if use_cache and cache_path.exists():
+        try:
+            cache = pd.read_pickle(cache_path)
+        except Exception as e:
+            print(f"Ignoring unreadable dataset cache {cache_path}: {e}")
+
+    stamps = {str(path): (path.stat().st_size, path.stat().st_mtime_ns) for path in files}
+    stale = [path for path in files if cache.get(str(path), (None, None))[0] != stamps[str(path)]]
+    for path in stale:
+        cache[str(path)] = (stamps[str(path)], _read_file(path))
+    fresh = {str(path): cache[str(path)] for path in files}
+    if use_cache and (stale or len(fresh) != len(cache)):
+        pd.to_pickle(fresh, cache_path)
+    print(f"Loaded {len(files)} files ({len(stale)} parsed, {len(files) - len(stale)} from the cache)")
+    return pd.concat([fresh[str(path)][1] for path in files], ignore_index=True), files
+
+
+def load_store(store_dir, days=None):
+    """
+    The readings of SENSORS from the calibration store (see calibration_store.py).
+
+    :return: (DataFrame, the store's part files, for the registry's training-data hash)
+    """
+    from calibrating_pressure_transducers.calibration_store import CalibrationStore
+
+    store = CalibrationStore(store_dir)
+    return store.read_all(SENSORS, days=days), store.files()
+
+
+def sensor_arrays(data, sensor, variant="single"):
+    """(X, y) of one sensor: its feature columns and Measured_pressure, rows without a reading dropped."""
+    features = [sensor, *VARIANTS[variant]["features"]]
+    rows = data.dropna(subset=features)
+    return rows[features], rows["Measured_pressure"]
+
+
+def build_model(variant="single", solver="lbfgs", tol=1e-6, max_iter=20000, n_iter_no_change=50,
+                validation_fraction=0.1, random_state=42):
+    """The variant's scaler + MLP pipeline with a convergence-based stopping rule."""
+    from sklearn.compose import TransformedTargetRegressor
+    from sklearn.neural_network import MLPRegressor
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import FunctionTransformer, StandardScaler
+
+    options = VARIANTS[variant]
+    regressor = MLPRegressor(hidden_layer_sizes=options["hidden"], activation=options["activation"],
+                             solver=solver, tol=tol, max_iter=max_iter, random_state=random_state)
+    if solver == "lbfgs":
+        # scipy stops lbfgs once the projected gradient is below tol; max_fun bounds it like max_iter
+        regressor.set_params(max_fun=max_iter * 2)
+    else:
+        regressor.set_params(early_stopping=True, n_iter_no_change=n_iter_no_change,
+                             validation_fraction=validation_fraction)
+    if options["target"] == "standard":
+        regressor = TransformedTargetRegressor(regressor=regressor, transformer=StandardScaler())
+    elif options["target"] == "log1p":
+        regressor = TransformedTargetRegressor(
+            regressor=regressor, transformer=FunctionTransformer(func=np.log1p, inverse_func=np.expm1,
+                                                                 validate=True))
+    return Pipeline([("scaler", StandardScaler()), ("regressor", regressor)])
+
+
+def _metrics(y_true, y_pred):
+    y_true = np.asarray(y_true, float)
+    residuals = y_true - y_pred
+    ss_tot = float(((y_true - y_true.mean()) ** 2).sum())
+    return {"rmse": float(np.sqrt((residuals ** 2).mean())), "mae": float(np.abs(residuals).mean()),
+            "r2": 1.0 - float((residuals ** 2).sum()) / ss_tot if ss_tot > 0 else float("nan")}
+
+
+def plot_evaluation(y_true, y_pred, sensor, dataset, plots_dir):
+    """Predicted vs actual, residuals and the residual histogram in one PNG; returns its path."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    y_true = np.asarray(y_true, float)
+    residuals = y_true - y_pred
+    fig, axes = plt.subplots(1, 3, figsize=(15, 4.5))
+    axes[0].scatter(y_true, y_pred, alpha=0.6, label='Data points')
+    axes[0].plot([y_true.min(), y_true.max()], [y_true.min(), y_true.max()], 'r--', label='Ideal fit')
+    axes[0].set_title(f"{sensor} - {dataset}: Predicted vs Actual")
+    axes[0].set_xlabel("Measured Pressure")
+    axes[0].set_ylabel("Predicted Pressure")
+    axes[0].legend()
+    axes[1].scatter(y_true, residuals, alpha=0.6)
+    axes[1].axhline(y=0, color='r', linestyle='--')
+    axes[1].set_title(f"{sensor} - {dataset}: Residual Plot")
+    axes[1].set_xlabel("Measured Pressure")
+    axes[1].set_ylabel("Residual (Measured - Predicted)")
+    axes[2].hist(residuals, bins=30, alpha=0.7)
+    axes[2].set_title(f"{sensor} - {dataset}: Residual Histogram")
+    axes[2].set_xlabel("Residual (Measured - Predicted)")
+    axes[2].set_ylabel("Frequency")
+    fig.tight_layout()
+    path = Path(plots_dir) / f"{sensor}_{dataset}_evaluation.png"
+    fig.savefig(path, dpi=150)
+    plt.close(fig)
+    return path
+
+
+def fit_sensor(sensor, X, y, variant="single", plots_dir=None, random_state=42, **model_options):
+    """
+    Split, fit and evaluate one sensor's model; runs in a worker process.
+
+    :return: (sensor, fitted Pipeline, {split: metrics} plus the iteration count and fit time)
+    """
+    from sklearn.exceptions import ConvergenceWarning
+    from sklearn.model_selection import train_test_split
+
+    options = VARIANTS[variant]
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=options["test_size"],
+                                                        random_state=random_state)
+    splits = {}
+    if options["val_size"]:
+        X_train, X_val, y_train, y_val = train_test_split(X_train, y_train, test_size=options["val_size"],
+                                                          random_state=random_state)
+        splits["Validation"] = (X_val, y_val)
+    splits["Test"] = (X_test, y_test)
+
+    model = build_model(variant, random_state=random_state, **model_options)
+    start = time.perf_counter()
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always", ConvergenceWarning)
+        model.fit(X_train, y_train)
+    regressor = model.named_steps["regressor"]
+    mlp = getattr(regressor, "regressor_", regressor)
+    report = {"fit_s": time.perf_counter() - start, "iterations": int(mlp.n_iter_),
+              "converged": not any(issubclass(w.category, ConvergenceWarning) for w in caught)}
+    for name, (X_split, y_split) in splits.items():
+        predictions = model.predict(X_split)
+        report[name] = _metrics(y_split, predictions)
+        if plots_dir is not None:
+            plot_evaluation(y_split, predictions, sensor, name, plots_dir)
+    return sensor, model, report
+
+
+def train(data, variant="single", jobs=None, plots_dir=None, random_state=42, **model_options):
+    """
+    Fit every sensor in its own process.
+
+    :return: ({sensor: Pipeline}, {sensor: report}) in SENSORS order
+    """
+    if plots_dir is not None:
+        os.makedirs(plots_dir, exist_ok=True)
+    models, reports = {}, {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs or len(SENSORS)) as pool:
+        futures = []
+        for sensor in SENSORS:
+            X, y = sensor_arrays(data, sensor, variant)
+            print(f"Training model for {sensor} (Data shape: {X.shape})")
+            futures.append(pool.submit(fit_sensor, sensor, X, y, variant=variant, plots_dir=plots_dir,
+                                       random_state=random_state, **model_options))
+        for future in futures:
+            sensor, model, report = future.result()
+            models[sensor], reports[sensor] = model, report
+            scores = "  ".join(f"{name}: RMSE {m['rmse']:.3f}, R^2 {m['r2']:.3f}, MAE {m['mae']:.3f}"
+                               for name, m in report.items() if isinstance(m, dict))
+            print(f"{sensor}: {report['iterations']} iterations in {report['fit_s']:.1f} s"
+                  f"{'' if report['converged'] else ' (not converged)'}  {scores}")
+    return models, reports
+
+
+def save_models(models, reports, files, path, register=True, variant="single"):
+    """Dump the {sensor: Pipeline} dict and register it as the next version of the variant's REGISTRY_NAMES."""
+    from joblib import dump
+
+    from calibrating_pressure_transducers.compact_calibrator import CompactCalibrator, compact_path
+
+    dump(models, path)
+    CompactCalibrator.from_sklearn(models).save(compact_path(path))
+    print(f"Models saved to {path} (compact: {compact_path(path)})")
+    if register:
+        from model_registry import ModelRegistry
+        metrics = {f"{sensor}_test_rmse": report["Test"]["rmse"] for sensor, report in reports.items()}
+        features = [*SENSORS, *VARIANTS[variant]["features"]]
+        return ModelRegistry().register(REGISTRY_NAMES[variant], path, loader="compact", features=features,
+                                        target="Measured_pressure", training_files=files, metrics=metrics)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the pressure calibrators, one process per sensor.")
+    parser.add_argument("data", nargs="?", help="Folder with the calibration CSVs")
+    parser.add_argument("--store", help="Read the readings from this calibration store instead")
+    parser.add_argument("--days", nargs="*", help="With --store: the YYYYMMDD days to train on (default: all)")
+    parser.add_argument("--variant", choices=tuple(VARIANTS), default="single")
+    parser.add_argument("--solver", choices=("lbfgs", "adam"), default="lbfgs")
+    parser.add_argument("--tol", type=float, default=1e-6, help="Convergence tolerance")
+    parser.add_argument("--max-iter", type=int, default=20000, help="Upper bound if it does not converge")
+    parser.add_argument("--patience", type=int, default=50, help="adam: epochs without validation improvement")
+    parser.add_argument("--jobs", type=int, help="Worker processes (default: one per sensor)")
+    parser.add_argument("--plots", help="Folder for the evaluation PNGs (default: none)")
+    parser.add_argument("--out", help="Artifact path (default: the variant's joblib next to this script)")
+    parser.add_argument("--no-cache", action="store_true", help="Re-read every CSV")
+    parser.add_argument("--no-register", action="store_true", help="Do not add the artifact to the registry")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.store:
+        data, files = load_store(args.store, days=args.days)
+    elif args.data:
+        data, files = load_dataset(args.data, use_cache=not args.no_cache)
+    else:
+        parser.error("give a data folder or --store")
+    models, reports = train(data, variant=args.variant, jobs=args.jobs, plots_dir=args.plots, solver=args.solver,
+                            tol=args.tol, max_iter=args.max_iter, n_iter_no_change=args.patience)
+    save_models(models, reports, files, Path(args.out or MODEL_PATHS[args.variant]), register=not args.no_register,
+                variant=args.variant)
+    print(f"Done in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
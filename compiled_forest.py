@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Compiled inference for the random-forest timing models.
+
+inflation_time_model.pkl and deflation_time_model.pkl are 100-tree
+RandomForestRegressors. Calling sklearn's predict() for one row pays input
+validation and a joblib dispatch over all trees, several milliseconds on the
+Pi, on the control thread right before a valve opens. CompiledForest holds
+the same trees as flat arrays (feature, threshold, left/right child, leaf
+value) and walks them in a plain loop, which takes microseconds.
+
+Predictions are bit-identical to sklearn's: inputs are rounded to float32 as
+sklearn does before walking a tree, a node goes left when x <= threshold,
+and the leaf values are summed tree by tree in the same order before
+dividing by the number of trees.
+
+The compiled arrays are saved as <model>.forest.npz next to the pickle, so
+the app can load them without importing scikit-learn. Evaluating needs
+nothing beyond the standard library; NumPy is only used to read and write
+the .npz file.
+
+Usage (without arguments: the latest registered inflation_time and deflation_time):
+    python compiled_forest.py [inflation_time_model.pkl deflation_time_model.pkl]
+"""
+import os
+import struct
+import sys
+import time
+import zipfile
+
+LEAF = -1  # child index of a leaf, as in sklearn's tree_.children_left
+
+
+def _float32(value):
+    """Round a Python float to float32 precision, like sklearn's input conversion."""
+    return struct.unpack("f", struct.pack("f", value))[0]
+
+
+class CompiledForest:
+    def __init__(self, feature, threshold, left, right, value, roots, n_features):
+        # Python lists: indexing them is much faster than indexing NumPy arrays one by one
+        self.feature = list(feature)
+        self.threshold = list(threshold)
+        self.left = list(left)
+        self.right = list(right)
+        self.value = list(value)
+        self.roots = list(roots)
+        self.n_features = int(n_features)
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """Flatten the trees of a fitted single-output sklearn forest regressor."""
+        estimators = getattr(model, "estimators_", None)
+        if not estimators:
+            raise ValueError(f"{type(model).__name__} is not a fitted tree ensemble")
+        feature, threshold, left, right, value, roots = [], [], [], [], [], []
+        for estimator in estimators:
+            tree = estimator.tree_
+            if tree.n_outputs != 1:
+                raise ValueError("only single-output forests can be compiled")
+            offset = len(feature)
+            roots.append(offset)
+            feature.extend(tree.feature.tolist())
+            threshold.extend(tree.threshold.tolist())
+            left.extend(child + offset if child != LEAF else LEAF for child in tree.children_left.tolist())
+            right.extend(child + offset if child != LEAF else LEAF for child in tree.children_right.tolist())
+            value.extend(tree.value[:, 0, 0].tolist())
+        return cls(feature, threshold, left, right, value, roots, model.n_features_in_)
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def predict_one(self, row):
+        if len(row) != self.n_features:
+            raise ValueError(f"expected {self.n_features} features, got {len(row)}")
+        x = [_float32(float(v)) for v in row]
+        feature, threshold, left, right, value = self.feature, self.threshold, self.left, self.right, self.value
+        total = 0.0
+        for node in self.roots:
+            child = left[node]
+            while child != LEAF:
+                node = child if x[feature[node]] <= threshold[node] else right[node]
+                child = left[node]
+            total += value[node]
+        return total / len(self.roots)
+
+    def predict(self, rows):
+        """Same call shape as sklearn: a list of feature rows -> list of predictions."""
+        return [self.predict_one(row) for row in rows]
+
+    def save(self, path):
+        import numpy as np
+        arrays = {
+            "feature": np.asarray(self.feature, dtype=np.int32),
+            "threshold": np.asarray(self.threshold, dtype=np.float64),
+            "left": np.asarray(self.left, dtype=np.int32),
+            "right": np.asarray(self.right, dtype=np.int32),
+            "value": np.asarray(self.value, dtype=np.float64),
+            "roots": np.asarray(self.roots, dtype=np.int32),
+            "n_features": np.asarray(self.n_features),
+        }
+        # Same layout as np.savez, but with fixed timestamps so equal forests give identical files
+        with zipfile.ZipFile(path, "w") as archive:
+            for name, array in arrays.items():
+                with archive.open(zipfile.ZipInfo(f"{name}.npy", date_time=(1980, 1, 1, 0, 0, 0)), "w",
+                                  force_zip64=True) as member:
+                    np.lib.format.write_array(member, array, allow_pickle=False)
+
+    @classmethod
+    def load(cls, path):
+        import numpy as np
+        with np.load(path) as data:
+            return cls(data["feature"].tolist(), data["threshold"].tolist(), data["left"].tolist(),
+                       data["right"].tolist(), data["value"].tolist(), data["roots"].tolist(),
+                       int(data["n_features"]))
+
+
+def compiled_path(model_path):
+    """<model>.forest.npz next to the pickled model."""
+    return os.path.splitext(str(model_path))[0] + ".forest.npz"
+
+
+def load_forest(model_path):
+    """
+    Load a pickled forest model as a CompiledForest.
+
+    The compiled file next to the pickle is used when it is at least as new as the
+    pickle; otherwise the pickle is loaded (this needs scikit-learn), compiled and the
+    result saved for the next start.
+    """
+    path = compiled_path(model_path)
+    if os.path.exists(path) and (not os.path.exists(model_path)
+                                 or os.path.getmtime(path) >= os.path.getmtime(model_path)):
+        return CompiledForest.load(path)
+    import joblib
+    forest = CompiledForest.from_sklearn(joblib.load(model_path))
+    try:
+        forest.save(path)
+    except OSError as e:
+        print(f"Could not save compiled model {path}: {e}")
+    return forest
+
+
+def verify(model, forest, samples=2000, seed=0):
+    """
+    Compare sklearn and compiled predictions on random rows spanning the split thresholds.
+
+    :return: (number of rows that differ, sklearn µs per row, compiled µs per row)
+    """
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    low = np.full(forest.n_features, np.inf)
+    high = np.full(forest.n_features, -np.inf)
+    for f, t in zip(forest.feature, forest.threshold):
+        if f >= 0:
+            low[f], high[f] = min(low[f], t), max(high[f], t)
+    low, high = np.where(np.isfinite(low), low, 0.0), np.where(np.isfinite(high), high, 1.0)
+    span = np.maximum(high - low, 1e-6)
+    rows = rng.uniform(low - 0.1 * span, high + 0.1 * span, size=(samples, forest.n_features)).tolist()
+
+    expected = model.predict(np.asarray(rows))
+    actual = forest.predict(rows)
+    mismatches = sum(1 for e, a in zip(expected.tolist(), actual) if e != a)
+
+    n = min(200, samples)
+    start = time.perf_counter()
+    for row in rows[:n]:
+        model.predict([row])
+    sklearn_us = (time.perf_counter() - start) / n * 1e6
+    start = time.perf_counter()
+    for row in rows[:n]:
+        forest.predict_one(row)
+    compiled_us = (time.perf_counter() - start) / n * 1e6
+    return mismatches, sklearn_us, compiled_us
+
+
+def main():
+    import joblib
+    import warnings
+    # The models were fitted on DataFrames; predicting on plain rows only warns about feature names
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+    from model_registry import ModelRegistry
+    registry = ModelRegistry()
+    defaults = [registry.root / registry.get(name).path for name in ("inflation_time", "deflation_time")]
+    for model_path in sys.argv[1:] or defaults:
+        model = joblib.load(model_path)
+        forest = CompiledForest.from_sklearn(model)
+        mismatches, sklearn_us, compiled_us = verify(model, forest)
+        if mismatches:
+            print(f"{model_path}: {mismatches} predictions differ from sklearn, not saved")
+            continue
+        forest.save(compiled_path(model_path))
+        print(f"{model_path}: {forest.n_trees} trees, {len(forest.feature)} nodes -> {compiled_path(model_path)}; "
+              f"bit-identical, {sklearn_us:.0f} µs -> {compiled_us:.1f} µs per prediction")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,15 +5,15 @@ train_deflation_time_model.py
 Loads MeshAlyzer summary CSVs (with vent_duration),
 trains a RandomForestRegressor to predict deflation time,
 evaluates performance, plots results, and saves the model.
+
+The steps are shared with Q_value_calc.py in timing_model_training.py.
 """
 
-import pandas as pd
-import matplotlib.pyplot as plt
 from pathlib import Path
-from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.metrics import mean_squared_error, r2_score
-import joblib  # for saving/loading model
+
+import pandas as pd
+
+from timing_model_training import DATA_DIR, load_dataset, training_arrays, fit_model, plot_results, save_model
 
 
 def load_summary_data(folder_path: Path) -> pd.DataFrame:
@@ -25,97 +25,54 @@ def load_summary_data(folder_path: Path) -> pd.DataFrame:
       - supply_pressure: avg_in
       - deflation_time: vent_duration
     """
-    rows = []
-    for file in folder_path.glob("*summary_*.csv"):
-        df = pd.read_csv(file)
-        # Skip files missing the required column
-        if "vent_duration" not in df.columns:
-            continue
-
-        for _, row in df.iterrows():
-            rows.append({
-                "initial_pressure": row["avg_post"],
-                "pre_inflation_pressure": row["avg_pre"],
-                "supply_pressure": row["avg_in"],
-                "deflation_time": row["vent_duration"],
-            })
-
-    data = pd.DataFrame(rows)
-    return data
+    data, _ = load_dataset(folder_path)
+    X, y = training_arrays(data, "deflation")
+    return X.assign(deflation_time=y)
 
 
 def train_and_evaluate(data: pd.DataFrame,
                        test_size: float = 0.2,
                        random_state: int = 42):
     """
-    Splits data, trains RandomForestRegressor on deflation_time,
-    and returns the model plus test split and predictions.
+    Splits data, cross-validates and trains RandomForestRegressor on deflation_time,
+    and returns the TrainingResult (model, test split, predictions and metrics).
     """
-    # Features & target
     X = data[["initial_pressure", "pre_inflation_pressure", "supply_pressure"]]
     y = data["deflation_time"]
+    result = fit_model(X, y, test_size=test_size, seed=random_state)
+    m = result.metrics
+    print(f"Deflation Time Model\n• Mean Squared Error: {m['mse']:.5f}\n• R² Score: {m['r2']:.5f}\n"
+          f"• CV MSE: {m['cv_mse']:.5f}\n• Settings: {result.params}\n")
+    return result
 
-    # Train/Test split
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=test_size, random_state=random_state
-    )
 
-    # Train the model
-    model = RandomForestRegressor(n_estimators=100, random_state=random_state)
-    model.fit(X_train, y_train)
-
-    # Predict on test set
-    preds = model.predict(X_test)
-
-    # Metrics
-    mse = mean_squared_error(y_test, preds)
-    r2 = r2_score(y_test, preds)
-    print(f"Deflation Time Model\n• Mean Squared Error: {mse:.5f}\n• R² Score: {r2:.5f}\n")
-
-    return model, X_test, y_test, preds
-
-
-def plot_deflation_results(y_test, preds):
+def plot_deflation_results(result):
     """
     Scatterplot: Predicted vs. Actual deflation times.
     """
-    plt.figure(figsize=(8, 6))
-    plt.scatter(y_test, preds, alpha=0.6)
-    lims = [min(y_test.min(), preds.min()), max(y_test.max(), preds.max())]
-    plt.plot(lims, lims, '--', color='red', label='Ideal (y = x)')
-    plt.xlabel("Actual Deflation Time [s]")
-    plt.ylabel("Predicted Deflation Time [s]")
-    plt.title("Predicted vs Actual Deflation Time")
-    plt.grid(True)
-    plt.legend()
-    plt.tight_layout()
-    plt.show()
+    plot_results("deflation", result)
 
 
 def main():
-    # 1. Folder containing your summary CSVs
-    folder = Path("/Users/colehanan/Desktop/WashuClasses/MeshAlyzer/getting_Q")
-
-    # 2. Load data
+    # 1. Load data
     print("Loading summary data (vent_duration)...")
-    df = load_summary_data(folder)
-    if df.empty:
-        print("No summary CSVs with 'vent_duration' found in:", folder)
+    data, files = load_dataset(DATA_DIR)
+    X, y = training_arrays(data, "deflation")
+    if X.empty:
+        print("No summary CSVs with 'vent_duration' found in:", DATA_DIR)
         return
 
-    # 3. Train model & evaluate
+    # 2. Train model & evaluate
     print("Training deflation-time model...")
-    model, X_test, y_test, preds = train_and_evaluate(df)
+    result = train_and_evaluate(X.assign(deflation_time=y))
 
-    # 4. Plot results
+    # 3. Plot results
     print("Plotting model performance...")
-    plot_deflation_results(y_test, preds)
+    plot_deflation_results(result)
 
-    # 5. Save model
-    out_path = "deflation_time_model.pkl"
-    joblib.dump(model, out_path)
-    print(f"Model saved to {out_path}")
+    # 4. Save the model, its compiled forest and the registry entry
+    save_model("deflation", result, files)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -17,6 +17,9 @@ except ImportError:
     import random
 
 
+# Records a live 30 s session through a Tk window. To turn a finished trial from
+# ./data/<trial>/ into video without a display, use render_trial_video.py, which
+# draws the same graph with the Agg backend in a process pool.
 class GraphRecorderApp(ctk.CTk):
     def __init__(self):
         super().__init__()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Streaming graph-to-video recorder for the MeshAlyzer pressure graph.
+
+Frames are rasterized off-screen with the Agg backend while the recording is
+running and piped straight into an ffmpeg subprocess at a fixed frame rate.
+Only the samples inside the visible time window are kept, so memory stays
+constant no matter how long the recording runs, and the MP4 is finalized as
+soon as ffmpeg has flushed the last few frames after stop().
+"""
+import collections
+import shutil
+import subprocess
+import threading
+import time
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+
+class PressureFrameRenderer:
+    """
+    Draws the input/balloon pressure graph onto an off-screen Agg canvas.
+
+    The look mirrors the live graphs in graph.py and CalibratePage: dark
+    background, white labels and one line per pressure channel. Line artists
+    are created once and only their data is updated per frame.
+    """
+
+    def __init__(self, width=6, height=4, dpi=100, dark=True, y_range=None,
+                 title="Calibrated Pressure Sensor Values"):
+        self.y_range = y_range
+        self.fig = Figure(figsize=(width, height), dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot(111)
+
+        if dark:
+            app_bg_color = "#1F1F1F"
+            text_color = "white"
+        else:
+            app_bg_color = "#FFFFFF"
+            text_color = "black"
+        self.fig.patch.set_facecolor(app_bg_color)
+        self.ax.set_facecolor(app_bg_color)
+        self.ax.set_title(title, color=text_color)
+        self.ax.set_xlabel("Time (s)", color=text_color)
+        self.ax.set_ylabel("PSI", color=text_color)
+        self.ax.tick_params(axis='x', colors=text_color, labelcolor=text_color)
+        self.ax.tick_params(axis='y', colors=text_color, labelcolor=text_color)
+        for spine in self.ax.spines.values():
+            spine.set_color(text_color)
+
+        self.line_input, = self.ax.plot([], [], label="Input Pressure", zorder=3)
+        self.line_pressure1, = self.ax.plot([], [], label="Pressure 1", zorder=3)
+        self.line_pressure2, = self.ax.plot([], [], label="Pressure 2", zorder=3)
+        self.line_target = self.ax.axhline(y=0, label="Target Pressure", linestyle="--",
+                                           linewidth=1, color=text_color, visible=False)
+        legend = self.ax.legend(loc="upper left")
+        legend.get_frame().set_facecolor(app_bg_color)
+        legend.get_frame().set_edgecolor(app_bg_color)
+        for text in legend.get_texts():
+            text.set_color(text_color)
+
+        self.canvas.draw()
+
+    def frame_size(self):
+        """Return the (width, height) in pixels of every rendered frame."""
+        return self.canvas.get_width_height()
+
+    def render(self, times, input_pressures, pressure1s, pressure2s, target_pressure=None, window=None):
+        """
+        Draw one frame and return it as raw RGBA bytes.
+
+        :param times: Sample times in seconds.
+        :param window: If given, the x-axis shows only the last `window` seconds.
+        """
+        self.line_input.set_data(times, input_pressures)
+        self.line_pressure1.set_data(times, pressure1s)
+        self.line_pressure2.set_data(times, pressure2s)
+
+        if isinstance(target_pressure, (int, float)):
+            self.line_target.set_ydata([target_pressure, target_pressure])
+            self.line_target.set_visible(True)
+        else:
+            self.line_target.set_visible(False)
+
+        if len(times) >= 2:
+            upper = times[-1]
+            lower = upper - window if window is not None else times[0]
+            self.ax.set_xlim(lower, max(upper, lower + 1e-3))
+            if self.y_range is not None:
+                self.ax.set_ylim(self.y_range[0], self.y_range[1])
+            else:
+                self.ax.relim()
+                self.ax.autoscale_view(scalex=False, scaley=True)
+
+        self.canvas.draw()
+        return bytes(self.canvas.buffer_rgba())
+
+
+class FFmpegWriter:
+    """
+    Thin wrapper around an ffmpeg subprocess that encodes raw RGBA frames
+    written to its stdin into an H.264 MP4.
+    """
+
+    def __init__(self, file_name, width, height, fps=30, ffmpeg_path=None, crf=23):
+        ffmpeg_path = ffmpeg_path or shutil.which("ffmpeg")
+        if ffmpeg_path is None:
+            raise RuntimeError("ffmpeg was not found on PATH; cannot record video.")
+
+        self.file_name = file_name
+        command = [
+            ffmpeg_path, "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "rgba",
+            "-s", f"{width}x{height}", "-r", str(fps),
+            "-i", "-",
+            "-an", "-c:v", "libx264", "-preset", "veryfast", "-crf", str(crf),
+            # yuv420p needs even dimensions; pad by one pixel if necessary
+            "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+            "-pix_fmt", "yuv420p", "-movflags", "+faststart",
+            file_name,
+        ]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def write(self, frame):
+        self.process.stdin.write(frame)
+
+    def close(self):
+        """
+        Close ffmpeg's stdin and wait for it to finish the file.
+
+        :return: ffmpeg's return code (0 on success).
+        """
+        _, stderr = self.process.communicate()
+        if self.process.returncode != 0:
+            print(f"[FFmpegWriter] ffmpeg exited with {self.process.returncode}: "
+                  f"{stderr.decode('utf-8', 'replace').strip()}")
+        return self.process.returncode
+
+
+class StreamingGraphRecorder:
+    """
+    Records the live pressure graph to an MP4 while samples are arriving.
+
+    Samples are pushed with add_sample() from the UI thread. A background
+    thread renders one frame per tick at a fixed fps and hands it to ffmpeg,
+    repeating the last frame if rendering ever falls behind so the video
+    timeline stays in step with wall-clock time.
+    """
+
+    def __init__(self, file_name="graph_recording.mp4", fps=30, window=30, y_range=None, dark=True):
+        self.file_name = file_name
+        self.fps = fps
+        self.window = window
+        self.y_range = y_range
+        self.dark = dark
+
+        self._samples = collections.deque()
+        self._target_pressure = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._writer = None
+        self.frames_written = 0
+
+    def start(self):
+        renderer = PressureFrameRenderer(dark=self.dark, y_range=self.y_range)
+        width, height = renderer.frame_size()
+        self._writer = FFmpegWriter(self.file_name, width, height, fps=self.fps)
+        self._thread = threading.Thread(target=self._run, args=(renderer,), daemon=True)
+        self._thread.start()
+
+    def add_sample(self, t, input_pressure, pressure1, pressure2, target_pressure=None):
+        with self._lock:
+            self._samples.append((t, input_pressure, pressure1, pressure2))
+            self._target_pressure = target_pressure
+            # Only the visible window is ever drawn, so older samples can go.
+            while self._samples and self._samples[0][0] < t - self.window:
+                self._samples.popleft()
+
+    def stop(self):
+        """
+        Stop rendering and wait for ffmpeg to finalize the file.
+
+        :return: True if the MP4 was written successfully.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._writer is None:
+            return False
+        return self._writer.close() == 0
+
+    def _run(self, renderer):
+        frame_period = 1.0 / self.fps
+        start = time.monotonic()
+        while not self._stop_event.is_set():
+            with self._lock:
+                samples = list(self._samples)
+                target_pressure = self._target_pressure
+            if samples:
+                times, input_pressures, pressure1s, pressure2s = zip(*samples)
+            else:
+                times = input_pressures = pressure1s = pressure2s = ()
+            frame = renderer.render(times, input_pressures, pressure1s, pressure2s,
+                                    target_pressure=target_pressure, window=self.window)
+
+            # Number of frames the video should contain by now at a fixed fps.
+            due = int((time.monotonic() - start) / frame_period) + 1
+            try:
+                for _ in range(max(1, due - self.frames_written)):
+                    self._writer.write(frame)
+                    self.frames_written += 1
+            except (BrokenPipeError, OSError) as e:
+                print(f"[StreamingGraphRecorder] ffmpeg pipe closed: {e}")
+                return
+
+            next_frame = start + self.frames_written * frame_period
+            self._stop_event.wait(max(0.0, next_frame - time.monotonic()))
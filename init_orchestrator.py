@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Parallel start-up of the MeshAlyzer hardware and models.
+
+Each subsystem (valves, LPS22, calibration models, clamp motor, timing
+models, ...) is registered with an init function and a timeout and brought
+up on its own daemon thread, so a slow or missing device only delays the
+features that need it. Readiness changes are reported to listeners, which the
+App uses to colour the sidebar status boxes and to gate protocol start on the
+subsystems a protocol actually uses.
+"""
+import threading
+import time
+
+PENDING = "pending"
+STARTING = "starting"
+READY = "ready"
+FAILED = "failed"
+TIMED_OUT = "timeout"
+
+# Colours used for the status boxes on the home page
+STATE_COLORS = {
+    PENDING: "gray",
+    STARTING: "orange",
+    READY: "green",
+    FAILED: "red",
+    TIMED_OUT: "red",
+}
+
+
+class Subsystem:
+    def __init__(self, name, init_func, timeout):
+        self.name = name
+        self.init_func = init_func
+        self.timeout = timeout
+        self.state = PENDING
+        self.error = None
+        self.elapsed = None
+        self.done = threading.Event()  # set once the init function has returned or raised
+
+
+class InitOrchestrator:
+    """
+    Runs subsystem init functions concurrently and tracks their readiness.
+
+    A subsystem that exceeds its timeout is reported as TIMED_OUT, but its
+    thread is left running (device opens cannot be interrupted); if it
+    finishes later it still becomes READY.
+    """
+
+    def __init__(self, profiler=None):
+        self.profiler = profiler
+        self.subsystems = {}
+        self._listeners = []
+        self._on_all_settled = []
+        self._lock = threading.Lock()
+        self._settled = threading.Event()
+
+    def add(self, name, init_func, timeout=10.0):
+        self.subsystems[name] = Subsystem(name, init_func, timeout)
+
+    def add_listener(self, callback):
+        """callback(name, state, error) is called from the init threads on every state change."""
+        self._listeners.append(callback)
+
+    def on_all_settled(self, callback):
+        """callback() is called once every subsystem is READY, FAILED or TIMED_OUT."""
+        self._on_all_settled.append(callback)
+
+    def start(self):
+        for subsystem in self.subsystems.values():
+            threading.Thread(target=self._run, args=(subsystem,),
+                             name=f"init-{subsystem.name}", daemon=True).start()
+        if not self.subsystems:
+            self._check_settled()
+
+    def _set_state(self, subsystem, state, error=None):
+        with self._lock:
+            subsystem.state = state
+            subsystem.error = error
+        for callback in self._listeners:
+            try:
+                callback(subsystem.name, state, error)
+            except Exception as e:
+                print(f"[init] listener failed for {subsystem.name}: {e}")
+
+    def _run(self, subsystem):
+        self._set_state(subsystem, STARTING)
+        timer = threading.Timer(subsystem.timeout, self._timed_out, args=(subsystem,))
+        timer.daemon = True
+        timer.start()
+        t0 = time.perf_counter()
+        try:
+            subsystem.init_func()
+        except Exception as e:
+            timer.cancel()
+            subsystem.elapsed = time.perf_counter() - t0
+            print(f"[init] {subsystem.name} failed after {subsystem.elapsed:.2f} s: {e}")
+            self._set_state(subsystem, FAILED, e)
+        else:
+            timer.cancel()
+            subsystem.elapsed = time.perf_counter() - t0
+            if subsystem.state == TIMED_OUT:
+                print(f"[init] {subsystem.name} became ready late, after {subsystem.elapsed:.2f} s")
+            self._set_state(subsystem, READY)
+        if self.profiler is not None:
+            self.profiler.record_phase(f"init: {subsystem.name}", subsystem.elapsed)
+        subsystem.done.set()
+        self._check_settled()
+
+    def _timed_out(self, subsystem):
+        if subsystem.done.is_set():
+            return
+        print(f"[init] {subsystem.name} did not start within {subsystem.timeout:g} s")
+        self._set_state(subsystem, TIMED_OUT)
+        self._check_settled()
+
+    def _check_settled(self):
+        with self._lock:
+            if self._settled.is_set():
+                return
+            if any(s.state in (PENDING, STARTING) for s in self.subsystems.values()):
+                return
+            self._settled.set()
+        for callback in self._on_all_settled:
+            callback()
+
+    def state(self, name):
+        return self.subsystems[name].state
+
+    def is_ready(self, name):
+        return self.subsystems[name].state == READY
+
+    def all_settled(self):
+        return self._settled.is_set()
+
+    def unavailable(self, names):
+        """Return the names among `names` that failed or timed out."""
+        return [name for name in names if self.subsystems[name].state in (FAILED, TIMED_OUT)]
+
+    def wait_for(self, names, timeout=None):
+        """
+        Block until every subsystem in `names` has finished initializing.
+
+        :return: List of the names that are not READY (empty if all are ready).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for name in names:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            self.subsystems[name].done.wait(remaining)
+        return [name for name in names if not self.is_ready(name)]
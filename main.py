@@ -1,45 +1,26 @@
+from startup_profiler import StartupProfiler, LazyModule, setting_enabled
+
+# With profile_startup on, time every import from here on; the report is printed once the home
+# screen is usable. The App starts from default_settings.txt (see load_default_settings).
+PROFILER = StartupProfiler(enabled=setting_enabled("default_settings.txt", "profile_startup"))
+if PROFILER.enabled:
+    PROFILER.install_import_timer()
+
 import shutil
 import customtkinter as ctk
-import multiprocessing.shared_memory as sm
-from tkinter import Canvas, Frame, Scrollbar, filedialog
-from PIL import Image, ImageTk, ImageOps
-import webbrowser
+from tkinter import Canvas, StringVar, messagebox
+from PIL import Image, ImageTk
 import subprocess
-import mss
-import matplotlib.animation as animation
-from pathlib import Path
-import joblib
-
-
-
-from tkinter import StringVar
-import cv2
 import queue
 import time
-import struct
+import bisect
 import csv
-from collections import defaultdict
-from threading import Thread
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import pandas as pd
-import seaborn as sns
-from tkinter import ttk
-import matplotlib.ticker as ticker
 import datetime
-import tkinter as tk
-import subprocess
-import queue
-import traceback
 import threading
-import sys
 import os
 import filecmp
-import threading
-import cairosvg
-import xml.etree.ElementTree as ET
-from tkinter import messagebox
-from PIL import Image, ImageTk
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
 
 # lps22
@@ -52,22 +33,50 @@ warnings.filterwarnings(
     message="X does not have valid feature names, but StandardScaler was fitted with feature names",
     category=UserWarning
 )
-import numpy as np
 # Sensor import
 from PressureSensorReader import PressureReceiver
 from ValveController import ValveController
 from clamp_motor import MotorController
 from calibrate_page import CalibratePage
 from valve_control_dropdown import ValveControlDropdown
-from joblib import load
-from calibrating_pressure_transducers.getCalibrationData import PressureCalibrator
 from settings_page import SettingsPage
+from graph_recorder import StreamingGraphRecorder
+from init_orchestrator import InitOrchestrator, STATE_COLORS
+from protocol_compiler import ProtocolError, compile_protocol_file
+from protocol_executor import ProtocolExecutor
+from pressure_targeting import PressureTargetController
+from step_metrics import StepMetrics
+from trial_data_writer import TrialDataWriter
+from rolling_stats import RollingPressureStats
+from variable_store import VariableStore
+from online_timing_learner import OnlineTimingLearner
+from model_registry import ModelRegistry
+from peak_controller import PeakController, load_pneumatic_plant
+
+# Heavy dependencies that are not needed for the first paint are imported on first use,
+# or ahead of time by the init threads (see App.start_subsystems). The calibrators are
+# loaded from their NumPy-only compact export; only a registry entry without one needs
+# the scikit-learn calibrator module, which is imported inside App.load_calibration_models.
+# The model files are loaded by the ModelRegistry's prefetch thread.
+cv2 = LazyModule("cv2", PROFILER)
 
-import os
 os.environ["DISPLAY"] = ":0"
 
 
 class ProtocolViewer(ctk.CTkFrame):
+    """
+    Step list of the selected protocol.
+
+    Only the rows that fit in the viewer have widgets. They are created once and
+    re-bound to other steps when the list scrolls, so a protocol with thousands of
+    lines loads as fast as a short one. The highlighting loop only recolors the
+    rows whose state changed and scrolls the running step into view.
+    """
+
+    ROW_HEIGHT = 48  # pixels per step row, including padding
+    ACTIVE_COLOR = "lightblue"  # Simulate higher opacity
+    INACTIVE_COLOR = "lightgray"  # Simulate lower opacity
+
     def __init__(self, master, protocol_folder, protocol_var, app, *args, **kwargs):
         super().__init__(master, *args, **kwargs)
 
@@ -75,56 +84,81 @@ class ProtocolViewer(ctk.CTkFrame):
         self.protocol_folder = protocol_folder
         self.protocol_var = protocol_var
 
-        self.protocol_steps = []  # List of parsed protocol steps
-        self.step_widgets = []  # References to step widgets for updating
-        # opacity
-
-        self.scrollable_frame = ctk.CTkScrollableFrame(self, width=400, height=800)
-        self.scrollable_frame.pack(fill="both", expand=True)
-
-        # Dynamically update current step opacity
-        self.update_current_step()
+        self.protocol_steps = []  # Compiled protocol steps in display order, Repeat bodies included
+        self.step_depths = []  # Repeat nesting depth of every displayed step
+        self.step_rows = {}  # step index -> position in protocol_steps
+        self.checked = []  # Checkbox state of every step (the widgets are recycled, so it lives here)
+        self.step_widgets = []  # Recycled row widgets: (frame, number label, name label, checkbox var)
+        self.bound_rows = []  # Position in protocol_steps each recycled row currently shows
+        self.first_row = 0  # Position of the top visible step
+        self.visible_rows = 1
+        self.current_row = None  # Position of the highlighted step
+
+        self.list_frame = ctk.CTkFrame(self, width=400, height=800, fg_color="transparent")
+        self.list_frame.pack(side="left", fill="both", expand=True)
+        self.list_frame.grid_propagate(False)
+        self.list_frame.grid_columnconfigure(0, weight=1)
+        self.scrollbar = ctk.CTkScrollbar(self, command=self.on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+        self.error_label = ctk.CTkLabel(self.list_frame, text="", text_color="red",
+                                        anchor="w", justify="left", wraplength=380)
+
+        self.list_frame.bind("<Configure>", self.on_resize)
+        self.bind_scroll(self.list_frame)
+
+        # Current step highlighting runs only while the viewer is visible (see resume/pause)
+        self._update_after_id = None
 
     def load_protocol(self, protocol_var):
-        # Clear existing steps
-        for widget in self.scrollable_frame.winfo_children():
-            widget.destroy()
-        self.step_widgets = []
         self.protocol_steps = []
+        self.step_depths = []
+        self.step_rows = {}
+        self.checked = []
+        self.first_row = 0
+        self.current_row = None
+        self.error_label.grid_remove()
         print("Loading protocolh:", protocol_var)
         # Get the protocol path
         protocol_path = os.path.join(self.protocol_folder, protocol_var)
 
-        # Read and parse the protocol
-        if os.path.exists(protocol_path):
-            with open(protocol_path, "r") as f:
-                lines = f.readlines()
-
-            for i, line in enumerate(lines):
-                step_num = i + 1
-                step_details = self.parse_step(line.strip())
-                self.protocol_steps.append((step_num, *step_details))
-                self.create_step_widget(step_num, *step_details)
-
-    def parse_step(self, line):
-        """Parse a protocol step from the line."""
-        if ":" in line:
-            step_name, details = line.split(":", 1)
-        else:
-            step_name, details = line, ""
-        return step_name, details.strip()
-
-    def create_step_widget(self, step_num, step_name, details):
-        """Create a rounded box for a protocol step."""
-        frame = ctk.CTkFrame(self.scrollable_frame, corner_radius=10, fg_color="transparent")
-        frame.pack(fill="x", padx=5, pady=5)
+        # Compile the protocol; a malformed file is shown as an error instead of steps
+        if os.path.isfile(protocol_path):
+            try:
+                protocol = compile_protocol_file(protocol_path)
+            except ProtocolError as e:
+                self.render()
+                self.show_error(f"Invalid protocol: {e}")
+                return
+
+            # Steps inside Repeat blocks are indented under their block
+            for step, depth in protocol.walk():
+                self.step_rows[step.index] = len(self.protocol_steps)
+                self.protocol_steps.append(step)
+                self.step_depths.append(depth)
+                self.checked.append(True)
+        self.render()
+
+    def show_error(self, message):
+        self.error_label.configure(text=message)
+        self.error_label.grid(row=0, column=0, sticky="ew", padx=5, pady=5)
+
+    def bind_scroll(self, widget):
+        widget.bind("<MouseWheel>", self.on_mousewheel)
+        widget.bind("<Button-4>", lambda event: self.scroll_to(self.first_row - 1))
+        widget.bind("<Button-5>", lambda event: self.scroll_to(self.first_row + 1))
+
+    def create_step_widget(self):
+        """Create a rounded box for a protocol step; its contents are filled in by render()."""
+        slot = len(self.step_widgets)
+        frame = ctk.CTkFrame(self.list_frame, corner_radius=10, fg_color=self.INACTIVE_COLOR)
+        frame.grid_columnconfigure(1, weight=1)
 
         # Step number
-        step_num_label = ctk.CTkLabel(frame, text=f"Step {step_num}", width=10, text_color=("black", "white"))
+        step_num_label = ctk.CTkLabel(frame, text="", width=10, text_color=("black", "white"))
         step_num_label.grid(row=0, column=0, padx=5, pady=5)
 
         # Step name and details
-        step_name_label = ctk.CTkLabel(frame, text=f"{step_name}: {details}", anchor="w", text_color=("black", "white"))
+        step_name_label = ctk.CTkLabel(frame, text="", anchor="w", text_color=("black", "white"))
         step_name_label.grid(row=0, column=1, sticky="w", padx=5, pady=5)
 
         # Checkbox
@@ -132,29 +166,129 @@ class ProtocolViewer(ctk.CTkFrame):
         checkbox = ctk.CTkCheckBox(
             frame,
             text="",
-            variable=checkbox_var
+            variable=checkbox_var,
+            command=lambda: self.on_check(slot)
         )
         # TODO: Add a command for there to be an effect with the check box
         checkbox.grid(row=0, column=2, padx=5, pady=5)
 
-        self.step_widgets.append((frame, step_num))
+        for widget in (frame, step_num_label, step_name_label, checkbox):
+            self.bind_scroll(widget)
+        self.step_widgets.append((frame, step_num_label, step_name_label, checkbox_var))
+        self.bound_rows.append(None)
+
+    def on_check(self, slot):
+        row = self.bound_rows[slot]
+        if row is not None:
+            self.checked[row] = self.step_widgets[slot][3].get()
+
+    def on_resize(self, event):
+        visible_rows = max(1, event.height // self.ROW_HEIGHT)
+        if visible_rows == self.visible_rows and len(self.step_widgets) >= visible_rows:
+            return
+        self.visible_rows = visible_rows
+        while len(self.step_widgets) < visible_rows:
+            self.create_step_widget()
+        self.scroll_to(self.first_row, force=True)
+
+    def on_mousewheel(self, event):
+        self.scroll_to(self.first_row - (1 if event.delta > 0 else -1))
+
+    def on_scrollbar(self, *args):
+        if args[0] == "moveto":
+            self.scroll_to(int(round(float(args[1]) * len(self.protocol_steps))))
+        elif args[0] == "scroll":
+            amount = int(args[1])
+            if args[2] == "pages":
+                amount *= self.visible_rows
+            self.scroll_to(self.first_row + amount)
+
+    def scroll_to(self, first_row, force=False):
+        max_first = max(0, len(self.protocol_steps) - self.visible_rows)
+        first_row = min(max(0, first_row), max_first)
+        if first_row != self.first_row or force:
+            self.first_row = first_row
+            self.render()
+
+    def render(self):
+        """Bind the recycled row widgets to the steps from first_row on."""
+        total = len(self.protocol_steps)
+        for slot, (frame, step_num_label, step_name_label, checkbox_var) in enumerate(self.step_widgets):
+            row = self.first_row + slot
+            if slot >= self.visible_rows or row >= total:
+                self.bound_rows[slot] = None
+                frame.grid_remove()
+                continue
+            step = self.protocol_steps[row]
+            if self.bound_rows[slot] != row:
+                self.bound_rows[slot] = row
+                step_num_label.configure(text=f"Step {step.index}")
+                step_name_label.configure(text=f"{step.keyword}: {step.details()}")
+                checkbox_var.set(self.checked[row])
+            frame.grid(row=slot, column=0, sticky="ew", padx=(5 + 20 * self.step_depths[row], 5), pady=5)
+            self.paint(slot)
+        if total:
+            self.scrollbar.set(self.first_row / total, min(1.0, (self.first_row + self.visible_rows) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def paint(self, slot):
+        frame = self.step_widgets[slot][0]
+        color = self.ACTIVE_COLOR if self.bound_rows[slot] == self.current_row else self.INACTIVE_COLOR
+        if frame.cget("fg_color") != color:
+            frame.configure(fg_color=color)
 
     def update_current_step(self):
-        """Update opacity dynamically based on the current step."""
+        """Highlight the current step, touching only the rows whose state changed."""
         try:
             current_step = self.app.protocol_step
             current_step = int(current_step) if current_step else None
         except (ValueError, TypeError):
             current_step = None
 
-        # Update frame background color to simulate opacity
-        for frame, step_num in self.step_widgets:
-            if current_step == step_num:
-                frame.configure(fg_color="lightblue")  # Simulate higher opacity
+        row = self.step_rows.get(current_step)
+        if row != self.current_row:
+            previous_row = self.current_row
+            self.current_row = row
+            if row is not None and not self.first_row <= row < self.first_row + self.visible_rows:
+                # Keep a few of the previous steps above the active one
+                self.scroll_to(row - self.visible_rows // 3)
             else:
-                frame.configure(fg_color="lightgray")  # Simulate lower opacity
+                for changed_row in (previous_row, row):
+                    if changed_row is not None and self.first_row <= changed_row < self.first_row + self.visible_rows:
+                        self.paint(changed_row - self.first_row)
+
+        self._update_after_id = self.after(500, self.update_current_step)  # Check every 500ms
+
+    def resume(self):
+        """Start (or restart) the current-step highlighting loop."""
+        if self._update_after_id is None:
+            self.update_current_step()
 
-        self.after(500, self.update_current_step)  # Check every 500ms
+    def pause(self):
+        """Stop the highlighting loop while the home page is hidden."""
+        if self._update_after_id is not None:
+            self.after_cancel(self._update_after_id)
+            self._update_after_id = None
+
+
+class HomePage(ctk.CTkFrame):
+    """
+    Container for the home screen. Its widgets are built once by App.build_home_page
+    and kept alive while other pages are shown.
+    """
+
+    def __init__(self, master, app, *args, **kwargs):
+        super().__init__(master, fg_color="transparent", *args, **kwargs)
+        self.app = app
+
+    def on_show(self):
+        self.app.update_app_settings()
+        self.app.refresh_protocol_list()
+        self.app.protocol_viewer.resume()
+
+    def on_hide(self):
+        self.app.protocol_viewer.pause()
 
 def read_settings():
     settings = {}
@@ -168,6 +302,10 @@ def read_settings():
     return settings
 
 
+def setting_is_true(settings, key, default="False"):
+    return settings.get(key, default).lower() in ("true", "1", "yes")
+
+
 def load_default_settings(app=None):
     """
     Copies default_settings.txt to settings.txt and, if an app instance is provided,
@@ -193,51 +331,19 @@ def load_default_settings(app=None):
                 print("Error parsing graph_time_range:", e)
             # Update string setting
             app.accent_color = default_settings.get("accent_color", app.accent_color)
+            # Closed-loop pressure targeting (see pressure_targeting.py) and the Smart steps' stability band
+            for key in ("pressure_lead_s", "pressure_timeout_s", "pressure_settle_s", "pressure_stale_s",
+                        "smart_stable_psi"):
+                if key in default_settings:
+                    try:
+                        setattr(app, key, float(default_settings[key]))
+                    except ValueError as e:
+                        print(f"Error parsing {key}:", e)
             print("App settings updated with defaults.")
     except Exception as e:
         print("Error copying default settings:", e)
 
 
-def save_graph_animation(recorded_times, recorded_input_pressures, recorded_pressure1s, recorded_pressure2s,
-                         file_name="graph_recording.mp4"):
-    """
-    Create and save a matplotlib animation from recorded graph data.
-    """
-    fig, ax = plt.subplots(figsize=(6, 4))
-    ax.set_xlabel("Time (s)")
-    ax.set_ylabel("PSI")
-
-    # Initialize empty line objects
-    line_input, = ax.plot([], [], label="Input Pressure")
-    line_pressure1, = ax.plot([], [], label="Pressure 1")
-    line_pressure2, = ax.plot([], [], label="Pressure 2")
-    ax.legend()
-
-    # Set x- and y-limits (if data is available)
-    if recorded_times:
-        ax.set_xlim(min(recorded_times), max(recorded_times))
-        ymin = min(min(recorded_input_pressures), min(recorded_pressure1s), min(recorded_pressure2s))
-        ymax = max(max(recorded_input_pressures), max(recorded_pressure1s), max(recorded_pressure2s))
-        ax.set_ylim(ymin, ymax)
-
-    def update(frame):
-        # frame is the current index (from 0 to len(recorded_times)-1)
-        t = recorded_times[:frame + 1]
-        ip = recorded_input_pressures[:frame + 1]
-        p1 = recorded_pressure1s[:frame + 1]
-        p2 = recorded_pressure2s[:frame + 1]
-        line_input.set_data(t, ip)
-        line_pressure1.set_data(t, p1)
-        line_pressure2.set_data(t, p2)
-        return line_input, line_pressure1, line_pressure2
-
-    ani = animation.FuncAnimation(fig, update, frames=len(recorded_times), blit=True, interval=30)
-    writer = animation.writers['ffmpeg'](fps=30, metadata=dict(artist='YourName'), bitrate=1800)
-    ani.save(file_name, writer=writer)
-    plt.close(fig)
-    print(f"Animation saved as {file_name}")
-
-
 class App(ctk.CTk):
     def __init__(self):
         super().__init__()  # Initialize the parent class
@@ -260,7 +366,38 @@ class App(ctk.CTk):
         # set default color theme
         ctk.set_default_color_theme(self.accent_color)
 
+        PROFILER.checkpoint("module imports")
+        # Trained models are read from disk while the window and hardware come up
+        self.model_registry = ModelRegistry()
+        self.model_registry.prefetch("pressure_calibrator", "inflation_time", "deflation_time")
         load_default_settings(self)
+        startup_settings = read_settings()
+        # fast_start skips the boot video; profile_startup prints the startup report
+        self.fast_start = setting_is_true(startup_settings, "fast_start")
+        PROFILER.enabled = setting_is_true(startup_settings, "profile_startup")
+
+        # Hardware and models are brought up in parallel by the init orchestrator;
+        # each attribute stays None until its subsystem is ready.
+        self.valve1 = None
+        self.valve2 = None
+        self.lps = None
+        self.motor_controller = None
+        self.calibrator = None
+        self.inflation_model = None
+        self.deflation_model = None
+        self.init_orchestrator = InitOrchestrator(profiler=PROFILER)
+        self.init_orchestrator.add("valves", self.init_valves, timeout=5)
+        self.init_orchestrator.add("lps", self.init_lps, timeout=5)
+        self.init_orchestrator.add("motor", self.init_motor_controller, timeout=5)
+        self.init_orchestrator.add("calibration", self.load_calibration_models, timeout=60)
+        self.init_orchestrator.add("inflation_model", self.load_inflation_model, timeout=60)
+        self.init_orchestrator.add("deflation_model", self.load_deflation_model, timeout=60)
+        self.init_orchestrator.add_listener(
+            lambda name, state, error: self.after(0, self.update_subsystem_status, name, state))
+        self.init_orchestrator.on_all_settled(self.on_subsystems_settled)
+        self.subsystems_started = False
+        self.startup_reported = False
+
         icon_path = os.path.abspath('./img/ratfav.ico')
         png_icon_path = os.path.abspath('./img/ratfav.png')
         try:
@@ -271,8 +408,13 @@ class App(ctk.CTk):
 
         except Exception as e:
             print(f"Failed to set icon: {e}")
+        PROFILER.checkpoint("settings + icon")
 
-        self.show_boot_animation()
+        if not self.fast_start:
+            # The boot video is the first paint, so hardware and models can come up while it plays
+            self.start_subsystems()
+            self.show_boot_animation()
+            PROFILER.checkpoint("boot animation")
 
         # Window configuration
         self.title("MeshAlyzer")
@@ -286,12 +428,21 @@ class App(ctk.CTk):
         self.geometry(f"1800x920+{x_coordinate}+{y_coordinate}")
 
         # Protocol Handling dictionary inti
-        self.data_dict = {}
+        self.variables = VariableStore()  # protocol variables (see variable_store.py)
         self.protocol_step = None
         self.target_pressure = None
         self.protocol_command = None
         self.target_time = None
         self.protocol_running = False  # Flag to indicate if the protocol is running
+        self.protocol_cycle = None  # Repeat-block cycle tag of the running step, e.g. "3" or "3.2"
+        # Smart steps refine the timing models over a run (see online_timing_learner.py)
+        self.protocol_executor = ProtocolExecutor(self, timing_log_path="timing.csv",
+                                                  learner=OnlineTimingLearner(log_path="timing_observations.csv"))
+        self.step_metrics = StepMetrics()  # fed by read_sensors, read by calculate_metric
+        # 5 s windows, the averaging time the Smart* timing models were trained with
+        self.rolling_stats = RollingPressureStats(window_seconds=5.0)  # fed by on_pressure_sample, read by Smart steps
+        # Cycle-to-cycle SmartInflateML peak correction, fed by read_sensors (see peak_controller.py)
+        self.peak_controller = PeakController(plant=load_pneumatic_plant())
         self.total_steps = 0
         self.moving_steps_total = 0
         self.graph_times = []
@@ -304,22 +455,19 @@ class App(ctk.CTk):
         self.pressure_receiver = PressureReceiver()
         self.pressure_thread = threading.Thread(target=self.pressure_receiver.run, daemon=True)
         self.pressure_thread.start()
+        # Pressure-mode steps close the valves straight from the receiver's sample stream
+        self.pressure_controller = PressureTargetController(
+            convert=self.convert_sensor,
+            subscribe=PressureReceiver.add_listener,
+            unsubscribe=PressureReceiver.remove_listener
+        )
+        PressureReceiver.add_listener(self.on_pressure_sample)
+        PROFILER.checkpoint("pressure receiver")
 
         ## clamp state
         self.clamp_state = None
         self.clamp_state = False  # or True, depending on your system
 
-        # --------------------------
-        # input/output init
-        # --------------------------
-
-        self.valve1 = ValveController(supply_pins=[20], vent_pins=[27])
-        self.valve2 = ValveController(supply_pins=[12], vent_pins=[24])
-        self.i2c = busio.I2C(board.SCL, board.SDA)
-        self.lps = adafruit_lps2x.LPS22(self.i2c)
-        # self.lps.pressure
-        # self.lps.temperature
-
         # --------------------------
         # Top Navigation Bar Section
         # --------------------------
@@ -336,10 +484,7 @@ class App(ctk.CTk):
         self.nav_right_frame.pack(side="right", padx=20)
 
         self.data_recording = False
-        self.recorded_graph_times = []
-        self.recorded_input_pressures = []
-        self.recorded_pressure1s = []
-        self.recorded_pressure2s = []
+        self.graph_recorder = None
 
         # --- Logo on Left Side ---
         # Create a white icon from the SVG file
@@ -474,15 +619,16 @@ class App(ctk.CTk):
         self.content_frame = ctk.CTkFrame(self, fg_color="transparent")
         self.content_frame.pack(expand=True, fill="both", pady=10)
 
-        self.home_frame = None
-        self.protocol_builder_frame = None
-        self.inspector_frame = None
-        self.settings_frame = None
+        # Pages are built once on first visit and then only shown/hidden
+        self.pages = {}
+        self.current_page = None
+        self.home_displayed = False
+
+        PROFILER.checkpoint("navigation bar")
 
-        # set up readvalues
-        self.sensor_data = []
-        self.calibrator = PressureCalibrator()
-        self.calibrator.models = load('calibrating_pressure_transducers/trained_pressure_calibrator_multioutput.joblib')
+        # set up readvalues (read_sensors waits until the valves and calibrator are ready);
+        # protocol samples are streamed to data.csv as they are read
+        self.trial_writer = TrialDataWriter('data.csv')
 
         # Start the sensor reading in a separate daemon thread
         self.update_queue = queue.Queue()
@@ -501,46 +647,118 @@ class App(ctk.CTk):
         else:
             ctk.set_appearance_mode("Dark")
 
-        # clampmotor setup
-        try:
-            self.motor_controller = MotorController(port="/dev/ttyACM0", baudrate=9600)
-        except Exception as e:
-            print(f"Failed to initialize MotorController: {e}")
-
         # Variables to track button hold state
         self.motor_forward_pressed = False
         self.motor_forward_active = False
         self.motor_reverse_pressed = False
         self.motor_reverse_active = False
 
-        import joblib, pathlib
+        self.peak_pressure: float = 1.4  # psi
+        self.avg_IAP: float = 0.12  # psi
+
+        # Initialize the home display
+        self.show_home()
+        PROFILER.checkpoint("home page")
+        self.after_idle(self.on_first_paint)
+
+    def on_first_paint(self):
+        PROFILER.mark("home screen painted")
+        self.start_subsystems()
+        self.report_startup()
+
+    def start_subsystems(self):
+        """Bring up hardware and models in parallel; the UI stays interactive meanwhile."""
+        if self.subsystems_started:
+            return
+        self.subsystems_started = True
+        self.init_orchestrator.start()
+
+    def on_subsystems_settled(self):
+        PROFILER.mark("subsystems settled")
+        # Report from the Tk thread once both the UI and the subsystems are ready
+        self.after(0, self.report_startup)
+
+    def report_startup(self):
+        if (self.startup_reported or not self.init_orchestrator.all_settled()
+                or "home screen painted" not in PROFILER.events):
+            return
+        self.startup_reported = True
+        PROFILER.mark("home screen usable")
+        PROFILER.uninstall_import_timer()
+        PROFILER.print_report()
+
+    def init_valves(self):
+        valve1 = ValveController(supply_pins=[20], vent_pins=[27])
+        valve2 = ValveController(supply_pins=[12], vent_pins=[24])
+        self.valve1, self.valve2 = valve1, valve2
+
+    def init_lps(self):
+        self.i2c = busio.I2C(board.SCL, board.SDA)
+        self.lps = adafruit_lps2x.LPS22(self.i2c)
 
-        base = pathlib.Path(__file__).parent
+    def init_motor_controller(self):
+        self.motor_controller = MotorController(port="/dev/ttyACM0", baudrate=9600)
+
+    def read_lps(self):
+        """Return (pressure, temperature) from the LPS22, or (None, None) while it is unavailable."""
+        if self.lps is None:
+            return None, None
         try:
-            self.inflation_model = joblib.load(base / "inflation_time_model.pkl")
-            print("Loaded inflation_time_model.pkl")
+            return self.lps.pressure, self.lps.temperature
         except Exception as e:
-            print("inflation model load failed:", e)
-            self.inflation_model = None
+            print(f"[read_lps] Error: {e}")
+            return None, None
+
+    def subsystems_ready(self, names, action="This action"):
+        """
+        Check that the given subsystems are ready, notifying the user if not.
+
+        :return: True if every subsystem in `names` is ready.
+        """
+        not_ready = [name for name in names if not self.init_orchestrator.is_ready(name)]
+        if not_ready:
+            states = ", ".join(f"{name} ({self.init_orchestrator.state(name)})" for name in not_ready)
+            self.show_overlay_notification(f"{action} needs: {states}")
+            return False
+        return True
+
+    def update_subsystem_status(self, name, state):
+        box = getattr(self, "status_boxes", {}).get(name)
+        if box is None:
+            return
         try:
-            self.deflation_model = joblib.load(base / "deflation_time_model.pkl")
-            print("Loaded deflation_time_model.pkl")
+            if box.winfo_exists():
+                box.configure(fg_color=STATE_COLORS[state])
         except Exception as e:
-            print("deflation model load failed:", e)
-            self.deflation_model = None
+            print(f"Error updating status box {name}: {e}")
 
-        self.peak_pressure: float = 1.4  # psi
-        self.avg_IAP: float = 0.12  # psi
+    def load_calibration_models(self):
+        models = self.model_registry.load("pressure_calibrator")
+        if hasattr(models, "pressure_sensor_converter_main"):
+            # A compact export (see compact_calibrator.py): NumPy only, scikit-learn is never imported
+            self.calibrator = models
+            return
+        # Importing the calibrator pulls in scikit-learn, which is the slowest part of startup
+        from calibrating_pressure_transducers.getCalibrationData import PressureCalibrator
+        calibrator = PressureCalibrator()
+        calibrator.models = models
+        self.calibrator = calibrator
 
-        # Initialize the home display
-        self.show_home()
-        self.protocol_viewer.load_protocol(self.protocol_var.get())
+    # The timing models are registered as compiled forests: they predict in microseconds (see
+    # compiled_forest.py). Each is its own subsystem, so a failed load only refuses the protocols
+    # with the Smart step that needs it.
+    def load_inflation_model(self):
+        self.inflation_model = self.model_registry.load("inflation_time")
+
+    def load_deflation_model(self):
+        self.deflation_model = self.model_registry.load("deflation_time")
 
 
     def show_boot_animation(self):
         # Remove title bar for splash screen effect
 
         self.overrideredirect(True)
+        PROFILER.mark("boot animation shown")
 
         # Set the desired window size (720p video dimensions)
         window_width = 854
@@ -681,16 +899,61 @@ class App(ctk.CTk):
     def clear_content_frame(self):
         for widget in self.content_frame.winfo_children():
             widget.destroy()
+        self.pages = {}
+        self.current_page = None
+
+    def show_page(self, name):
+        """
+        Show a cached page, building it the first time it is visited.
+        The previous page is hidden with pack_forget() rather than destroyed, and
+        pages may define on_show()/on_hide() to resume or pause their updaters.
+        """
+        builders = {
+            "home": (self.build_home_page, {}),
+            "protocol_builder": (self.build_protocol_builder_page, {}),
+            "calibrate": (lambda: CalibratePage(self.content_frame, app=self), {"padx": 20, "pady": 20}),
+            "settings": (lambda: SettingsPage(self.content_frame, app=self), {}),
+        }
+        if name not in self.pages:
+            build, pack_kwargs = builders[name]
+            self.pages[name] = (build(), pack_kwargs)
+        page, pack_kwargs = self.pages[name]
+        if page is self.current_page:
+            return
+
+        if self.current_page is not None:
+            self.current_page.pack_forget()
+            if hasattr(self.current_page, "on_hide"):
+                self.current_page.on_hide()
+
+        self.home_displayed = name == "home"
+        page.pack(fill="both", expand=True, **pack_kwargs)
+        self.current_page = page
+        if hasattr(page, "on_show"):
+            page.on_show()
 
     def start_data_recording(self, duration=30):
         """
-        Start recording the data for a 30-second session.
+        Start recording the live graph to video for a 30-second session.
+        Frames are encoded while recording, so the file is ready right after stop.
         """
-        # Clear out any previously recorded data
-        self.recorded_graph_times = []
-        self.recorded_input_pressures = []
-        self.recorded_pressure1s = []
-        self.recorded_pressure2s = []
+        if self.data_recording:
+            print("Data recording is already running.")
+            return
+        try:
+            self.graph_recorder = StreamingGraphRecorder(
+                file_name="graph_recording.mp4",
+                fps=30,
+                window=self.graph_time_range,
+                y_range=self.graph_y_range,
+                dark=ctk.get_appearance_mode() == "Dark"
+            )
+            self.graph_recorder.start()
+        except Exception as e:
+            print(f"Failed to start graph recording: {e}")
+            self.graph_recorder = None
+            self.show_overlay_notification(f"Data recording failed: {e}")
+            return
         self.data_recording = True
         self.show_overlay_notification("Data recording started")
 
@@ -699,16 +962,24 @@ class App(ctk.CTk):
 
     def stop_data_recording(self):
         """
-        Stop the recording and trigger saving the animation on a background thread.
+        Stop the recording and let ffmpeg finalize the video on a background thread.
         """
+        if not self.data_recording:
+            return
         self.data_recording = False
+        recorder = self.graph_recorder
+        self.graph_recorder = None
         self.show_overlay_notification("Data recording finished. Saving video...")
 
-        # Spawn a thread to avoid blocking the UI during animation rendering
-        threading.Thread(target=save_graph_animation,
-                         args=(self.recorded_graph_times, self.recorded_input_pressures,
-                               self.recorded_pressure1s, self.recorded_pressure2s, "graph_recording.mp4"),
-                         daemon=True).start()
+        def finish():
+            if recorder.stop():
+                print(f"Graph recording saved as {recorder.file_name} ({recorder.frames_written} frames)")
+                self.after(0, lambda: self.show_overlay_notification(f"Video saved: {recorder.file_name}"))
+            else:
+                print("Graph recording failed to save.")
+
+        # ffmpeg only has to flush its last frames, but keep the UI free while it does
+        threading.Thread(target=finish, daemon=True).start()
 
     def open_twitter(self):
         """
@@ -727,12 +998,13 @@ class App(ctk.CTk):
         self.pressure3 = pressure3
 
     def show_home(self):
-        self.clear_content_frame()
-        self.home_displayed = True
-        self.update_app_settings()
+        self.show_page("home")
+
+    def build_home_page(self):
+        page = HomePage(self.content_frame, app=self)
 
         # Sidebar
-        self.sidebar_frame = ctk.CTkFrame(self.content_frame, width=300)
+        self.sidebar_frame = ctk.CTkFrame(page, width=300)
         self.sidebar_frame.pack(side="left", fill="y", padx=15)
 
         # Calibrate button
@@ -817,23 +1089,31 @@ class App(ctk.CTk):
         self.status_frame = ctk.CTkFrame(self.sidebar_frame, fg_color="transparent")
         self.status_frame.pack(side="bottom", pady=10, padx=10)
 
-        # RPI Box – will check PressureReceiver status
-        self.rpi_box = ctk.CTkFrame(self.status_frame, width=80, height=40, corner_radius=10, fg_color="gray")
-        self.rpi_box.grid(row=0, column=0, padx=5)
-        self.rpi_label = ctk.CTkLabel(self.rpi_box, text="RPI", font=("Arial", 10, "bold"))
-        self.rpi_label.place(relx=0.5, rely=0.5, anchor="center")
+        def status_box(text, row, column):
+            box = ctk.CTkFrame(self.status_frame, width=60, height=40, corner_radius=10, fg_color="gray")
+            box.grid(row=row, column=column, padx=5, pady=3)
+            label = ctk.CTkLabel(box, text=text, font=("Arial", 10, "bold"))
+            label.place(relx=0.5, rely=0.5, anchor="center")
+            return box
 
+        # RPI Box – will check PressureReceiver status
+        self.rpi_box = status_box("RPI", 0, 0)
         # UNO Box – will check self.motor_controller status
-        self.uno_box = ctk.CTkFrame(self.status_frame, width=80, height=40, corner_radius=10, fg_color="gray")
-        self.uno_box.grid(row=0, column=1, padx=5)
-        self.uno_label = ctk.CTkLabel(self.uno_box, text="UNO", font=("Arial", 10, "bold"))
-        self.uno_label.place(relx=0.5, rely=0.5, anchor="center")
-
+        self.uno_box = status_box("UNO", 0, 1)
         # BLK Box – dummy for now
-        self.blk_box = ctk.CTkFrame(self.status_frame, width=80, height=40, corner_radius=10, fg_color="gray")
-        self.blk_box.grid(row=0, column=2, padx=5)
-        self.blk_label = ctk.CTkLabel(self.blk_box, text="BLK", font=("Arial", 10, "bold"))
-        self.blk_label.place(relx=0.5, rely=0.5, anchor="center")
+        self.blk_box = status_box("BLK", 0, 2)
+
+        # One box per subsystem brought up by the init orchestrator
+        self.status_boxes = {
+            "motor": self.uno_box,
+            "valves": status_box("VLV", 0, 3),
+            "lps": status_box("LPS", 1, 0),
+            "calibration": status_box("CAL", 1, 1),
+            "inflation_model": status_box("INF", 1, 2),
+            "deflation_model": status_box("DEF", 1, 3),
+        }
+        for name in self.status_boxes:
+            self.update_subsystem_status(name, self.init_orchestrator.state(name))
 
 
         # Valve control dropdown
@@ -844,9 +1124,9 @@ class App(ctk.CTk):
                 "pressure1": self.pressure1_convert,
                 "pressure2": self.pressure2_convert,
             },
-            on_vent=lambda: (self.valve1.vent(), self.valve2.vent()),
-            on_neutral=lambda: (self.valve1.neutral(), self.valve2.neutral()),
-            on_supply=lambda: (self.valve1.supply(), self.valve2.supply())
+            on_vent=lambda: self.subsystems_ready(["valves"], "Valve control") and (self.valve1.vent(), self.valve2.vent()),
+            on_neutral=lambda: self.subsystems_ready(["valves"], "Valve control") and (self.valve1.neutral(), self.valve2.neutral()),
+            on_supply=lambda: self.subsystems_ready(["valves"], "Valve control") and (self.valve1.supply(), self.valve2.supply())
         )
         self.valve_control.pack(pady=10)
 
@@ -858,7 +1138,7 @@ class App(ctk.CTk):
 
 
         # Main content area
-        self.main_frame = ctk.CTkFrame(self.content_frame, fg_color="transparent")
+        self.main_frame = ctk.CTkFrame(page, fg_color="transparent")
         self.main_frame.pack(side="left", expand=True, fill="both", padx=10)
 
         self.protocol_name_label = ctk.CTkLabel(self.main_frame, text="Current Protocol: None", anchor="w",
@@ -919,9 +1199,6 @@ class App(ctk.CTk):
 
         # make transparent graph here
         # === ADD TRANSPARENT GRAPH BELOW THE DISPLAYS ===
-        if self.graph_frame is not None and self.graph_frame.winfo_exists():
-            for widget in self.graph_frame.winfo_children():
-                widget.destroy()
         self.graph_frame = ctk.CTkFrame(self.main_frame, fg_color="transparent")
         self.graph_frame.pack(pady=10, padx=20, fill="both", expand=True)
         self.fig, self.ax = plt.subplots(figsize=(6, 4))  # Adjust the figure size as needed
@@ -939,10 +1216,8 @@ class App(ctk.CTk):
         )
         self.clear_graph_button.pack(pady=(0, 10))
 
-        # Initialize ProtocolViewer and start queue processing
+        # Initialize ProtocolViewer (queue processing is started once in __init__)
         self.initialize_protocol_viewer()
-        self.protocol_viewer.load_protocol(self.protocol_var.get())
-        self.process_queue()
 
         self.record_data_button = ctk.CTkButton(
             self.sidebar_frame,
@@ -950,12 +1225,34 @@ class App(ctk.CTk):
             command=lambda: self.start_data_recording(30)
         )
         self.record_data_button.pack(pady=10)
+        return page
+
+    def refresh_protocol_list(self):
+        """Re-read ./protocols so files added while the app runs show up in the dropdown."""
+        self.protocol_files = [f for f in os.listdir(self.protocol_folder) if
+                               os.path.isfile(os.path.join(self.protocol_folder, f))]
+        self.protocol_dropdown.configure(values=self.protocol_files)
 
     def run_protocol(self):
         if self.protocol_running:
             print("Protocol is already running.")
             return
         protocol_name = self.protocol_var.get()
+        # Validate the whole file before anything moves
+        try:
+            protocol = compile_protocol_file(os.path.join(self.protocol_folder, protocol_name))
+        except (OSError, ProtocolError) as e:
+            print(f"Protocol {protocol_name} rejected: {e}")
+            self.show_overlay_notification(f"Invalid protocol {protocol_name}: {e}", auto_dismiss_ms=10000)
+            return
+        # Only the subsystems this protocol uses have to be up; refuse straight away
+        # if one of them failed, otherwise process_protocol waits for the rest.
+        required = protocol.required_subsystems
+        unavailable = self.init_orchestrator.unavailable(required)
+        if unavailable:
+            self.show_overlay_notification(f"Cannot run protocol, not available: {', '.join(sorted(unavailable))}")
+            return
+        not_ready = [name for name in required if not self.init_orchestrator.is_ready(name)]
         self.stop_flag = False  # reset stop-flag
         self.protocol_running = True
 
@@ -963,9 +1260,12 @@ class App(ctk.CTk):
         # Start the protocol in a separate thread
         self.protocol_name_current = self.protocol_var.get()
         threading.Thread(target=self.process_protocol,
-                         args=(self.protocol_var.get(),),
+                         args=(protocol, required),
                          daemon=True).start()
-        self.show_overlay_notification("Protocol started")
+        if not_ready:
+            self.show_overlay_notification(f"Protocol will start once ready: {', '.join(sorted(not_ready))}")
+        else:
+            self.show_overlay_notification("Protocol started")
         print(f"Running Protocol: {protocol_name}")
 
     def update_sample_id(self, event):
@@ -981,6 +1281,7 @@ class App(ctk.CTk):
         )
         self.protocol_viewer.pack(fill="both", expand=True, pady=10)
         self.protocol_viewer.load_protocol(self.protocol_var.get())
+        self.protocol_viewer.resume()
 
         # Trace for protocol_var to update ProtocolViewer when protocol changes
         self.protocol_var.trace("w", self.update_protocol_viewer)
@@ -991,14 +1292,15 @@ class App(ctk.CTk):
         protocol_path = os.path.join(self.protocol_folder, protocol_name)
         if not protocol_name or not os.path.isfile(protocol_path):
             return  # ignore blanks or directories
-        self.protocol_viewer.load_protocol(protocol_name)
         print(f"Updating ProtocolViewer with: {protocol_name}")  # Debug print
-        self.protocol_viewer.load_protocol(self.protocol_var.get())
+        self.protocol_viewer.load_protocol(protocol_name)
 
     def show_protocol_builder(self):
-        self.home_displayed = False  # Set to False to indicate home is not displayed
         """Display the protocol builder page with a sidebar and main content area."""
-        self.clear_content_frame()
+        self.show_page("protocol_builder")
+
+    def build_protocol_builder_page(self):
+        return ctk.CTkFrame(self.content_frame, fg_color="transparent")
 
     def toggle_mode(self):
         mode = "Light" if ctk.get_appearance_mode() == "Dark" else "Dark"
@@ -1029,10 +1331,7 @@ class App(ctk.CTk):
         self.clear_content_frame()  # Clear existing content in the frame
 
     def show_settings(self):
-        self.home_displayed = False  # Set to False to indicate home is not displayed
-        self.clear_content_frame()
-        settings_page = SettingsPage(self.content_frame, app=self)
-        settings_page.pack(fill="both", expand=True)
+        self.show_page("settings")
 
     def set_motor_control(self, value):
         self.selected_motor = value.lower()  # Converts "Left"/"Both"/"Right" to lowercase for the command string
@@ -1050,6 +1349,8 @@ class App(ctk.CTk):
 
 
     def start_motor_forward(self, event):
+        if not self.subsystems_ready(["motor"], "Clamp motor"):
+            return
         # When the button is pressed, record the time and set the flag.
         self.motor_forward_pressed = True
         self.motor_forward_press_time = time.time()
@@ -1086,9 +1387,12 @@ class App(ctk.CTk):
         self.motor_forward_pressed = False
         self.motor_forward_active = False
         # Send a stop command to the motor controller.
-        self.motor_controller.send_command("stop")
+        if self.motor_controller is not None:
+            self.motor_controller.send_command("stop")
 
     def start_motor_reverse(self, event):
+        if not self.subsystems_ready(["motor"], "Clamp motor"):
+            return
         # When the button is pressed, record the time and set the flag.
         self.motor_reverse_pressed = True
         self.motor_reverse_press_time = time.time()
@@ -1130,7 +1434,8 @@ class App(ctk.CTk):
         self.motor_reverse_pressed = False
         self.motor_reverse_active = False
         # Send a stop command to the motor controller.
-        self.motor_controller.send_command("stop")
+        if self.motor_controller is not None:
+            self.motor_controller.send_command("stop")
 
     def reset_left_distance(self):
         self.distance_left = 0.0
@@ -1164,6 +1469,7 @@ class App(ctk.CTk):
         self.graph_input_pressures.append(current_input_pressure)
         self.graph_pressure1s.append(current_pressure1)
         self.graph_pressure2s.append(current_pressure2)
+        self.trim_graph_data(current_time_val)
 
         # --- Update home page widgets if the home page is displayed ---
         if self.home_displayed:
@@ -1178,27 +1484,34 @@ class App(ctk.CTk):
                 safe_configure(self.force_display_frame,
                                text=f"{avg_force:.2f} PSI\n{current_pressure1:.2f} PSI | {current_pressure2:.2f} PSI")
 
-                # Update status boxes (RPI, UNO, BLK)
+                # Update status boxes (RPI, UNO, BLK); the other subsystem boxes
+                # are coloured by update_subsystem_status as they come up
                 try:
                     rpi_status = self.pressure_receiver.status()
                 except Exception as e:
                     print(f"Error checking PressureReceiver status: {e}")
                     rpi_status = False
-                try:
-                    uno_status = self.motor_controller.status()
-                except Exception as e:
-                    print(f"Error checking MotorController status: {e}")
-                    uno_status = False
-
                 rpi_color = "green" if rpi_status else "red"
-                uno_color = "green" if uno_status else "red"
+
+                if self.init_orchestrator.is_ready("motor"):
+                    try:
+                        uno_status = self.motor_controller.status()
+                    except Exception as e:
+                        print(f"Error checking MotorController status: {e}")
+                        uno_status = False
+                    uno_color = "green" if uno_status else "red"
+                else:
+                    uno_color = STATE_COLORS[self.init_orchestrator.state("motor")]
                 blk_color = "green"  # Assuming BLK status is always OK
                 safe_configure(self.rpi_box, fg_color=rpi_color)
                 safe_configure(self.uno_box, fg_color=uno_color)
                 safe_configure(self.blk_box, fg_color=blk_color)
 
                 protocol_step = self.protocol_step if self.protocol_step is not None else 0
-                safe_configure(self.protocol_step_counter, text=f"Step: {protocol_step} / {self.total_steps}")
+                step_text = f"Step: {protocol_step} / {self.total_steps}"
+                if self.protocol_cycle is not None:
+                    step_text += f"\nCycle: {self.protocol_cycle}"
+                safe_configure(self.protocol_step_counter, text=step_text)
                 safe_configure(self.valve_display, text=f"{valve1_state} | {valve2_state}")
 
                 # Also update the home page graph if its canvas exists.
@@ -1304,16 +1617,31 @@ class App(ctk.CTk):
 
         # --- Update the LPS info label ---
         try:
-            safe_configure(self.lps_info_label, text=f"{lps_pressure:.3f} hPa | {lps_temp:.3f} °C")
+            if lps_pressure is not None and lps_temp is not None:
+                safe_configure(self.lps_info_label, text=f"{lps_pressure:.3f} hPa | {lps_temp:.3f} °C")
         except Exception as e:
             print(f"Error updating lps_info_label: {e}")
 
-        if self.data_recording:
-            # Append a copy of the latest values
-            self.recorded_graph_times.append(self.graph_times[-1])
-            self.recorded_input_pressures.append(self.graph_input_pressures[-1])
-            self.recorded_pressure1s.append(self.graph_pressure1s[-1])
-            self.recorded_pressure2s.append(self.graph_pressure2s[-1])
+        if self.data_recording and self.graph_recorder is not None:
+            # Hand the latest values to the recorder; it keeps only the visible window
+            self.graph_recorder.add_sample(current_time_val, current_input_pressure,
+                                           current_pressure1, current_pressure2,
+                                           target_pressure=self.target_pressure)
+
+    def trim_graph_data(self, current_time):
+        """
+        Drop samples that have scrolled out of the graph window so the graph lists stay
+        bounded during long runs. With no_cap the whole history is plotted, so keep it.
+        """
+        if self.no_cap is True:
+            return
+        cutoff = bisect.bisect_left(self.graph_times, current_time - self.graph_time_range)
+        # Trim in batches; deleting from the front of a list is O(n)
+        if cutoff > 100:
+            del self.graph_times[:cutoff]
+            del self.graph_input_pressures[:cutoff]
+            del self.graph_pressure1s[:cutoff]
+            del self.graph_pressure2s[:cutoff]
 
     def clear_graph_data(self):
         # Reset the lists holding the graph data
@@ -1332,358 +1660,123 @@ class App(ctk.CTk):
         self.stop_flag = True
         print("Stop flag set. Protocol will be halted.")
 
-    def variable_saver(self, variable_name, user_input):
-        with open('variables.txt', 'a') as file:
-            current_time = time.strftime('%Y-%m-%d %H:%M:%S')
-            file.write(f"{current_time}, {variable_name}, {user_input}\n")
-
-    def get_from_dict(self, dict_key, variable_name):
-        # Retrieve the dictionary from the class attribute
-        data_dict = self.data_dict.get(dict_key, {})
-
-        # Check if the variable name exists in the dictionary
-        if variable_name in data_dict:
-            return data_dict[variable_name]
-        else:
-            return None
-
-    def save_to_dict(self, dict_key, variable_name, value):
-        # Retrieve the dictionary from the class attribute
-        data_dict = self.data_dict.get(dict_key, {})
-
-        # Update the dictionary
-        data_dict[variable_name] = value
+    def on_pressure_sample(self, t, pressures):
+        """PressureReceiver listener: every calibrated sample goes into the rolling windows."""
+        if self.calibrator is None:
+            return
+        p0, p1, p2 = self.calibrator.pressure_sensor_converter_main(pressures[0], pressures[1], pressures[2])
+        self.rolling_stats.add_sample(t, p0, p1, p2)
 
-        # Save the updated dictionary back to the class attribute
-        self.data_dict[dict_key] = data_dict
+    def _measure_all(self, channels, seconds: float):
+        """
+        Rolling-window statistics of `channels` as {channel: WindowStats} (see rolling_stats.py).
+        Returns at once when the last 5 s of all of them are settled, otherwise waits for them to
+        settle for at most `seconds` in total.
+        """
+        started = time.monotonic()
+        stats = self.rolling_stats.wait_all_stable(channels, float(getattr(self, "smart_stable_psi", 0.05)),
+                                                   seconds)
+        waited = time.monotonic() - started
+        if waited > 0.1:
+            print(f"[rolling] waited {waited:.2f} s for settled {', '.join(channels)} windows")
+        return stats
 
-    def string_to_value_checker(self, string_input, type_s="int"):
-        try:
-            # Try to convert the input directly to an integer or float
-            if type_s == "float":
-                return float(string_input)
-            else:
-                return int(string_input)
-        except ValueError:
-            if string_input.startswith("(") and string_input.endswith(")"):
-                inner_expr = string_input[1:-1]  # Extract content inside parentheses
-                # Define angle_value from Redis
-                angle_value = self.get_from_dict('set_vars', inner_expr)
-                if angle_value is None:
-                    raise ValueError("Variable 'angle_value' not found in Redis.")
-                angle_value = float(angle_value)  # Convert to float for calculations
-
-                # Replace 'angle_value' with its value in the expression
-                expr_with_value = inner_expr.replace(string_input, str(angle_value))
-                try:
-                    # Evaluate the expression and return the result
-                    result = eval(expr_with_value)
-                    if type_s == "float":
-                        return float(result)
-                    else:
-                        return int(result)
-                except Exception as e:
-                    raise ValueError(f"Invalid expression in input: {string_input}. Error: {e}")
-            # If no parentheses, check if it's a variable and look up in Redis
-            angle_value = self.get_from_dict('set_vars', string_input)
-            if angle_value is None:
-                raise ValueError(f"Variable '{string_input}' not found in Redis.")
-            elif isinstance(angle_value, str):
-                cycle_count = 0
-                while isinstance(angle_value, str) and cycle_count < 10:
-                    angle_value = self.get_from_dict('set_vars', angle_value)
-                    cycle_count += 1
-                if isinstance(angle_value, str):
-                    raise ValueError(f"Value for '{string_input}' in Redis is not a valid number after 10 cycles.")
-            try:
-                if type_s == "float":
-                    return float(angle_value)
-                else:
-                    return int(float(angle_value))
-            except ValueError:
-                raise ValueError(f"Value for '{string_input}' in Redis is not a valid number.")
+    def _measure(self, channel: str, seconds: float):
+        return self._measure_all((channel,), seconds)[channel]
 
     def _measure_pressure0_avg(self, seconds: float) -> float:
-        vals, t0 = [], time.time()
-        while time.time() - t0 < seconds:
-            vals.append(self.pressure0_convert)
-            time.sleep(0.05)
-        return sum(vals) / len(vals) if vals else 0.0
+        stats = self._measure("input", seconds)
+        return stats.mean if stats.count else 0.0
 
     def _measure_internal_avg(self, seconds: float) -> float:
-        vals, t0 = [], time.time()
-        while time.time() - t0 < seconds:
-            p1 = getattr(self, "pressure1_convert", 0.0)
-            p2 = getattr(self, "pressure2_convert", 0.0)
-            vals.append((p1 + p2) / 2)
-            time.sleep(0.05)
-        return sum(vals) / len(vals) if vals else 0.0
+        stats = self._measure("internal", seconds)
+        return stats.mean if stats.count else 0.0
 
     def _measure_internal_max(self, seconds: float) -> float:
-        vals, t0 = [], time.time()
-        while time.time() - t0 < seconds:
-            p1 = getattr(self, "pressure1_convert", 0.0)
-            p2 = getattr(self, "pressure2_convert", 0.0)
-            vals.append((p1 + p2) / 2)
-            time.sleep(0.05)
-        return max(vals) if vals else 0.0
-
-    def calculate_metric(self, metric, protocol_step):
-        with open('data.csv', 'r') as file:
-            reader = csv.reader(file)
-            data = [row for row in reader if int(row[6]) == protocol_step]
-
-        if not data:
-            raise ValueError(f"No data found for protocol step {protocol_step}")
-
-        if metric == "min_force":
-            return min(float(row[2]) for row in data)
-        elif metric == "max_force":
-            return max(float(row[2]) for row in data)
-        elif metric == "final_force":
-            return float(data[-1][2])
-        elif metric == "final_angle":
-            return float(data[-1][1])
-        elif metric == "max_angle":
-            return max(float(row[1]) for row in data)
-        elif metric == "min_angle":
-            return min(float(row[1]) for row in data)
-        elif metric == "final_time":
-            return float(data[-1][0])
-        elif metric == "start_time":
-            return float(data[0][0])
-        elif metric == "total_time":
-            return float(data[-1][0]) - float(data[0][0])
-        else:
-            raise ValueError(f"Unknown metric: {metric}")
-
-
-    def process_protocol(self, protocol_path):
+        stats = self._measure("internal", seconds)
+        return stats.max if stats.count else 0.0
+
+    def calculate_metric(self, metric, protocol_step, protocol_cycle=None):
+        return self.step_metrics.metric(metric, protocol_step, protocol_cycle)
+
+    def process_protocol(self, protocol, required=()):
+        """Run a CompiledProtocol on this (non-UI) thread once its subsystems are ready."""
+        not_ready = self.init_orchestrator.wait_for(sorted(required), timeout=120)
+        if not_ready:
+            print(f"Protocol aborted, subsystems not ready: {not_ready}")
+            self.after(0, self.show_overlay_notification,
+                       f"Protocol aborted, not ready: {', '.join(not_ready)}")
+            self.protocol_running = False
+            return
         self.protocol_step = None
         self.graph_times.clear()
         self.graph_input_pressures.clear()
 
-        protocol_filename = os.path.basename(protocol_path)
-        # turn protocol_path to the full path including file name
-        protocol_path = os.path.join(self.protocol_folder, protocol_path)
-        with open(protocol_path, 'r') as file:
-            commands = file.readlines()
-            step_number = 0
-            data_saved = False
-            folder_name = None
-        self.total_steps = len(commands)
-
-        # calculate total number of commands
-        self.total_commands = len(commands)
-
-        # clear previous data
-        self.data_dict = {}
-        self.init = True  # Initialize the protocol processing
-        for command in commands:
-            command = command.strip()
-            if not command:
-                continue
-            step_number += 1
-            self.protocol_command = command
-            self.protocol_step = step_number
-            stop_flag = self.stop_flag
-            if self.stop_flag:
-                print("Protocol stopped by user.")
-                break
-
-            if command.startswith("Inflate"):
-                parts = command.split(":")[1].split(",")
-
-                # Extract and parse the inputs
-                time_or_pressure = parts[0].strip()
-                value = float(parts[1].strip())
-                valve = parts[2].strip() if len(parts) > 2 else "Both"
-
-                # Process the inputs
-                value = self.string_to_value_checker(value, type_s='float')
-
-                # Example usage of the parsed inputs
-                print(f"Time/Pressure: {time_or_pressure}, Value: {value}, Valve: {valve}")
-                self.inflate(time_or_pressure, value, valve)
-                if len(parts) > 3:
-                    for i in range(1, len(parts), 2):
-                        metric = parts[i].strip()
-                        variable_name = parts[i + 1].strip() if i + 1 < len(parts) else metric
-                        try:
-                            metric_value = self.calculate_metric(metric, self.protocol_step)
-                        except ValueError:
-                            print(f"No data for step {self.protocol_step}, metric '{metric}' skipped")
-                            continue
-                        # use the successfully retrieved metric_value
-                        self.variable_saver(variable_name, metric_value)
-                        self.save_to_dict('set_vars', variable_name, metric_value)
-
-            elif command.startswith("SmartInflateML"):
-                # e.g. "SmartInflateML: 1.4, both"
-                _, args = command.split(":", 1)
-                tgt, valve = [p.strip() for p in args.split(",")]
-                target_pressure = float(tgt)
-                valve = valve.lower()
-
-                # 1) measure 5 s averages
-                avg_in = self._measure_pressure0_avg(5.0)
-                avg_iap = self._measure_internal_avg(5.0)
-
-                # 2) save them for later
-                self.save_to_dict("set_vars", "peak_pressure", target_pressure)
-                self.save_to_dict("set_vars", "avg_IAP", avg_iap)
-
-                # 3) predict duration
-                if self.inflation_model:
-                    dur = float(self.inflation_model.predict([[avg_iap, avg_in, target_pressure]])[0])
-                    print(f"[ML-inflate]  {dur:.2f}s")
-                    self.inflate("time", dur, valve)
-
-                    # 4) update targets for graph & CSV
-                    self.target_pressure = target_pressure
-                    self.target_time = dur
-                else:
-                    # fallback to plain “inflate until pressure”
-                    self.inflate("pressure", target_pressure, valve)
-
-
-            elif command.startswith("SmartDeflateML"):
-                # format: SmartDeflateML: <target_pressure>, <valve>
-                _, args = command.split(":", 1)
-                tgt_str, valve = [s.strip() for s in args.split(",", 1)]
-                target_pressure = float(tgt_str)
-                valve = valve.lower()
-
-                # 1) measure your 5 s averages and peak
-                avg_in = self._measure_pressure0_avg(5.0)
-                avg_iap = self._measure_internal_avg(5.0)
-                peak = self._measure_internal_max(5.0)
-
-                # 2) save for later & for graphing
-                self.save_to_dict("set_vars", "avg_IAP", avg_iap)
-                self.save_to_dict("set_vars", "peak_pressure", peak)
-                self.target_pressure = target_pressure
-
-                # 3) either ML‐predict how long to vent, or just vent to target_pressure
-                if self.deflation_model:
-                    pred_t = float(self.deflation_model.predict([[peak, avg_iap, avg_in]])[0])
-                    print(f"[ML‐deflate] predict t={pred_t:.2f}s → deflate time")
-                    self.deflate("time", pred_t, valve)
-                else:
-                    print(f"[ML‐deflate] no model, deflating to {target_pressure} PSI")
-                    self.deflate("pressure", target_pressure, valve)
-                continue
-
-
-            elif command.startswith("Deflate"):
-                parts = command.split(":")[1].split(",")
-
-                # Extract and parse the inputs
-                time_or_pressure = parts[0].strip()
-                value = float(parts[1].strip())
-                valve = parts[2].strip() if len(parts) > 2 else "Both"
-
-                # Process the inputs
-                value = self.string_to_value_checker(value, type_s='float')
-
-                # Example usage of the parsed inputs
-                print(f"Time/Pressure: {time_or_pressure}, Value: {value}, Valve: {valve}")
-                self.deflate(time_or_pressure, value, valve)
-                if len(parts) > 3:
-                    # metrics start at parts[3], so step by 2 entries (name, varname)
-                    for i in range(3, len(parts), 2):
-                        metric = parts[i].strip()
-                        variable_name = parts[i + 1].strip() if i + 1 < len(parts) else metric
-                        try:
-                            metric_value = self.calculate_metric(metric, self.protocol_step)
-                        except ValueError:
-                            print(f"No data for step {self.protocol_step}, metric '{metric}' skipped")
-                            continue
-                        self.variable_saver(variable_name, metric_value)
-                        self.save_to_dict('set_vars', variable_name, metric_value)
-            cmd, args = command.split(":", 1)
-            if cmd.strip().lower() == "wait":
-                wait_time = float(args.strip())
-                wait_time = self.string_to_value_checker(wait_time, type_s='float')
-                print(f"Waiting for {wait_time} seconds")
-                time.sleep(wait_time)
-            elif command.startswith("Wait_for_user_input"):
-                self.wait_for_user_input(command)
-
-            elif command.startswith("no_save"):
-                data_saved = True
-            elif command.startswith("End"):
-                self.end_all_commands()
-                break
-            print(f" Data saved: {data_saved}")
+        self.pressure_controller.reset(log_path="pressure_targeting.csv")
+        self.step_metrics.reset()
+        no_save = self.protocol_executor.run(protocol)
+        self.trial_writer.close()
+        self.pressure_controller.release()
+        self.pressure_controller.close_log()
+        for valve, (count, mean, max_abs, timeouts) in self.pressure_controller.overshoot_stats().items():
+            if count:
+                print(f"[pressure] {valve}: {count} targets, mean overshoot {mean:+.3f} PSI, "
+                      f"max |overshoot| {max_abs:.3f} PSI, {timeouts} timeouts")
 
         self.end_all_commands()
-        if not data_saved:
+        if not no_save:
             # Set the name to the current date and time
-            data_saved = self.create_folder_with_files(folder_name)
+            self.create_folder_with_files(None)
         self.protocol_running = False
 
     # Add save as file name ability
 
-    def wait_for_user_input(self, command):
-        parts = command.split(":")[1].split(",")
-        popup_name = parts[0].strip()
-        variable_name = parts[1].strip()
-        response_type = parts[2].strip()
-
-        def on_submit():
-            user_input = entry.get()
-            try:
-                if response_type == "int":
-                    user_input = int(user_input)
-                elif response_type == "float":
-                    user_input = float(user_input)
-                elif response_type == "string":
-                    user_input = str(user_input)
-                else:
-                    raise ValueError("Invalid response type")
-
-                self.save_to_dict('set_vars', variable_name, user_input)
-                # replace this with save_to_dict
-                self.variable_saver(variable_name, user_input)
-                popup.destroy()
-            except ValueError:
-                error_label.config(text=f"Invalid input type. Expected {response_type}.")
-
-        popup = ctk.CTk()
-        popup.title(popup_name)
-
-        label = ctk.CTkLabel(popup, text=f"Enter {response_type} value:")
-        label.pack(pady=10)
-
-        entry = ctk.CTkEntry(popup)
-        entry.pack(pady=5)
-
-        submit_button = ctk.CTkButton(popup, text="Submit", command=on_submit)
-        submit_button.pack(pady=5)
-
-        error_label = ctk.CTkLabel(popup, text="", fg_color="red")
-        error_label.pack(pady=5)
-
-        popup.mainloop()
-
     def end_all_commands(self):
         self.protocol_step = None
 
-    def inflate(self, time_or_pressure, value, valve):
-        if valve == "valve1" or valve == "both":
-            self.valve1.supply()
-        if valve == "valve2" or valve == "both":
-            self.valve2.supply()
-
-        if time_or_pressure == "time":
-            time.sleep(value)
-        elif time_or_pressure == "pressure":
-            while self.lps.pressure < value:
-                time.sleep(0.01)
+    def set_valves(self, action, valve):
+        """Call `action` ("supply", "vent" or "neutral") on valve1, valve2 or both."""
+        if valve in ("valve1", "both"):
+            getattr(self.valve1, action)()
+        if valve in ("valve2", "both"):
+            getattr(self.valve2, action)()
 
+    def close_valves(self):
         self.valve1.neutral()
         self.valve2.neutral()
+
+    def convert_sensor(self, sensor, raw_value):
+        """Calibrated psi of one raw sample from `sensor` ("pressure0", "pressure1" or "pressure2")."""
+        return float(self.calibrator.models[sensor].predict([[raw_value]])[0])
+
+    def pressure_target(self, direction, target, valve):
+        """Drive the balloon(s) of `valve` to `target` psi in closed loop (see pressure_targeting.py)."""
+        controller = self.pressure_controller
+        controller.lead_seconds = float(getattr(self, "pressure_lead_s", controller.lead_seconds))
+        controller.timeout = float(getattr(self, "pressure_timeout_s", controller.timeout))
+        controller.settle_seconds = float(getattr(self, "pressure_settle_s", controller.settle_seconds))
+        controller.stale_seconds = float(getattr(self, "pressure_stale_s", controller.stale_seconds))
+        return controller.run({"valve1": self.valve1, "valve2": self.valve2},
+                              direction, target, valve, step=self.protocol_step, cycle=self.protocol_cycle)
+
+    def inflate(self, time_or_pressure, value, valve, scheduler=None):
+        if time_or_pressure == "pressure":
+            self.pressure_target("inflate", value, valve)
+            print(f"Inflating {valve} for {time_or_pressure} with value {value}")
+            return
+
+        if time_or_pressure == "time" and scheduler is not None:
+            # Open and close on the protocol's planned timeline (see step_scheduler.py)
+            scheduler.pulse(lambda: self.set_valves("supply", valve), lambda: self.set_valves("neutral", valve),
+                            value, f"supply {valve}")
+            print(f"Inflating {valve} for {time_or_pressure} with value {value}")
+            return
+
+        self.set_valves("supply", valve)
+        time.sleep(value)
+
+        # Only close the valve(s) this step opened; the other one may belong to a parallel track
+        self.set_valves("neutral", valve)
         print(f"Inflating {valve} for {time_or_pressure} with value {value}")
 
     def smart_inflate(self, valve: str = "both", avg_secs: float = 5.0):
@@ -1712,34 +1805,31 @@ class App(ctk.CTk):
         self.target_pressure = self.avg_IAP
         self.target_time = dur
 
-    def deflate(self, time_or_pressure, value, valve):
-        # Open vent
-        if valve in ("valve1", "both"):
-            self.valve1.vent()
-        if valve in ("valve2", "both"):
-            self.valve2.vent()
+    def deflate(self, time_or_pressure, value, valve, scheduler=None):
+        if time_or_pressure.lower() == "pressure":
+            self.pressure_target("deflate", value, valve)
+            print(f"Deflating {valve} for {time_or_pressure} with value {value}")
+            return
 
-        if time_or_pressure.lower() == "time":
-            time.sleep(value)
-        elif time_or_pressure.lower() == "pressure":
-            # wait until pressure drops below target
-            while self.lps.pressure > value:
-                time.sleep(0.01)
+        if time_or_pressure.lower() == "time" and scheduler is not None:
+            scheduler.pulse(lambda: self.set_valves("vent", valve), lambda: self.set_valves("neutral", valve),
+                            value, f"vent {valve}")
+            print(f"Deflating {valve} for {time_or_pressure} with value {value}")
+            return
+
+        # Open vent
+        self.set_valves("vent", valve)
+        time.sleep(value)
 
         # Close vents (neutral)
-        self.valve1.neutral()
-        self.valve2.neutral()
+        self.set_valves("neutral", valve)
         print(f"Deflating {valve} for {time_or_pressure} with value {value}")
 
     def wait(self, wait_time):
         print(f"Waiting for {wait_time} seconds")
         time.sleep(wait_time)
 
-    def wait_for_user_input(self, command):
-        parts = command.split(":")[1].split(",")
-        popup_name = parts[0].strip()
-        variable_name = parts[1].strip()
-        response_type = parts[2].strip()
+    def wait_for_user_input(self, popup_name, variable_name, response_type):
 
         def on_submit():
             user_input = entry.get()
@@ -1753,8 +1843,7 @@ class App(ctk.CTk):
                 else:
                     raise ValueError("Invalid response type")
 
-                self.save_to_dict('set_vars', variable_name, user_input)
-                self.variable_saver(variable_name, user_input)
+                self.variables.persist(variable_name, user_input, response_type)
                 popup.destroy()
             except ValueError:
                 error_label.config(text=f"Invalid input type. Expected {response_type}.")
@@ -1798,33 +1887,8 @@ class App(ctk.CTk):
 
 
     def write_sensor_data_to_csv(self):
-        # Define the CSV file name
-        csv_file = 'data.csv'
-
-        # Open the CSV file in write mode
-        with open(csv_file, 'w', newline='') as file:
-            writer = csv.writer(file)
-
-            # Write the headers
-            headers = [
-                'time', 'LPS_pressure', 'LPS_temperature', 'pressure0', 'pressure0_convert',
-                'pressure1', 'pressure1_convert', 'pressure2', 'pressure2_convert',
-                'pressure3', 'valve1_state', 'valve2_state',
-                'self_target_pressure', 'self_target_time', 'clamp_state', 'self_protocol_step'
-            ]
-            writer.writerow(headers)
-
-            # Write the sensor data
-            for data in self.sensor_data:
-                row = [
-                    data['time'], data['LPS_pressure'], data['LPS_temperature'], data['pressure0'],
-                    data['pressure0_convert'],
-                    data['pressure1'], data['pressure1_convert'], data['pressure2'], data['pressure2_convert'],
-                    data['pressure3'], data['valve1_state'], data['valve2_state'],
-                    data['self_target_pressure'], data['self_target_time'], data['clamp_state'],
-                    data['self_protocol_step']
-                ]
-                writer.writerow(row)
+        # Samples were streamed to data.csv by read_sensors; make sure it is complete on disk
+        self.trial_writer.close()
 
     def show_overlay_notification(self, message, auto_dismiss_ms=5000):
         notification = ctk.CTkFrame(self, fg_color="green", corner_radius=10)
@@ -1857,6 +1921,9 @@ class App(ctk.CTk):
                     print(f"[read_sensors] Pressure data not available: {pressures}")
                     continue
                 pressure0, pressure1, pressure2, pressure3 = pressures
+                if self.calibrator is None or self.valve1 is None or self.valve2 is None:
+                    # Calibration models or valves are still coming up on the init threads
+                    continue
 
                 # Initialize data_packet so it's always defined
                 data_packet = None
@@ -1865,15 +1932,14 @@ class App(ctk.CTk):
                     if self.init is not None:
                         self.protocol_start_time = time.time()
                         time_diff = 0
-                        self.sensor_data = []  # Reset sensor data for the new protocol
+                        self.trial_writer.open()  # Start a fresh data.csv for the new protocol
                         self.init = None
                         self.clear_graph_data()
                         print("[read_sensors] Protocol started, sensor data reset.")
                     else:
                         time_diff = time.time() - self.protocol_start_time
 
-                    LPS_pressure = self.lps.pressure
-                    LPS_temperature = self.lps.temperature
+                    LPS_pressure, LPS_temperature = self.read_lps()
                     self.update_pressure_values()
                     (self.pressure0_convert, self.pressure1_convert, self.pressure2_convert) = self.pressure_sensor_converter(
                         pressure0, pressure1, pressure2, LPS_pressure, LPS_temperature)
@@ -1881,7 +1947,10 @@ class App(ctk.CTk):
                     valve1_state = self.valve1.get_state()
                     valve2_state = self.valve2.get_state()
 
-                    self.sensor_data.append({
+                    protocol_cycle = self.protocol_cycle
+                    self.step_metrics.add_sample(self.protocol_step, protocol_cycle, time_diff, self.pressure0_convert,
+                                                 self.pressure1_convert, self.pressure2_convert)
+                    self.trial_writer.write({
                         'time': time_diff,
                         'LPS_pressure': LPS_pressure,
                         'LPS_temperature': LPS_temperature,
@@ -1897,7 +1966,8 @@ class App(ctk.CTk):
                         'self_target_pressure': self.target_pressure,
                         'self_target_time': self.target_time,
                         'clamp_state': self.clamp_state,
-                        'self_protocol_step': self.protocol_step
+                        'self_protocol_step': self.protocol_step,
+                        'cycle': protocol_cycle
                     })
 
                     data_packet = {
@@ -1923,8 +1993,7 @@ class App(ctk.CTk):
                     seconds = int(time_diff % 60)
                     milliseconds = int((time_diff * 1000) % 1000)
 
-                    LPS_pressure = self.lps.pressure
-                    LPS_temperature = self.lps.temperature
+                    LPS_pressure, LPS_temperature = self.read_lps()
                     self.update_pressure_values()
                     (self.pressure0_convert,
                      self.pressure1_convert,
@@ -1933,25 +2002,6 @@ class App(ctk.CTk):
                     valve1_state = self.valve1.get_state()
                     valve2_state = self.valve2.get_state()
 
-                    self.sensor_data.append({
-                        'time': time_diff,
-                        'LPS_pressure': LPS_pressure,
-                        'LPS_temperature': LPS_temperature,
-                        'pressure0': pressure0,
-                        'pressure0_convert': self.pressure0_convert,
-                        'pressure1': pressure1,
-                        'pressure1_convert': self.pressure1_convert,
-                        'pressure2': pressure2,
-                        'pressure2_convert': self.pressure2_convert,
-                        'pressure3': pressure3,
-                        'valve1_state': valve1_state,
-                        'valve2_state': valve2_state,
-                        'self_target_pressure': self.target_pressure,
-                        'self_target_time': self.target_time,
-                        'clamp_state': self.clamp_state,
-                        'self_protocol_step': self.protocol_step
-                    })
-
                     data_packet = {
                         'step_count': self.protocol_step,
                         'current_input_pressure': self.pressure0_convert,
@@ -1967,6 +2017,7 @@ class App(ctk.CTk):
                     }
                 # Queue the data packet
                 if data_packet is not None:
+                    self.peak_controller.add_sample(time.monotonic(), self.pressure1_convert, self.pressure2_convert)
                     self.update_queue.put(data_packet)
         except Exception as e:
             print(f"[read_sensors] Error: {e}")
@@ -2005,7 +2056,7 @@ class App(ctk.CTk):
 
     def create_folder_with_files(self, provided_name=None, special=False):
         self.write_sensor_data_to_csv()
-        animal_id = self.get_from_dict('set_vars', 'animal_id')
+        animal_id = self.variables.get('animal_id')
         if animal_id is None:
             animal_id = "0000"
 
@@ -2055,12 +2106,8 @@ class App(ctk.CTk):
             else:
                 print(f"Error: Protocol file not found: {protocol_path}")
 
-        with open('data.csv', 'r') as file:
-            reader = csv.reader(file)
-            header = next(reader)
-            data = [row for row in reader]
-            self.total_time = data[-1][0]
-            self.total_steps = len(data[6])
+        # Totals come from the streaming writer, so data.csv does not have to be read back
+        self.total_time = self.trial_writer.last_time
 
         # Copy and rename `data.csv`
         data_csv_path = 'data.csv'
@@ -2071,6 +2118,16 @@ class App(ctk.CTk):
         else:
             print("Error: `data.csv` not found.")
 
+        # Planned vs. actual valve-edge times of the protocol run
+        if self.protocol_executor.scheduler.edges and os.path.exists("timing.csv"):
+            shutil.copy("timing.csv", os.path.join(folder_name, "timing.csv"))
+        # Close pressure and overshoot of every pressure-mode step
+        if self.pressure_controller.recorded and os.path.exists("pressure_targeting.csv"):
+            shutil.copy("pressure_targeting.csv", os.path.join(folder_name, "pressure_targeting.csv"))
+        # Smart step observations learned from during the run
+        if self.protocol_executor.learner.recorded and os.path.exists("timing_observations.csv"):
+            shutil.copy("timing_observations.csv", os.path.join(folder_name, "timing_observations.csv"))
+
         # check redis for selected_arm
         selected_arm = None
         if selected_arm is None:
@@ -2085,27 +2142,13 @@ class App(ctk.CTk):
             info_file.write(f"Total steps: {self.total_steps}\n")
             info_file.write(f"Animal ID: {animal_id}\n")
             info_file.write(f"Selected arm: {selected_arm}\n")
+            for name, entry in sorted(self.model_registry.in_use.items()):
+                info_file.write(f"Model {name}: {entry.label}\n")
+        self.model_registry.write_trial_record(folder_name)
 
-        # variables.txt
-        current_date =  datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        # get all from  def get_from_dict(self, dict_key, variable_name):
-        #         # Retrieve the dictionary from the class attribute
-        #         data_dict = self.data_dict.get(dict_key, {})
-        #
-        #         # Check if the variable name exists in the dictionary
-        #         if variable_name in data_dict:
-        #             return data_dict[variable_name]
-        #         else:
-        #             return None
-        set_vars = self.data_dict.get('set_vars', {})
-        with open('variables.txt', 'a') as file:
-            for key, value in set_vars.items():
-                file.write(f"{current_date}, {key}, {value}\n")
-        if os.path.exists('variables.txt'):
-            shutil.copy('variables.txt', os.path.join(folder_name, 'variables.txt'))
-        else:
-            print("Error: `variables.txt` not found.")
-        self.verify_and_wipe_data_csv('variables.txt', os.path.join(folder_name, 'variables.txt'))
+        # variables.txt: the saved values of the run and the final value of every variable,
+        # written straight into the trial folder by a background thread
+        self.variables.write_async(os.path.join(folder_name, 'variables.txt'))
 
         return True
 
@@ -2122,6 +2165,7 @@ class App(ctk.CTk):
 
     def on_closing(self):
         self.running = False
+        self.variables.wait_written()
         if hasattr(self, 'update_thread'):
             self.update_thread.join()
         self.destroy()
@@ -2131,11 +2175,8 @@ class App(ctk.CTk):
         pass
 
     def show_calibrate(self):
-        self.home_displayed = False  # Indicate that the home page is not displayed
-        self.clear_content_frame()
-        # Create a frame for the calibrate page
-        calibrate_frame = CalibratePage(self.content_frame, app=self)
-        calibrate_frame.pack(fill="both", expand=True, padx=20, pady=20)
+        # The calibrate page is built on first visit and cached afterwards
+        self.show_page("calibrate")
 
 
 if __name__ == "__main__":
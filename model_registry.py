@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Versioned registry of the trained models the app loads.
+
+model_registry.json lists every registered version of every model with the
+artifact's SHA-256, the hash of the data it was trained on, its metrics and
+its feature schema. Training scripts register what they dump; the app asks
+for models by name instead of by path.
+
+register() copies the artifact (and the NumPy-only export its loader reads,
+when there is one) to models/<name>/v<N>.<ext> next to the registry. The
+training scripts keep dumping to the same file, so every version keeps its
+own copy and an older version can still be loaded by number. The exports are
+not checked in (models/**/*.npz is ignored); `python model_registry.py
+export` writes them once at install time, the only step that needs
+scikit-learn.
+
+Loads are lazy and cached: prefetch() starts loading on a background thread
+as soon as the App is created, and load() only waits for what is not there
+yet. joblib artifacts are opened with mmap_mode="r", so their arrays are
+mapped instead of copied; "forest" and "compact" artifacts are read from
+their NumPy-only exports (compiled_forest.py, compact_calibrator.py). Every load is checked against the registered
+hash, and the versions the app used are written to each trial folder.
+
+Usage:
+    python model_registry.py list
+    python model_registry.py export
+    python model_registry.py register inflation_time inflation_time_model.pkl --loader forest \\
+        --features initial_pressure supply_pressure target_pressure --target duration
+"""
+import argparse
+import concurrent.futures
+import dataclasses
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional
+
+REGISTRY_PATH = Path(__file__).parent / "model_registry.json"
+
+LOADERS = ("joblib", "forest", "compact")
+MODELS_DIR = "models"  # versioned copies of the registered artifacts, next to the registry
+
+
+@dataclass
+class ModelVersion:
+    name: str
+    version: Optional[int]  # None: the artifact does not match any registered version
+    path: str  # relative to the registry file: models/<name>/v<version>.<ext>
+    sha256: str
+    created: str
+    loader: str = "joblib"
+    features: List[str] = field(default_factory=list)
+    target: Optional[str] = None
+    training_data: Optional[str] = None  # hash_files() of the training data
+    metrics: dict = field(default_factory=dict)
+
+    @property
+    def label(self):
+        version = f"v{self.version}" if self.version is not None else "unregistered"
+        return f"{self.name} {version} ({self.sha256[:12]})"
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_files(paths):
+    """One hash over the names and contents of `paths`, independent of their order."""
+    digest = hashlib.sha256()
+    for path in sorted(Path(p) for p in paths):
+        digest.update(path.name.encode())
+        digest.update(file_sha256(path).encode())
+    return digest.hexdigest()
+
+
+def export_path(path, loader):
+    """The NumPy-only export `loader` reads next to the artifact at `path`, or None."""
+    if loader == "forest":
+        from compiled_forest import compiled_path
+        return compiled_path(path)
+    if loader == "compact" and not str(path).endswith(".npz"):
+        from calibrating_pressure_transducers.compact_calibrator import compact_path
+        return compact_path(path)
+    return None
+
+
+class ModelRegistry:
+    def __init__(self, path=REGISTRY_PATH):
+        self.path = Path(path)
+        self.root = self.path.parent
+        self.in_use = {}  # name -> ModelVersion of the model load() returned
+        self._lock = threading.Lock()
+        self._futures = {}  # (name, version) -> Future of (ModelVersion, model)
+        self._pool = None
+        self._versions = self._read()
+
+    def _read(self):
+        if not self.path.exists():
+            return {}
+        with open(self.path) as file:
+            data = json.load(file)
+        return {name: [ModelVersion(**entry) for entry in entries]
+                for name, entries in data.get("models", {}).items()}
+
+    def _write(self):
+        data = {"models": {name: [dataclasses.asdict(v) for v in versions]
+                           for name, versions in sorted(self._versions.items())}}
+        tmp_path = self.path.with_suffix(".json.tmp")
+        with open(tmp_path, "w") as file:
+            json.dump(data, file, indent=2)
+            file.write("\n")
+        os.replace(tmp_path, self.path)
+
+    def names(self):
+        return sorted(self._versions)
+
+    def versions(self, name):
+        return list(self._versions.get(name, []))
+
+    def get(self, name, version=None):
+        """The registered ModelVersion (the latest one when `version` is None)."""
+        versions = self._versions.get(name)
+        if not versions:
+            raise KeyError(f"model '{name}' is not registered in {self.path.name}")
+        if version is None:
+            return versions[-1]
+        for entry in versions:
+            if entry.version == version:
+                return entry
+        raise KeyError(f"model '{name}' has no version {version}")
+
+    def register(self, name, path, features=(), target=None, loader="joblib",
+                 training_files=(), metrics=None):
+        """
+        Copy the artifact at `path` to models/<name>/v<N> as the next version of `name` and save the registry.
+        An artifact identical to the latest version is not registered again.
+
+        :param training_files: The data files it was trained on, hashed into training_data.
+        :return: the new ModelVersion
+        """
+        if loader not in LOADERS:
+            raise ValueError(f"unknown loader {loader!r}, expected one of {', '.join(LOADERS)}")
+        path = Path(path).resolve()
+        with self._lock:
+            self._versions = self._read()  # another script may have registered meanwhile
+            versions = self._versions.setdefault(name, [])
+            sha256 = file_sha256(path)
+            if versions and versions[-1].sha256 == sha256:
+                # Training is deterministic: the same data gives the same artifact
+                print(f"{versions[-1].label} is unchanged")
+                return versions[-1]
+            version = versions[-1].version + 1 if versions else 1
+            stored = self._store(name, version, path, loader)
+            entry = ModelVersion(
+                name=name,
+                version=version,
+                path=stored.relative_to(self.root).as_posix(),
+                sha256=sha256,
+                created=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                loader=loader,
+                features=list(features),
+                target=target,
+                training_data=hash_files(training_files) if training_files else None,
+                metrics={key: float(value) for key, value in (metrics or {}).items()},
+            )
+            versions.append(entry)
+            self._write()
+        print(f"Registered {entry.label}")
+        return entry
+
+    def _store(self, name, version, path, loader):
+        """Copy the artifact and its export to models/<name>/v<version><ext>; returns the copy's path."""
+        folder = self.root / MODELS_DIR / name
+        folder.mkdir(parents=True, exist_ok=True)
+        stored = folder / f"v{version}{path.suffix}"
+        shutil.copy2(path, stored)
+        export = export_path(path, loader)
+        # copy2 keeps the modification times, so the loader still sees the export as up to date
+        if export and os.path.exists(export) and os.path.getmtime(export) >= os.path.getmtime(path):
+            shutil.copy2(export, export_path(stored, loader))
+        return stored
+
+    def export(self):
+        """Write the missing NumPy-only exports of every registered forest and compact version."""
+        for name in self.names():
+            for entry in self.versions(name):
+                export = export_path(self.root / entry.path, entry.loader)
+                if export is not None and not os.path.exists(export):
+                    self._load(name, entry.version)  # the loaders save the export they build
+                    print(f"Exported {entry.label} to {os.path.relpath(export, self.root)}")
+
+    def prefetch(self, *names):
+        """Start loading the latest version of `names` on a background thread."""
+        for name in names:
+            self._submit(name, None)
+
+    def load(self, name, version=None):
+        """The model object, loaded once; waits for a prefetch of it that is still running."""
+        future = self._submit(name, version)
+        try:
+            entry, model = future.result()
+        except Exception:
+            with self._lock:
+                self._futures.pop((name, version), None)  # let the next load() try again
+            raise
+        self.in_use[name] = entry
+        return model
+
+    def _submit(self, name, version):
+        with self._lock:
+            future = self._futures.get((name, version))
+            if future is None:
+                if self._pool is None:
+                    self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=2,
+                                                                       thread_name_prefix="models")
+                future = self._futures[(name, version)] = self._pool.submit(self._load, name, version)
+            return future
+
+    def _load(self, name, version):
+        entry = self.get(name, version)
+        path = self.root / entry.path
+        digest = file_sha256(path)
+        if digest != entry.sha256:
+            print(f"Warning: {path} does not match registered {entry.label}; recording it as unregistered")
+            entry = dataclasses.replace(entry, version=None, sha256=digest)
+        if entry.loader == "forest":
+            from compiled_forest import load_forest
+            model = load_forest(path)
+        elif entry.loader == "compact":
+            from calibrating_pressure_transducers.compact_calibrator import load_calibrator
+            model = load_calibrator(path)
+        else:
+            import joblib
+            model = joblib.load(path, mmap_mode="r")
+        print(f"Loaded {entry.label}")
+        return entry, model
+
+    def write_trial_record(self, folder):
+        """models.json in a trial folder: the full record of every model the run used."""
+        with open(os.path.join(folder, "models.json"), "w") as file:
+            json.dump({name: dataclasses.asdict(entry) for name, entry in sorted(self.in_use.items())},
+                      file, indent=2)
+            file.write("\n")
+
+
+def parse_metric(text):
+    name, sep, value = text.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"expected name=value, got {text!r}")
+    return name.strip(), float(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List or register versions of the app's trained models.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="Show every registered model version")
+    commands.add_parser("export", help="Write the NumPy-only exports the app loads (needs scikit-learn)")
+    register = commands.add_parser("register", help="Register an artifact as the next version of a model")
+    register.add_argument("name")
+    register.add_argument("path")
+    register.add_argument("--loader", choices=LOADERS, default="joblib")
+    register.add_argument("--features", nargs="*", default=[])
+    register.add_argument("--target")
+    register.add_argument("--data", nargs="*", default=[], help="Training data files to hash")
+    register.add_argument("--metric", type=parse_metric, action="append", default=[], metavar="NAME=VALUE")
+    args = parser.parse_args()
+
+    registry = ModelRegistry()
+    if args.command == "register":
+        registry.register(args.name, args.path, features=args.features, target=args.target,
+                          loader=args.loader, training_files=args.data, metrics=dict(args.metric))
+        return
+    if args.command == "export":
+        registry.export()
+        return
+    for name in registry.names():
+        for entry in registry.versions(name):
+            metrics = ", ".join(f"{k}={v:.4g}" for k, v in entry.metrics.items()) or "no metrics"
+            print(f"{entry.label:<44} {entry.created}  {entry.path}  [{', '.join(entry.features)}]  {metrics}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Online learning of the Smart step timing models from the steps a protocol runs.
+
+The inflation and deflation time models are trained offline from the
+calibrate page's summary CSVs and then never change, so a rig that drifts
+from its calibration keeps making the same timing error every cycle. Every
+SmartInflateML/SmartDeflateML step is an observation in the same form as the
+training data: the pressures it started from, the time it commanded and the
+pressure that time achieved, which the next Smart step measures anyway.
+
+OnlineTimingLearner collects those observations and, on a worker thread,
+fits a recursive least squares correction of the shipped model's residual
+(with forgetting, so recent cycles weigh most). A corrected model is only
+published while its error on the observations it had not yet seen is lower
+than the shipped model's; otherwise the shipped model stays in use. The
+executor takes the published models between cycles, so a step never sees
+the model change under it.
+
+Observations are written to timing_observations.csv with the summary CSV
+column names, so they can be added to the offline training data.
+"""
+import collections
+import csv
+import math
+import queue
+import threading
+import time
+
+INFLATION = "inflation"
+DEFLATION = "deflation"
+
+LOG_HEADER = ["time", "model", "step", "cycle", "valve", "avg_pre", "avg_in", "avg_post",
+              "duration_s", "shipped_s", "online_s"]
+
+Observation = collections.namedtuple("Observation", "model step cycle valve avg_pre avg_in avg_post duration")
+
+
+class ResidualRLS:
+    """
+    Recursive least squares fit of residual ~ w . [1, x...] with exponential forgetting.
+
+    :param forgetting: Weight kept by an observation per newer observation (1 = never forget).
+    :param prior: Initial covariance; small values keep the correction near zero for longer.
+    """
+
+    def __init__(self, n_features, forgetting=0.95, prior=1.0):
+        self.n = n_features + 1
+        self.forgetting = forgetting
+        self.prior = prior
+        self.weights = [0.0] * self.n
+        self.P = [[prior if i == j else 0.0 for j in range(self.n)] for i in range(self.n)]
+
+    def predict(self, features):
+        return sum(w * x for w, x in zip(self.weights, (1.0, *features)))
+
+    def update(self, features, residual):
+        x = (1.0, *features)
+        P = self.P
+        Px = [sum(P[i][j] * x[j] for j in range(self.n)) for i in range(self.n)]
+        gain_denominator = self.forgetting + sum(x[i] * Px[i] for i in range(self.n))
+        k = [v / gain_denominator for v in Px]
+        error = residual - self.predict(features)
+        self.weights = [w + ki * error for w, ki in zip(self.weights, k)]
+        # Only forget while the covariance is bounded, or it winds up when inputs repeat
+        forget = self.forgetting if sum(P[i][i] for i in range(self.n)) < self.prior * self.n else 1.0
+        self.P = [[(P[i][j] - k[i] * Px[j]) / forget for j in range(self.n)] for i in range(self.n)]
+
+
+class CorrectedModel:
+    """The shipped model plus a frozen residual correction, with sklearn's predict() call shape."""
+
+    def __init__(self, shipped, weights, max_correction):
+        self.shipped = shipped
+        self.weights = tuple(weights)
+        self.max_correction = max_correction
+
+    def predict(self, rows):
+        out = []
+        for row in rows:
+            base = float(self.shipped.predict([row])[0])
+            correction = sum(w * x for w, x in zip(self.weights, (1.0, *row)))
+            limit = self.max_correction * abs(base)
+            out.append(max(base + min(max(correction, -limit), limit), 0.0))
+        return out
+
+
+class OnlineTimingModel:
+    """
+    One timing model (inflation or deflation) learning from its observations.
+
+    :param min_observations: Observations before a corrected model may be published.
+    :param window: Number of recent observations whose errors decide between the models.
+    :param max_correction: Largest correction as a fraction of the shipped prediction.
+    """
+
+    def __init__(self, name, shipped, n_features=3, min_observations=3, window=10,
+                 forgetting=0.95, max_correction=1.0):
+        self.name = name
+        self.shipped = shipped
+        self.n_features = n_features
+        self.min_observations = min_observations
+        self.max_correction = max_correction
+        self.rls = ResidualRLS(n_features, forgetting)
+        self.observations = 0
+        self.shipped_errors = collections.deque(maxlen=window)
+        self.online_errors = collections.deque(maxlen=window)
+        self.published = None  # CorrectedModel in use, None = the shipped model
+
+    def current(self):
+        return self.published or self.shipped
+
+    def candidate(self):
+        return CorrectedModel(self.shipped, self.rls.weights, self.max_correction)
+
+    def learn(self, features, duration):
+        """
+        Score the shipped and the corrected model on an observation they have not seen,
+        then update the correction. Returns (shipped prediction, corrected prediction).
+        """
+        shipped_s = float(self.shipped.predict([features])[0])
+        online_s = self.candidate().predict([features])[0]
+        self.shipped_errors.append(abs(duration - shipped_s))
+        self.online_errors.append(abs(duration - online_s))
+        self.observations += 1
+
+        self.rls.update(features, duration - shipped_s)
+        if not all(math.isfinite(w) for w in self.rls.weights):
+            print(f"[online-{self.name}] correction diverged, starting over")
+            self.rls = ResidualRLS(self.n_features, self.rls.forgetting)
+            self.published = None
+            return shipped_s, online_s
+
+        if (self.observations >= self.min_observations
+                and sum(self.online_errors) < sum(self.shipped_errors)):
+            self.published = self.candidate()
+        else:
+            self.published = None
+        return shipped_s, online_s
+
+    def mean_errors(self):
+        """(shipped, online) mean absolute error over the recent observations, in seconds."""
+        n = len(self.shipped_errors)
+        if n == 0:
+            return None, None
+        return sum(self.shipped_errors) / n, sum(self.online_errors) / n
+
+
+class OnlineTimingLearner:
+    """
+    :param log_path: Stream every observation to this CSV (None = do not log).
+    :param threaded: Learn on a worker thread; the simulator learns inline to stay deterministic.
+    """
+
+    def __init__(self, log_path=None, threaded=True, clock=time.time, **model_options):
+        self.log_path = log_path
+        self.threaded = threaded
+        self.clock = clock
+        self.model_options = model_options
+        self.models = {}
+        self.recorded = 0
+        self._pending = None
+        self._queue = queue.Queue()
+        self._worker = None
+        self._file = None
+        self._writer = None
+
+    def start(self, inflation_model, deflation_model):
+        """Begin a protocol run from the shipped models (a model may be None)."""
+        self.stop()
+        self.models = {
+            name: OnlineTimingModel(name, shipped, **self.model_options)
+            for name, shipped in ((INFLATION, inflation_model), (DEFLATION, deflation_model))
+            if shipped is not None
+        }
+        self.recorded = 0
+        self._pending = None
+        if self.log_path:
+            self._file = open(self.log_path, "w", newline="")
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(LOG_HEADER)
+        if self.threaded:
+            self._worker = threading.Thread(target=self._work, daemon=True)
+            self._worker.start()
+
+    def stop(self):
+        """Learn what is still queued and close the log."""
+        self._pending = None
+        if self._worker is not None:
+            self._queue.put(None)
+            self._worker.join()
+            self._worker = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._writer = None
+
+    def current_models(self):
+        """(inflation, deflation) to use for the next cycle: published corrections or the shipped models."""
+        inflation = self.models.get(INFLATION)
+        deflation = self.models.get(DEFLATION)
+        return (inflation.current() if inflation else None,
+                deflation.current() if deflation else None)
+
+    def expect(self, model, step, cycle, valve, duration, **pressures):
+        """
+        A Smart step commanded `duration` seconds; its outcome is the pressure the next
+        Smart step measures (see outcome()).
+
+        :param pressures: avg_pre and avg_in for inflation, avg_post and avg_in for deflation.
+        """
+        self._pending = (model, step, cycle, valve, duration, pressures)
+
+    @property
+    def pending_valve(self):
+        """Valve of the step waiting for its outcome, or None."""
+        return self._pending[3] if self._pending is not None else None
+
+    def outcome(self, pressure):
+        """
+        The pressure the pending step achieved, on the balloon(s) it drove (see
+        ProtocolExecutor.valve_pressure); completes its observation.
+        """
+        if self._pending is None:
+            return
+        model, step, cycle, valve, duration, pressures = self._pending
+        self._pending = None
+        if model == INFLATION:
+            pressures = dict(pressures, avg_post=pressure)
+        else:
+            pressures = dict(pressures, avg_pre=pressure)
+        observation = Observation(model, step, cycle, valve, duration=duration, **pressures)
+        if self.threaded and self._worker is not None:
+            self._queue.put(observation)
+        else:
+            self._learn(observation)
+
+    def discard(self):
+        """Drop the pending observation (another step changed the pressure in between)."""
+        self._pending = None
+
+    def summary(self):
+        """{model: (observations, shipped MAE, online MAE, correction in use)}"""
+        return {name: (m.observations, *m.mean_errors(), m.published is not None)
+                for name, m in self.models.items()}
+
+    def _work(self):
+        while True:
+            observation = self._queue.get()
+            if observation is None:
+                return
+            try:
+                self._learn(observation)
+            except Exception as e:
+                print(f"[online] learning failed: {e}")
+
+    def _learn(self, o):
+        timing = self.models.get(o.model)
+        if timing is None:
+            return
+        # Same feature order as the offline models
+        if o.model == INFLATION:
+            features = [o.avg_pre, o.avg_in, o.avg_post]
+        else:
+            features = [o.avg_post, o.avg_pre, o.avg_in]
+        shipped_s, online_s = timing.learn(features, o.duration)
+        self.recorded += 1
+        if self._writer is not None:
+            self._writer.writerow([self.clock(), o.model, o.step, o.cycle or "", o.valve, o.avg_pre, o.avg_in,
+                                   o.avg_post, o.duration, shipped_s, online_s])
+            self._file.flush()
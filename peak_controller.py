@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Cycle-to-cycle correction of SmartInflateML inflation times.
+
+A SmartInflateML step predicts one open-loop inflation time from the timing
+model and never looks at the peak it reached, so a repetitive cough
+protocol repeats the same miss every cycle. PeakController closes that loop
+run to run (iterative learning control):
+
+- every Smart inflation pulse is tracked, per valve, until the next valve
+  command, and the highest balloon pressure it produced is its peak
+- the error to the target is turned into a time correction through the
+  pneumatic flow model, dp/dt = k * sqrt(supply - p) at the peak reached;
+  without a fitted model the slope between the last two cycles (or the
+  pulse's average rate) stands in for it
+- the correction is added, scaled by `gain` < 1 so it approaches the target
+  from one side instead of overshooting, to a per-step, per-valve offset on
+  top of the model's prediction; changes are limited to `max_change` of the
+  commanded time
+
+Each (step, valve) keeps its own offset, so a Repeat block converges per
+Smart step and per balloon while the model still follows changes in the
+starting and supply pressures.
+
+The offsets are relative to the model they were learned on. When the
+executor swaps in an updated model (online_timing_learner.py learns from the
+same peaks), rebase() moves each offset so the time planned for the step's
+last inputs stays the same; the new model then takes over whatever part of
+the correction it has learned instead of getting it added a second time.
+"""
+import os
+import threading
+from pathlib import Path
+
+# Written by: python protocol_simulator.py protocol.txt --fit data/<trial> ... --save-plant pneumatic_plant.json
+PLANT_PATH = Path(__file__).parent / "pneumatic_plant.json"
+
+VALVES_OF = {"valve1": ("valve1",), "valve2": ("valve2",), "both": ("valve1", "valve2")}
+
+
+class ValveState:
+    def __init__(self):
+        self.offset = 0.0  # seconds added to the model's time
+        self.last = None  # (commanded seconds, peak) of the previous cycle
+        self.cycles = 0
+        self.inputs = None  # model row and prediction of the last plan(), for rebase()
+        self.model_seconds = None
+
+
+class Pulse:
+    def __init__(self, step, cycle, valve, target, seconds, start_pressure, supply_pressure):
+        self.step = step
+        self.cycle = cycle
+        self.target = target
+        self.seconds = seconds
+        self.start_pressure = start_pressure
+        self.supply_pressure = supply_pressure
+        self.peaks = {name: None for name in VALVES_OF[valve]}
+
+
+class PeakController:
+    """
+    :param plant: Pneumatic model with rate(valve, "supply", pressure, supply_pressure), e.g. a fitted
+        protocol_simulator.PneumaticPlant; None to estimate the slope from the cycles themselves.
+    :param gain: Fraction of the estimated correction applied per cycle.
+    :param max_change: Largest change per cycle as a fraction of the commanded time.
+    :param tolerance: Peak error (psi) that is left alone.
+    """
+
+    def __init__(self, plant=None, gain=0.7, max_change=0.5, tolerance=0.02):
+        self.plant = plant
+        self.gain = gain
+        self.max_change = max_change
+        self.tolerance = tolerance
+        self.states = {}  # (step index, valve) -> ValveState
+        self.history = []  # (step, cycle, valve, target, seconds, peak) of every tracked pulse
+        self._armed = []
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """Forget what earlier protocol runs learned."""
+        with self._lock:
+            self.states = {}
+            self.history = []
+            self._armed = []
+
+    def plan(self, step, valve, model_seconds, inputs=None):
+        """
+        Inflation time for this cycle: the model's time plus what the earlier cycles learned.
+
+        :param inputs: The model row `model_seconds` was predicted from, kept for rebase().
+        """
+        self.settle()
+        offsets = []
+        for name in VALVES_OF[valve]:
+            state = self.states.setdefault((step, name), ValveState())
+            state.inputs, state.model_seconds = inputs, model_seconds
+            if state.cycles:
+                offsets.append(state.offset)
+        offset = sum(offsets) / len(offsets) if offsets else 0.0
+        return max(model_seconds + offset, 0.0)
+
+    def rebase(self, model):
+        """Express the offsets relative to `model`, the inflation model the next cycles use."""
+        self.settle()
+        with self._lock:
+            for state in self.states.values():
+                if not state.cycles or state.inputs is None:
+                    continue
+                seconds = float(model.predict([state.inputs])[0])
+                state.offset += state.model_seconds - seconds
+                state.model_seconds = seconds
+
+    def arm(self, step, cycle, valve, target, seconds, start_pressure, supply_pressure):
+        """Track the peak of the pulse that is about to start."""
+        with self._lock:
+            self._armed.append(Pulse(step, cycle, valve, target, seconds, start_pressure, supply_pressure))
+
+    def add_sample(self, t, pressure1, pressure2):
+        if not self._armed:
+            return
+        with self._lock:
+            for pulse in self._armed:
+                peaks = pulse.peaks
+                for name, pressure in (("valve1", pressure1), ("valve2", pressure2)):
+                    if name in peaks and pressure is not None and (peaks[name] is None or pressure > peaks[name]):
+                        peaks[name] = pressure
+
+    def settle(self):
+        """Learn from the tracked pulses; call before the valves are driven again."""
+        with self._lock:
+            armed, self._armed = self._armed, []
+        for pulse in armed:
+            for name, peak in pulse.peaks.items():
+                if peak is not None:
+                    self._learn(pulse, name, peak)
+
+    def _learn(self, pulse, valve, peak):
+        state = self.states.setdefault((pulse.step, valve), ValveState())
+        self.history.append((pulse.step, pulse.cycle, valve, pulse.target, pulse.seconds, peak))
+        state.cycles += 1
+        error = pulse.target - peak
+        rate = self._rate(valve, peak, pulse, state)
+        state.last = (pulse.seconds, peak)
+        if abs(error) <= self.tolerance or rate <= 0:
+            return
+        limit = self.max_change * max(pulse.seconds, 0.05)
+        state.offset += min(max(self.gain * error / rate, -limit), limit)
+
+    def _rate(self, valve, peak, pulse, state):
+        """d(peak)/d(seconds) at this operating point."""
+        if self.plant is not None:
+            return self.plant.rate(valve, "supply", peak, pulse.supply_pressure)
+        if state.last is not None:
+            seconds, last_peak = state.last
+            if abs(pulse.seconds - seconds) > 1e-3:
+                slope = (peak - last_peak) / (pulse.seconds - seconds)
+                if slope > 0:
+                    return slope
+        return (peak - pulse.start_pressure) / pulse.seconds if pulse.seconds > 0 else 0.0
+
+    def summary(self):
+        """{(step, valve): (cycles, first peak error, last peak error)} in psi."""
+        out = {}
+        for step, cycle, valve, target, seconds, peak in self.history:
+            cycles, first, _ = out.get((step, valve), (0, target - peak, None))
+            out[(step, valve)] = (cycles + 1, first, target - peak)
+        return out
+
+
+def load_pneumatic_plant(path=PLANT_PATH):
+    """The fitted PneumaticPlant saved at `path`, or None when there is none."""
+    if not os.path.exists(path):
+        return None
+    from protocol_simulator import PneumaticPlant
+    try:
+        return PneumaticPlant.load(path)
+    except (OSError, ValueError, TypeError) as e:
+        print(f"Ignoring pneumatic model {path}: {e}")
+        return None
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Closed-loop pressure targeting for "Inflate: pressure" / "Deflate: pressure".
+
+Instead of polling a sensor from the protocol thread, the controller
+subscribes to the PressureReceiver sample stream (~100 Hz from the Pi 3),
+converts each raw sample of the balloon sensor that belongs to an open valve
+and closes that valve from the receiver thread as soon as the target is
+reached. Valves and tubing keep moving air for a few tens of milliseconds
+after the close command, so the crossing is predicted `lead_seconds` ahead
+from the current slope. After closing, the pressure is followed for
+`settle_seconds` to measure the overshoot. If the stream stops (receiver
+disconnected, Pi restarted) or its samples cannot be converted, the open
+valves are closed once no sample has been converted for `stale_seconds`
+instead of supplying blind until the timeout. Per-valve overshoot
+statistics are kept as running totals and every result is streamed to
+pressure_targeting.csv, so long protocols do not accumulate results in memory.
+"""
+import collections
+import csv
+import threading
+import time
+
+# valve name -> (calibrated sensor name, raw channel index in PressureReceiver.getpressures())
+VALVE_SENSORS = {
+    "valve1": ("pressure1", 1),
+    "valve2": ("pressure2", 2),
+}
+
+
+class ChannelTarget:
+    """State and result of one valve driving one balloon towards a target."""
+
+    def __init__(self, valve_name, valve, sensor, channel, direction, target, slope_samples):
+        self.valve_name = valve_name
+        self.valve = valve
+        self.sensor = sensor
+        self.channel = channel
+        self.direction = direction
+        self.target = target
+        self.samples = collections.deque(maxlen=slope_samples)
+        self.opened_at = None
+        self.start_pressure = None
+        self.closed_at = None
+        self.close_pressure = None
+        self.predicted = None
+        self.extreme = None  # highest (inflate) or lowest (deflate) pressure after closing
+        self.timed_out = False
+        self.settled = False
+        self.step = None
+        self.cycle = None
+
+    def slope(self):
+        """Least-squares slope (psi/s) over the most recent samples."""
+        n = len(self.samples)
+        if n < 2:
+            return 0.0
+        mean_t = sum(t for t, _ in self.samples) / n
+        mean_p = sum(p for _, p in self.samples) / n
+        var_t = sum((t - mean_t) ** 2 for t, _ in self.samples)
+        if var_t <= 0:
+            return 0.0
+        return sum((t - mean_t) * (p - mean_p) for t, p in self.samples) / var_t
+
+    def reached(self, pressure):
+        if self.direction == "inflate":
+            return pressure >= self.target
+        return pressure <= self.target
+
+    @property
+    def overshoot(self):
+        """Signed distance past the target (positive = went too far)."""
+        if self.extreme is None:
+            return None
+        if self.direction == "inflate":
+            return self.extreme - self.target
+        return self.target - self.extreme
+
+    @property
+    def time_to_close(self):
+        if self.closed_at is None or self.opened_at is None:
+            return None
+        return self.closed_at - self.opened_at
+
+
+class PressureTargetController:
+    """
+    :param convert: convert(sensor_name, raw_value) -> calibrated psi.
+    :param subscribe/unsubscribe: Register a callback(t, pressures) on the sample stream.
+    :param lead_seconds: How far ahead the crossing is predicted (valve + pneumatic dead time).
+    :param timeout: Seconds after which the valves are closed even if the target was not reached.
+    :param settle_seconds: How long the pressure is followed after closing to measure overshoot.
+    :param stale_seconds: Seconds without a converted sample after which the open valves are closed.
+    :param wait: wait(event, seconds) -> bool, as threading.Event.wait; the simulator advances its
+        virtual clock instead.
+    """
+
+    def __init__(self, convert, subscribe, unsubscribe, lead_seconds=0.05, timeout=30.0,
+                 settle_seconds=0.5, slope_samples=5, stale_seconds=1.0, clock=time.monotonic, wait=None):
+        self.convert = convert
+        self.subscribe = subscribe
+        self.unsubscribe = unsubscribe
+        self.lead_seconds = lead_seconds
+        self.timeout = timeout
+        self.settle_seconds = settle_seconds
+        self.stale_seconds = stale_seconds
+        self.slope_samples = slope_samples
+        self.clock = clock
+        self.wait = wait or (lambda event, seconds: event.wait(seconds))
+        self.results = []  # finished ChannelTargets, only kept when not logging to a file
+        self._pending = []  # channels of the latest run, recorded once they have settled
+        self._stats = {}
+        self._listener = None
+        self._log_file = None
+        self._log = None
+        self._lock = threading.RLock()
+
+    HEADER = ["step", "cycle", "valve", "direction", "target", "start_pressure", "close_pressure",
+              "predicted", "extreme", "overshoot", "time_to_close_s", "timed_out"]
+
+    def run(self, valves, direction, target, valve="both", step=None, cycle=None):
+        """
+        Open the selected valve(s) and block until each has closed on target or timed out.
+
+        :param valves: dict valve name -> ValveController.
+        :param direction: "inflate" (supply) or "deflate" (vent).
+        :return: list of ChannelTarget, one per valve.
+        """
+        self.release()
+        names = list(VALVE_SENSORS) if valve == "both" else [valve]
+        channels = []
+        for name in names:
+            sensor, channel = VALVE_SENSORS[name]
+            target_channel = ChannelTarget(name, valves[name], sensor, channel, direction, target,
+                                           self.slope_samples)
+            target_channel.step = step
+            target_channel.cycle = cycle
+            channels.append(target_channel)
+        all_closed = threading.Event()
+        lead = self.lead_seconds
+        settle = self.settle_seconds
+        last_sample = [self.clock()]
+
+        def on_sample(t, pressures):
+            with self._lock:
+                for ch in channels:
+                    if ch.settled or ch.opened_at is None:
+                        continue
+                    pressure = self.convert(ch.sensor, pressures[ch.channel])
+                    # Only a sample that converts counts as fresh; a failing calibrator looks like no stream
+                    last_sample[0] = self.clock()
+                    if ch.closed_at is None:
+                        if ch.start_pressure is None:
+                            ch.start_pressure = pressure
+                        ch.samples.append((t, pressure))
+                        predicted = pressure + ch.slope() * lead
+                        if ch.reached(predicted):
+                            ch.valve.neutral()
+                            ch.closed_at, ch.close_pressure, ch.predicted = t, pressure, predicted
+                    else:
+                        if ch.extreme is None or (pressure > ch.extreme if direction == "inflate"
+                                                  else pressure < ch.extreme):
+                            ch.extreme = pressure
+                        if t - ch.closed_at >= settle:
+                            ch.settled = True
+                if all(ch.closed_at is not None for ch in channels):
+                    all_closed.set()
+                if all(ch.settled for ch in channels) and self._listener is on_sample:
+                    self.release()
+
+        with self._lock:
+            self._pending = channels
+            self._listener = on_sample
+        self.subscribe(on_sample)
+        action = "supply" if direction == "inflate" else "vent"
+        for ch in channels:
+            ch.opened_at = self.clock()
+            getattr(ch.valve, action)()
+
+        deadline = self.clock() + self.timeout
+        while not self.wait(all_closed, min(self.stale_seconds, self.timeout) / 2):
+            now = self.clock()
+            if now - last_sample[0] >= self.stale_seconds:
+                reason = f"received no usable pressure sample for {self.stale_seconds} s"
+            elif now >= deadline:
+                reason = f"did not reach {target} PSI within {self.timeout} s"
+            else:
+                continue
+            with self._lock:
+                for ch in channels:
+                    if ch.closed_at is None:
+                        ch.valve.neutral()
+                        ch.closed_at = self.clock()
+                        ch.timed_out = True
+                        print(f"[pressure] {ch.valve_name} {reason}; closed")
+            break
+
+        for ch in channels:
+            if not ch.timed_out:
+                print(f"[pressure] {ch.valve_name} closed at {ch.close_pressure:.3f} PSI "
+                      f"(predicted {ch.predicted:.3f}, target {target}) after {ch.time_to_close:.3f} s")
+        return channels
+
+    def release(self):
+        """Stop following the stream and record the latest run (with the overshoot seen so far)."""
+        with self._lock:
+            if self._listener is not None:
+                self.unsubscribe(self._listener)
+                self._listener = None
+            for ch in self._pending:
+                self._record(ch)
+            self._pending = []
+
+    def _record(self, ch):
+        # [results, overshoot sum, overshoots, max |overshoot|, timeouts]
+        stats = self._stats.setdefault(ch.valve_name, [0, 0.0, 0, 0.0, 0])
+        stats[0] += 1
+        if ch.timed_out:
+            stats[4] += 1
+        elif ch.overshoot is not None:
+            stats[1] += ch.overshoot
+            stats[2] += 1
+            stats[3] = max(stats[3], abs(ch.overshoot))
+        if self._log is not None:
+            self._log.writerow(self._row(ch))
+            self._log_file.flush()
+        else:
+            self.results.append(ch)
+
+    def overshoot_stats(self):
+        """Return {valve: (count, mean overshoot, max |overshoot|, timeouts)} over all recorded results."""
+        stats = {}
+        for name in VALVE_SENSORS:
+            count, total, n, max_abs, timeouts = self._stats.get(name, [0, 0.0, 0, 0.0, 0])
+            stats[name] = (count, total / n if n else 0.0, max_abs, timeouts)
+        return stats
+
+    @property
+    def recorded(self):
+        return sum(stats[0] for stats in self._stats.values())
+
+    def reset(self, log_path=None):
+        """
+        Forget previous results and start a new run.
+
+        :param log_path: If given, results are streamed to this CSV instead of kept in `results`.
+        """
+        self.release()
+        self.close_log()
+        self.results = []
+        self._stats = {}
+        if log_path is not None:
+            self._log_file = open(log_path, "w", newline="")
+            self._log = csv.writer(self._log_file)
+            self._log.writerow(self.HEADER)
+
+    def close_log(self):
+        with self._lock:
+            if self._log_file is not None:
+                self._log_file.close()
+                self._log_file = None
+                self._log = None
+
+    @staticmethod
+    def _row(r):
+        return [r.step, r.cycle or "", r.valve_name, r.direction, r.target, r.start_pressure,
+                r.close_pressure, r.predicted, r.extreme, r.overshoot, r.time_to_close, r.timed_out]
+
+    def write_csv(self, path):
+        """Write the results kept in memory (used when reset() was not given a log_path)."""
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(self.HEADER)
+            for r in self.results:
+                writer.writerow(self._row(r))
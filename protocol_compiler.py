@@ -0,0 +1,553 @@
+#!/usr/bin/env python3
+"""
+Protocol compiler for MeshAlyzer protocol files (./protocols/*.txt).
+
+A protocol is one command per line, e.g.
+
+    wait: 4
+    Inflate: time, 0.45, both
+    Deflate: pressure, 0.2, valve1, max_force, peak
+    SmartInflateML: 1.4, both
+    SmartDeflateML: both
+    Wait_for_user_input: Sample weight, weight, float
+    Repeat 10000 as cycle {
+        Inflate: time, 0.45, both
+        wait: 0.1
+        Deflate: time, 2.7, both
+    }
+    Parallel {
+        Track valve1 {
+            Inflate: time, 1, valve1
+            Sync: loaded
+            Deflate: time, 1, valve1
+        }
+        Track valve2 {
+            Wait: 0.5
+            Inflate: time, 0.5, valve2
+            Sync: loaded
+            Deflate: time, 1, valve2
+        }
+    }
+    End:
+
+The whole file is tokenized and validated once, before anything runs, into
+an immutable CompiledProtocol of typed steps. Keywords, modes and valve names
+are case-insensitive. Numeric arguments are resolved at compile time;
+arguments that name a protocol variable or are a "(expression)" of
+variables are compiled into an Expression (see variable_store.py) and
+evaluated by the executor when the step runs. Any error is
+raised as a ProtocolError that carries the offending line number.
+
+Repeat blocks can be nested and are kept as a tree, so a 10,000-cycle
+protocol compiles to the handful of steps that are written in the file; the
+executor expands them lazily. The block's cycle number (1-based) is stored
+in the protocol variable named after "as" (default "cycle", or "cycle_<depth>"
+for nested blocks).
+
+A Parallel block holds one Track per valve. The tracks run concurrently on
+the same deadline timeline, so staggered or phase-shifted loading of the
+two chambers takes the time of the longest track rather than the sum.
+Tracks contain time-mode Inflate/Deflate steps on their own valve, Waits,
+Repeat blocks and "Sync: label" barriers: a track that reaches a Sync
+waits until every other track using the same label gets there. Each label
+must be reached equally often in every track that uses it, so the tracks
+cannot deadlock. Repeat cycle variables inside a track default to
+"<valve>_cycle".
+"""
+import os
+import re
+from dataclasses import dataclass
+from typing import Optional, Tuple, Union
+
+from variable_store import Expression
+
+VALVES = ("valve1", "valve2", "both")
+MODES = ("time", "pressure")
+METRICS = ("min_force", "max_force", "final_force", "final_angle", "max_angle",
+           "min_angle", "final_time", "start_time", "total_time")
+RESPONSE_TYPES = ("int", "float", "string")
+
+# A number, or the name of a protocol variable / "(expression)" evaluated at run time
+Value = Union[float, Expression]
+
+
+class ProtocolError(ValueError):
+    def __init__(self, message, line_number=None, line=None):
+        self.message = message
+        self.line_number = line_number
+        self.line = line
+        location = f"line {line_number}: " if line_number is not None else ""
+        source = f" ({line!r})" if line else ""
+        super().__init__(f"{location}{message}{source}")
+
+
+@dataclass(frozen=True)
+class Step:
+    index: int  # 1-based step number shown in the viewer and recorded as self_protocol_step
+    line_number: int
+    source: str
+
+    keyword = ""
+
+    def details(self):
+        """Argument text as written in the protocol file."""
+        return self.source.split(":", 1)[1].strip() if ":" in self.source else ""
+
+
+@dataclass(frozen=True)
+class Inflate(Step):
+    mode: str
+    value: Value
+    valve: str
+    metrics: Tuple[Tuple[str, str], ...] = ()  # (metric, variable name) pairs saved after the step
+
+    keyword = "Inflate"
+
+
+@dataclass(frozen=True)
+class Deflate(Step):
+    mode: str
+    value: Value
+    valve: str
+    metrics: Tuple[Tuple[str, str], ...] = ()
+
+    keyword = "Deflate"
+
+
+@dataclass(frozen=True)
+class SmartInflateML(Step):
+    target: float
+    valve: str
+
+    keyword = "SmartInflateML"
+
+
+@dataclass(frozen=True)
+class SmartDeflateML(Step):
+    target: Optional[float]  # None: vent back to the avg_IAP measured by SmartInflateML
+    valve: str
+
+    keyword = "SmartDeflateML"
+
+
+@dataclass(frozen=True)
+class Wait(Step):
+    seconds: Value
+
+    keyword = "Wait"
+
+
+@dataclass(frozen=True)
+class WaitForUserInput(Step):
+    popup_name: str
+    variable_name: str
+    response_type: str
+
+    keyword = "Wait_for_user_input"
+
+
+@dataclass(frozen=True)
+class NoSave(Step):
+    keyword = "no_save"
+
+
+@dataclass(frozen=True)
+class End(Step):
+    keyword = "End"
+
+
+@dataclass(frozen=True)
+class RepeatBlock(Step):
+    count: int
+    variable: str
+    body: Tuple[Step, ...]
+
+    keyword = "Repeat"
+
+    def details(self):
+        return f"{self.count}x as {self.variable}"
+
+
+@dataclass(frozen=True)
+class Sync(Step):
+    label: str
+
+    keyword = "Sync"
+
+
+@dataclass(frozen=True)
+class Track(Step):
+    valve: str
+    body: Tuple[Step, ...]
+
+    keyword = "Track"
+
+    def details(self):
+        return self.valve
+
+
+@dataclass(frozen=True)
+class ParallelBlock(Step):
+    tracks: Tuple[Track, ...]
+
+    keyword = "Parallel"
+
+    def details(self):
+        return ", ".join(track.valve for track in self.tracks)
+
+
+# Steps a Track may contain (Repeat blocks aside); everything else needs the whole rig
+TRACK_STEPS = (Inflate, Deflate, Wait, Sync)
+
+
+def children(step):
+    """Nested steps of a block step (Repeat body, Parallel tracks, Track body), or ()."""
+    if isinstance(step, (RepeatBlock, Track)):
+        return step.body
+    if isinstance(step, ParallelBlock):
+        return step.tracks
+    return ()
+
+
+def sync_counts(steps):
+    """How often each Sync label is reached when `steps` run, with Repeat blocks expanded."""
+    counts = {}
+    for step in steps:
+        if isinstance(step, Sync):
+            counts[step.label] = counts.get(step.label, 0) + 1
+        elif isinstance(step, RepeatBlock):
+            for label, count in sync_counts(step.body).items():
+                counts[label] = counts.get(label, 0) + count * step.count
+    return counts
+
+
+@dataclass(frozen=True)
+class CompiledProtocol:
+    name: str
+    steps: Tuple[Step, ...]  # top level; RepeatBlock bodies hold the nested steps
+
+    def walk(self, steps=None, depth=0):
+        """Yield (step, depth) for every step as written in the file, blocks before their bodies."""
+        for step in self.steps if steps is None else steps:
+            yield step, depth
+            yield from self.walk(children(step), depth + 1)
+
+    def __len__(self):
+        """Number of steps as written (each block and its body counted once)."""
+        return sum(1 for _ in self.walk())
+
+    def executed_length(self, steps=None):
+        """Number of steps executed when every Repeat block runs all its cycles."""
+        total = 0
+        for step in self.steps if steps is None else steps:
+            if isinstance(step, RepeatBlock):
+                total += step.count * self.executed_length(step.body)
+            elif isinstance(step, (ParallelBlock, Track)):
+                total += self.executed_length(children(step))
+            else:
+                total += 1
+        return total
+
+    @property
+    def required_subsystems(self):
+        """
+        Init-orchestrator subsystems this protocol needs before it can start.
+
+        Every protocol records calibrated pressures, so the valves and calibration are
+        always needed (pressure-mode steps also close on the calibrated stream);
+        SmartInflateML needs the inflation model and SmartDeflateML the deflation model.
+        """
+        required = {"valves", "calibration"}
+        for step, _ in self.walk():
+            if isinstance(step, SmartInflateML):
+                required.add("inflation_model")
+            elif isinstance(step, SmartDeflateML):
+                required.add("deflation_model")
+        return required
+
+
+def _split_args(arg_text):
+    """Split on commas that are not inside parentheses, so "(max(a, b))" stays one argument."""
+    args, depth, start = [], 0, 0
+    for i, char in enumerate(arg_text):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            args.append(arg_text[start:i])
+            start = i + 1
+    args.append(arg_text[start:])
+    return args
+
+
+def _parse_value(token, what):
+    token = token.strip()
+    if not token:
+        raise ValueError(f"missing {what}")
+    try:
+        return float(token)
+    except ValueError:
+        pass
+    if (token.startswith("(") and token.endswith(")")) or IDENTIFIER_RE.match(token):
+        return Expression(token)
+    raise ValueError(f"{what} must be a number, a variable name or a (expression), got {token!r}")
+
+
+def _parse_float(token, what):
+    try:
+        return float(token.strip())
+    except ValueError:
+        raise ValueError(f"{what} must be a number, got {token.strip()!r}")
+
+
+def _parse_choice(token, choices, what):
+    value = token.strip().lower()
+    if value not in choices:
+        raise ValueError(f"unknown {what} {token.strip()!r}, expected one of {', '.join(choices)}")
+    return value
+
+
+def _parse_metrics(tokens):
+    metrics = []
+    for i in range(0, len(tokens), 2):
+        metric = _parse_choice(tokens[i], METRICS, "metric")
+        variable_name = tokens[i + 1].strip() if i + 1 < len(tokens) else metric
+        if not variable_name:
+            raise ValueError(f"empty variable name for metric {metric!r}")
+        metrics.append((metric, variable_name))
+    return tuple(metrics)
+
+
+def _valve_step(cls, base, args):
+    if len(args) < 2:
+        raise ValueError(f"{cls.keyword} needs: time|pressure, value[, valve[, metric, variable ...]]")
+    mode = _parse_choice(args[0], MODES, "mode")
+    value = _parse_value(args[1], "value")
+    valve = _parse_choice(args[2], VALVES, "valve") if len(args) > 2 else "both"
+    return cls(*base, mode=mode, value=value, valve=valve, metrics=_parse_metrics(args[3:]))
+
+
+def _smart_inflate(base, args):
+    if len(args) != 2:
+        raise ValueError("SmartInflateML needs: target_pressure, valve")
+    return SmartInflateML(*base, target=_parse_float(args[0], "target pressure"),
+                          valve=_parse_choice(args[1], VALVES, "valve"))
+
+
+def _smart_deflate(base, args):
+    if len(args) == 1:
+        return SmartDeflateML(*base, target=None, valve=_parse_choice(args[0], VALVES, "valve"))
+    if len(args) == 2:
+        return SmartDeflateML(*base, target=_parse_float(args[0], "target pressure"),
+                              valve=_parse_choice(args[1], VALVES, "valve"))
+    raise ValueError("SmartDeflateML needs: [target_pressure,] valve")
+
+
+def _wait(base, args):
+    if len(args) != 1:
+        raise ValueError("Wait needs exactly one argument: seconds")
+    return Wait(*base, seconds=_parse_value(args[0], "wait time"))
+
+
+def _wait_for_user_input(base, args):
+    if len(args) != 3:
+        raise ValueError("Wait_for_user_input needs: popup name, variable name, int|float|string")
+    popup_name, variable_name = args[0].strip(), args[1].strip()
+    if not popup_name or not variable_name:
+        raise ValueError("popup name and variable name must not be empty")
+    return WaitForUserInput(*base, popup_name=popup_name, variable_name=variable_name,
+                            response_type=_parse_choice(args[2], RESPONSE_TYPES, "response type"))
+
+
+def _sync(base, args):
+    if len(args) != 1 or not IDENTIFIER_RE.match(args[0].strip()):
+        raise ValueError("Sync needs one label, e.g. 'Sync: loaded'")
+    return Sync(*base, label=args[0].strip())
+
+
+def _no_args(cls):
+    def build(base, args):
+        if any(arg.strip() for arg in args):
+            raise ValueError(f"{cls.keyword} takes no arguments")
+        return cls(*base)
+    return build
+
+
+# Lower-case keyword -> builder(base fields, argument tokens)
+STEP_BUILDERS = {
+    "inflate": lambda base, args: _valve_step(Inflate, base, args),
+    "deflate": lambda base, args: _valve_step(Deflate, base, args),
+    "smartinflateml": _smart_inflate,
+    "smartdeflateml": _smart_deflate,
+    "wait": _wait,
+    "wait_for_user_input": _wait_for_user_input,
+    "sync": _sync,
+    "no_save": _no_args(NoSave),
+    "end": _no_args(End),
+}
+
+
+REPEAT_RE = re.compile(r"^repeat\s+(\S+)(?:\s+as\s+(\S+))?\s*\{$", re.IGNORECASE)
+PARALLEL_RE = re.compile(r"^parallel\s*\{$", re.IGNORECASE)
+TRACK_RE = re.compile(r"^track\s+(\S+)\s*\{$", re.IGNORECASE)
+IDENTIFIER_RE = re.compile(r"^[A-Za-z_]\w*$")
+
+
+def _repeat_header(line, default_variable):
+    match = REPEAT_RE.match(line)
+    if match is None:
+        raise ValueError("expected 'Repeat N {' or 'Repeat N as name {'")
+    count_text, variable = match.groups()
+    try:
+        count = int(count_text)
+    except ValueError:
+        raise ValueError(f"repeat count must be a whole number, got {count_text!r}")
+    if count < 0:
+        raise ValueError("repeat count must not be negative")
+    if variable is None:
+        variable = default_variable
+    elif not IDENTIFIER_RE.match(variable):
+        raise ValueError(f"invalid cycle variable name {variable!r}")
+    return count, variable
+
+
+def _close_block(kind, base, info, body):
+    """Build the step of a block whose '}' was reached; raises ValueError for invalid blocks."""
+    if kind == "repeat":
+        count, variable = info
+        return RepeatBlock(*base, count=count, variable=variable, body=tuple(body))
+    if kind == "track":
+        return Track(*base, valve=info, body=tuple(body))
+    if not body:
+        raise ValueError("Parallel block needs at least one Track")
+    counts = [sync_counts(track.body) for track in body]
+    for label in set().union(*counts):
+        used = [(track.valve, track_counts[label]) for track, track_counts in zip(body, counts)
+                if label in track_counts]
+        if len(used) < 2:
+            raise ValueError(f"Sync {label!r} is only used by Track {used[0][0]}")
+        if len({count for _, count in used}) > 1:
+            reached = ", ".join(f"{count}x in Track {valve}" for valve, count in used)
+            raise ValueError(f"Sync {label!r} is reached a different number of times ({reached})")
+    variables = {}
+    for track in body:
+        for step, _ in CompiledProtocol(name="", steps=track.body).walk():
+            if isinstance(step, RepeatBlock):
+                if variables.setdefault(step.variable, track.valve) != track.valve:
+                    raise ValueError(f"cycle variable {step.variable!r} is used by more than one Track")
+    return ParallelBlock(*base, tracks=tuple(body))
+
+
+def _header(line, open_blocks):
+    """Parse a block header line into (kind, info); raises ValueError if it is not valid here."""
+    kinds = [block[0] for block in open_blocks]
+    in_parallel = bool(kinds) and kinds[-1] == "parallel"
+    track = next((block[2] for block in reversed(open_blocks) if block[0] == "track"), None)
+    lower = line.lower()
+    if lower.startswith("track"):
+        if not TRACK_RE.match(line):
+            raise ValueError("expected 'Track valve1 {' or 'Track valve2 {'")
+        if not in_parallel:
+            raise ValueError("Track blocks must be directly inside a Parallel block")
+        valve = _parse_choice(TRACK_RE.match(line).group(1), VALVES[:2], "track valve")
+        if any(block[0] == "track" and block[2] == valve for block in open_blocks[-1][4]):
+            raise ValueError(f"Parallel block already has a Track for {valve}")
+        return "track", valve
+    if in_parallel:
+        raise ValueError("a Parallel block may only contain Track blocks")
+    if lower.startswith("parallel"):
+        if not PARALLEL_RE.match(line):
+            raise ValueError("expected 'Parallel {'")
+        if track is not None:
+            raise ValueError("Parallel blocks cannot be nested inside a Track")
+        return "parallel", None
+    if track is not None:
+        depth = kinds[::-1].index("track")
+        default_variable = f"{track}_cycle" if depth == 0 else f"{track}_cycle_{depth}"
+    else:
+        depth = kinds.count("repeat")
+        default_variable = "cycle" if depth == 0 else f"cycle_{depth}"
+    count, variable = _repeat_header(line, default_variable)
+    if any(block[0] == "repeat" and block[2][1] == variable for block in open_blocks):
+        raise ValueError(f"cycle variable {variable!r} is already used by an outer Repeat")
+    return "repeat", (count, variable)
+
+
+def _check_track_step(step, valve):
+    if not isinstance(step, TRACK_STEPS):
+        raise ValueError(f"{step.keyword} is not allowed inside a Track "
+                         f"(only time-mode Inflate/Deflate, Wait, Sync and Repeat)")
+    if isinstance(step, (Inflate, Deflate)):
+        if step.mode != "time":
+            raise ValueError("steps inside a Track must use time mode")
+        if step.valve != valve:
+            raise ValueError(f"steps inside Track {valve} must use {valve}")
+        if step.metrics:
+            raise ValueError("metrics cannot be saved inside a Track")
+
+
+def compile_protocol(text, name="<protocol>"):
+    """
+    Compile protocol text into a CompiledProtocol.
+
+    Blank lines and lines starting with '#' are ignored.
+
+    :raises ProtocolError: on the first malformed line or an unbalanced block.
+    """
+    steps = []
+    open_blocks = []  # (kind, base fields, info, parent step list, sibling blocks) of unclosed blocks
+    index = 0
+    for line_number, raw_line in enumerate(text.splitlines(), start=1):
+        line = raw_line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line == "}":
+            if not open_blocks:
+                raise ProtocolError("'}' without a matching block", line_number, line)
+            kind, base, info, parent, _ = open_blocks.pop()
+            try:
+                parent.append(_close_block(kind, base, info, steps))
+            except ValueError as e:
+                raise ProtocolError(str(e), base[1], base[2]) from None
+            steps = parent
+            continue
+        index += 1
+        base = (index, line_number, line)
+        lower_line = line.lower()
+        if ":" not in line and (line.endswith("{") or lower_line.startswith(("repeat", "parallel", "track"))):
+            try:
+                kind, info = _header(line, open_blocks)
+            except ValueError as e:
+                raise ProtocolError(str(e), line_number, line) from None
+            open_blocks.append((kind, base, info, steps, []))
+            if kind == "track":
+                open_blocks[-2][4].append(open_blocks[-1])
+            steps = []
+            continue
+        keyword, _, arg_text = line.partition(":")
+        builder = STEP_BUILDERS.get(keyword.strip().lower())
+        if builder is None:
+            raise ProtocolError(f"unknown command {keyword.strip()!r}", line_number, line)
+        args = _split_args(arg_text) if arg_text.strip() else []
+        track = next((block[2] for block in reversed(open_blocks) if block[0] == "track"), None)
+        try:
+            if open_blocks and open_blocks[-1][0] == "parallel":
+                raise ValueError("a Parallel block may only contain Track blocks")
+            step = builder(base, args)
+            if track is not None:
+                _check_track_step(step, track)
+            elif isinstance(step, Sync):
+                raise ValueError("Sync is only allowed inside a Track")
+            steps.append(step)
+        except ValueError as e:
+            raise ProtocolError(str(e), line_number, line) from None
+    if open_blocks:
+        kind, base = open_blocks[-1][:2]
+        raise ProtocolError(f"{kind.capitalize()} block is never closed with '}}'", base[1], base[2])
+    return CompiledProtocol(name=name, steps=tuple(steps))
+
+
+def compile_protocol_file(path):
+    with open(path, "r") as file:
+        return compile_protocol(file.read(), name=os.path.basename(path))
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+Runs a CompiledProtocol (see protocol_compiler.py) on the App.
+
+The protocol has already been validated, so the control thread only
+dispatches on step type; the hardware itself is still driven through the
+App's inflate/deflate and measurement helpers. Timed valve pulses and waits
+run on the StepScheduler's deadline timeline; steps of open-ended length
+(pressure mode, ML measurements, user input) resync it when they finish.
+
+Repeat blocks are expanded lazily, one cycle at a time. While a block runs,
+app.protocol_cycle holds the cycle tag ("3", or "3.2" inside a nested
+block) that read_sensors writes next to every sample.
+
+Parallel blocks hand one command stream per Track to
+StepScheduler.run_tracks, which interleaves the valve edges of all tracks on
+the shared deadline timeline. Each track only switches its own valve.
+
+With an OnlineTimingLearner, every ML-timed Smart step becomes an
+observation once the next Smart step has measured what it achieved, and the
+timing models are swapped for the learner's latest ones between cycles.
+When the App has a PeakController, SmartInflateML times are corrected from
+the peaks the same step reached in earlier cycles.
+"""
+from protocol_compiler import (Inflate, Deflate, SmartInflateML, SmartDeflateML, Wait,
+                               WaitForUserInput, NoSave, End, RepeatBlock, ParallelBlock, Sync,
+                               sync_counts)
+from step_scheduler import StepScheduler
+from online_timing_learner import INFLATION, DEFLATION
+from variable_store import Expression
+
+# Rolling-stats channel (see rolling_stats.py) of the pressure each valve setting drives
+VALVE_CHANNELS = {"valve1": "pressure1", "valve2": "pressure2", "both": "internal"}
+
+
+class ProtocolExecutor:
+    def __init__(self, app, scheduler=None, timing_log_path=None, learner=None):
+        self.app = app
+        self.scheduler = scheduler or StepScheduler()
+        self.timing_log_path = timing_log_path  # stream scheduler edges here instead of keeping them
+        self.learner = learner  # OnlineTimingLearner, or None to always use the shipped models
+        self.inflation_model = None
+        self.deflation_model = None
+        self.no_save = False
+        self._cycles = []
+        self.handlers = {
+            Inflate: self.run_inflate,
+            Deflate: self.run_deflate,
+            SmartInflateML: self.run_smart_inflate,
+            SmartDeflateML: self.run_smart_deflate,
+            Wait: self.run_wait,
+            WaitForUserInput: self.run_wait_for_user_input,
+        }
+
+    def run(self, protocol):
+        """
+        Execute every step of `protocol` in order until it ends or app.stop_flag is set.
+
+        :return: True if the protocol asked not to save data (no_save), False otherwise.
+        """
+        app = self.app
+        app.total_steps = len(protocol)
+        app.total_commands = protocol.executed_length()
+
+        # clear previous data
+        app.variables.clear()
+        app.init = True  # read_sensors resets the recording when the first step starts
+        app.protocol_cycle = None
+        self.no_save = False
+        self._cycles = []
+        self.scheduler.start(log_path=self.timing_log_path)
+        if self.learner is not None:
+            self.learner.start(app.inflation_model, app.deflation_model)
+        peak_controller = getattr(app, "peak_controller", None)
+        if peak_controller is not None:
+            peak_controller.reset()
+        self.swap_models()
+        try:
+            self.run_steps(protocol.steps)
+        finally:
+            self.scheduler.close_log()
+            if self.learner is not None:
+                self.learner.stop()
+            if peak_controller is not None:
+                peak_controller.settle()
+            app.protocol_cycle = None
+
+        edges, mean_error, max_error = self.scheduler.summary()
+        if edges:
+            print(f"[scheduler] {edges} timed edges, mean error {mean_error:.2f} ms, max {max_error:.2f} ms")
+        if self.learner is not None:
+            for name, (count, shipped_error, online_error, active) in self.learner.summary().items():
+                if count:
+                    print(f"[online-{name}] {count} observations, mean error {shipped_error:.3f} s shipped, "
+                          f"{online_error:.3f} s online ({'online' if active else 'shipped'} model in use)")
+        if peak_controller is not None:
+            for (step, valve), (cycles, first, last) in sorted(peak_controller.summary().items()):
+                print(f"[peak-control] step {step} {valve}: peak error {first:+.3f} -> {last:+.3f} PSI "
+                      f"over {cycles} cycles")
+        return self.no_save
+
+    def settle_peaks(self):
+        """The valves are about to be driven again: the tracked Smart pulses have reached their peaks."""
+        peak_controller = getattr(self.app, "peak_controller", None)
+        if peak_controller is not None:
+            peak_controller.settle()
+
+    def swap_models(self):
+        """Take the timing models for the next cycle: the learner's latest, or the App's shipped ones."""
+        previous = getattr(self, "inflation_model", None)
+        if self.learner is None:
+            self.inflation_model, self.deflation_model = self.app.inflation_model, self.app.deflation_model
+        else:
+            self.inflation_model, self.deflation_model = self.learner.current_models()
+        peak_controller = getattr(self.app, "peak_controller", None)
+        if peak_controller is not None and self.inflation_model is not None and self.inflation_model is not previous:
+            # The learner trained on the peaks the controller corrects; keep only what it has not learned
+            peak_controller.rebase(self.inflation_model)
+
+    def run_steps(self, steps):
+        """
+        Run a sequence of steps (the protocol or a Repeat body).
+
+        :return: False once the protocol has to stop (End step or stop button).
+        """
+        app = self.app
+        for step in steps:
+            app.protocol_command = step.source
+            app.protocol_step = step.index
+            self.scheduler.set_step(step, app.protocol_cycle)
+            if app.stop_flag:
+                print("Protocol stopped by user.")
+                return False
+            if isinstance(step, End):
+                return False
+            if isinstance(step, NoSave):
+                self.no_save = True
+            elif isinstance(step, RepeatBlock):
+                if not self.run_repeat(step):
+                    return False
+            elif isinstance(step, ParallelBlock):
+                if not self.run_parallel(step):
+                    return False
+            else:
+                self.handlers[type(step)](step)
+        return True
+
+    def run_repeat(self, block):
+        app = self.app
+        for cycle in range(1, block.count + 1):
+            # The cycle number is a protocol variable, e.g. "wait: cycle"
+            app.variables.set(block.variable, cycle, "int")
+            self.swap_models()
+            self._cycles.append(cycle)
+            app.protocol_cycle = ".".join(str(c) for c in self._cycles)
+            try:
+                keep_going = self.run_steps(block.body)
+            finally:
+                self._cycles.pop()
+                app.protocol_cycle = ".".join(str(c) for c in self._cycles) or None
+            if not keep_going:
+                return False
+        return True
+
+    def run_parallel(self, block):
+        app = self.app
+        outer_cycles = list(self._cycles)
+        if self.learner is not None:
+            self.learner.discard()
+        self.settle_peaks()
+        barriers = {}
+        for position, track in enumerate(block.tracks):
+            for label in sync_counts(track.body):
+                barriers.setdefault(label, set()).add(position)
+        try:
+            self.scheduler.run_tracks([self.track_commands(track.body, outer_cycles) for track in block.tracks],
+                                      barriers)
+        finally:
+            app.protocol_cycle = ".".join(str(c) for c in outer_cycles) or None
+        if app.stop_flag:
+            print("Protocol stopped by user.")
+            return False
+        return True
+
+    def track_commands(self, steps, cycles):
+        """Commands for StepScheduler.run_tracks from one track's steps, Repeat blocks expanded lazily."""
+        app = self.app
+        for step in steps:
+            if app.stop_flag:
+                return
+            if isinstance(step, RepeatBlock):
+                for cycle in range(1, step.count + 1):
+                    app.variables.set(step.variable, cycle, "int")
+                    yield from self.track_commands(step.body, cycles + [cycle])
+                    if app.stop_flag:
+                        return
+            elif isinstance(step, Sync):
+                yield ("sync", step.label)
+            elif isinstance(step, Wait):
+                yield ("wait", self.resolve(step.seconds))
+            else:
+                # Time-mode Inflate/Deflate on the track's own valve (checked by the compiler)
+                action = "supply" if isinstance(step, Inflate) else "vent"
+                seconds = self.resolve(step.value)
+                cycle_tag = ".".join(str(c) for c in cycles) or None
+                yield ("edge", f"{action} {step.valve} open",
+                       self.track_action(step, cycle_tag, action), step, cycle_tag)
+                yield ("wait", seconds)
+                yield ("edge", f"{action} {step.valve} close",
+                       self.track_action(step, cycle_tag, "neutral"), step, cycle_tag)
+
+    def track_action(self, step, cycle_tag, action):
+        def run():
+            # The step shown and recorded is the one whose valve edge ran last
+            self.app.protocol_command = step.source
+            self.app.protocol_step = step.index
+            self.app.protocol_cycle = cycle_tag
+            self.app.set_valves(action, step.valve)
+        return run
+
+    def resolve(self, value):
+        """Numbers were resolved by the compiler; variable names and expressions are evaluated now."""
+        if isinstance(value, Expression):
+            return float(value.evaluate(self.app.variables))
+        return value
+
+    def save_metrics(self, step):
+        for metric, variable_name in step.metrics:
+            try:
+                metric_value = self.app.calculate_metric(metric, step.index, self.app.protocol_cycle)
+            except ValueError:
+                print(f"No data for step {step.index}, metric '{metric}' skipped")
+                continue
+            self.app.variables.persist(variable_name, metric_value, "float")
+
+    def run_inflate(self, step):
+        if self.learner is not None:
+            self.learner.discard()
+        self.settle_peaks()
+        value = self.resolve(step.value)
+        print(f"Time/Pressure: {step.mode}, Value: {value}, Valve: {step.valve}")
+        if step.mode == "time":
+            self.app.inflate(step.mode, value, step.valve, scheduler=self.scheduler)
+        else:
+            self.app.inflate(step.mode, value, step.valve)
+            self.scheduler.resync()
+        self.save_metrics(step)
+
+    def run_deflate(self, step):
+        if self.learner is not None:
+            self.learner.discard()
+        self.settle_peaks()
+        value = self.resolve(step.value)
+        print(f"Time/Pressure: {step.mode}, Value: {value}, Valve: {step.valve}")
+        if step.mode == "time":
+            self.app.deflate(step.mode, value, step.valve, scheduler=self.scheduler)
+        else:
+            self.app.deflate(step.mode, value, step.valve)
+            self.scheduler.resync()
+        self.save_metrics(step)
+
+    def measure(self, valve):
+        """
+        5 s windows a Smart step reads, as {channel: WindowStats}: the input, the internal mean,
+        the pressure `valve` drives and that of the step waiting for its outcome. Waits once,
+        for at most 5 s in total, for all of them to settle.
+        """
+        channels = {"input", "internal", VALVE_CHANNELS.get(valve, "internal")}
+        if self.learner is not None and self.learner.pending_valve is not None:
+            channels.add(VALVE_CHANNELS.get(self.learner.pending_valve, "internal"))
+        return self.app._measure_all(sorted(channels), 5.0)
+
+    @staticmethod
+    def valve_pressure(stats, valve):
+        """
+        (mean, max) of the pressure `valve` drives: pressure1 or pressure2 for one balloon,
+        their mean ("internal") for both. The timing models, their targets and the learner's
+        observations are all in terms of this pressure.
+        """
+        window = stats[VALVE_CHANNELS.get(valve, "internal")]
+        return (window.mean, window.max) if window.count else (0.0, 0.0)
+
+    def record_outcome(self, stats):
+        """Complete the learner's pending observation with what its own balloon(s) reached."""
+        if self.learner is not None and self.learner.pending_valve is not None:
+            self.learner.outcome(self.valve_pressure(stats, self.learner.pending_valve)[0])
+
+    def run_smart_inflate(self, step):
+        app = self.app
+        # 1) measure 5 s averages
+        stats = self.measure(step.valve)
+        avg_in = stats["input"].mean if stats["input"].count else 0.0
+        avg_iap = stats["internal"].mean if stats["internal"].count else 0.0
+        self.record_outcome(stats)
+        avg_pre = self.valve_pressure(stats, step.valve)[0]
+
+        # 2) save them for later
+        app.variables.set("peak_pressure", step.target, "float")
+        app.variables.set("avg_IAP", avg_iap, "float")
+
+        # 3) predict duration
+        if self.inflation_model:
+            dur = float(self.inflation_model.predict([[avg_pre, avg_in, step.target]])[0])
+            peak_controller = getattr(app, "peak_controller", None)
+            if peak_controller is not None:
+                # Corrected by the peaks this step reached in earlier cycles (see peak_controller.py)
+                model_dur, dur = dur, peak_controller.plan(step.index, step.valve, dur,
+                                                           [avg_pre, avg_in, step.target])
+                peak_controller.arm(step.index, app.protocol_cycle, step.valve, step.target, dur, avg_pre, avg_in)
+                print(f"[ML-inflate]  {dur:.2f}s (model {model_dur:.2f}s)")
+            else:
+                print(f"[ML-inflate]  {dur:.2f}s")
+            self.scheduler.resync()
+            app.inflate("time", dur, step.valve, scheduler=self.scheduler)
+            if self.learner is not None:
+                self.learner.expect(INFLATION, step.index, app.protocol_cycle, step.valve, dur,
+                                    avg_pre=avg_pre, avg_in=avg_in)
+
+            # 4) update targets for graph & CSV
+            app.target_pressure = step.target
+            app.target_time = dur
+        else:
+            # No model (the simulator without one): plain "inflate until pressure"
+            app.inflate("pressure", step.target, step.valve)
+            self.scheduler.resync()
+
+    def run_smart_deflate(self, step):
+        app = self.app
+        # Without an explicit target, vent back to the IAP measured before inflating
+        target_pressure = step.target
+        if target_pressure is None:
+            target_pressure = app.variables.get("avg_IAP")
+            if target_pressure is None:
+                target_pressure = app.avg_IAP
+
+        # 1) measure your 5 s averages and peak
+        stats = self.measure(step.valve)
+        avg_in = stats["input"].mean if stats["input"].count else 0.0
+        avg_iap, peak = self.valve_pressure(stats, "both")
+        self.settle_peaks()
+        self.record_outcome(stats)
+        valve_peak = self.valve_pressure(stats, step.valve)[1]
+
+        # 2) save for later & for graphing
+        app.variables.set("avg_IAP", avg_iap, "float")
+        app.variables.set("peak_pressure", peak, "float")
+        app.target_pressure = target_pressure
+
+        # 3) either ML-predict how long to vent, or just vent to target_pressure
+        if self.deflation_model:
+            # Features as in timing_model_training.FEATURES: the peak, the level vented back to, the supply
+            pred_t = float(self.deflation_model.predict([[valve_peak, target_pressure, avg_in]])[0])
+            print(f"[ML-deflate] predict t={pred_t:.2f}s → deflate time")
+            self.scheduler.resync()
+            app.deflate("time", pred_t, step.valve, scheduler=self.scheduler)
+            if self.learner is not None:
+                self.learner.expect(DEFLATION, step.index, app.protocol_cycle, step.valve, pred_t,
+                                    avg_post=valve_peak, avg_in=avg_in)
+        else:
+            print(f"[ML-deflate] no model, deflating to {target_pressure} PSI")
+            app.deflate("pressure", target_pressure, step.valve)
+            self.scheduler.resync()
+
+    def run_wait(self, step):
+        wait_time = self.resolve(step.seconds)
+        print(f"Waiting for {wait_time} seconds")
+        self.scheduler.wait(wait_time)
+
+    def run_wait_for_user_input(self, step):
+        self.app.wait_for_user_input(step.popup_name, step.variable_name, step.response_type)
+        self.scheduler.resync()
@@ -0,0 +1,625 @@
+#!/usr/bin/env python3
+"""
+Accelerated dry run of a protocol against a pneumatic model of the rig.
+
+The protocol is compiled and executed by the real ProtocolExecutor and
+StepScheduler, but time comes from a virtual clock and the valves drive a
+lumped model of the two balloons instead of the hardware. Every valve
+edge, wait and 5 s measurement takes the simulated time it would take on
+the rig, so a protocol of several hours runs in seconds. Supply pressure,
+balloon compliance and valve flow coefficients can be fitted from the
+data.csv of past trials.
+
+The report lists the pressures of every executed step, the total duration,
+the peak balloon pressures of every Repeat cycle and every SmartInflateML
+step that missed its target by more than the tolerance.
+
+Usage:
+    python protocol_simulator.py protocols/smart.txt
+    python protocol_simulator.py protocols/smart.txt --fit ./data/20250101_0000_01 --save-plant plant.json
+    python protocol_simulator.py protocols/smart.txt --plant plant.json --csv simulated_steps.csv
+"""
+import argparse
+import collections
+import contextlib
+import csv
+import json
+import math
+import os
+import statistics
+import time
+from pathlib import Path
+
+from pressure_targeting import VALVE_SENSORS, PressureTargetController
+from protocol_compiler import ProtocolError, compile_protocol_file
+from protocol_executor import ProtocolExecutor
+from model_registry import ModelRegistry
+from online_timing_learner import OnlineTimingLearner
+from peak_controller import PeakController
+from rolling_stats import RollingPressureStats
+from step_metrics import StepAggregate, StepMetrics
+from step_scheduler import StepScheduler
+from variable_store import VariableStore
+
+VALVES = tuple(VALVE_SENSORS)
+
+
+class PneumaticPlant:
+    """
+    Lumped model of the two balloons.
+
+    Each balloon is one compliance that is filled from the supply or emptied
+    to ambient through an orifice: dp/dt = +-coefficient * sqrt(|dp|) / compliance.
+    Valve commands take effect `valve_delay` seconds after they are given.
+    Pressures are gauge psi, like the calibrated sensor values.
+    """
+
+    def __init__(self, supply_pressure=5.0, compliance=1.0, supply_coefficients=None,
+                 vent_coefficients=None, valve_delay=0.02, initial_pressure=0.12):
+        self.supply_pressure = supply_pressure
+        self.compliance = compliance
+        self.supply_coefficients = dict(supply_coefficients or {valve: 1.0 for valve in VALVES})
+        self.vent_coefficients = dict(vent_coefficients or {valve: 1.0 for valve in VALVES})
+        self.valve_delay = valve_delay
+        self.initial_pressure = initial_pressure
+        self.reset()
+
+    def reset(self):
+        self.pressures = {valve: self.initial_pressure for valve in VALVES}
+        self.states = {valve: "neutral" for valve in VALVES}
+        self._commands = collections.deque()  # (time the command takes effect, valve, state)
+
+    def command(self, t, valve, state):
+        """Switch `valve` to "supply", "vent" or "neutral" at time t (plus the valve delay)."""
+        self._commands.append((t + self.valve_delay, valve, state))
+
+    def advance(self, t, dt):
+        """Integrate the balloon pressures from t to t + dt."""
+        commands = self._commands
+        while commands and commands[0][0] <= t:
+            _, valve, state = commands.popleft()
+            self.states[valve] = state
+        for valve in VALVES:
+            state = self.states[valve]
+            p = self.pressures[valve]
+            if state == "supply":
+                flow = self.supply_coefficients[valve] * math.sqrt(max(self.supply_pressure - p, 0.0))
+                self.pressures[valve] = min(p + flow / self.compliance * dt, self.supply_pressure)
+            elif state == "vent":
+                flow = self.vent_coefficients[valve] * math.sqrt(max(p, 0.0))
+                self.pressures[valve] = max(p - flow / self.compliance * dt, 0.0)
+
+    def rate(self, valve, state, pressure, supply_pressure=None):
+        """Magnitude of dp/dt (psi/s) of `valve`'s balloon at `pressure` while it supplies or vents."""
+        if state == "supply":
+            supply = self.supply_pressure if supply_pressure is None else supply_pressure
+            flow = self.supply_coefficients[valve] * math.sqrt(max(supply - pressure, 0.0))
+        else:
+            flow = self.vent_coefficients[valve] * math.sqrt(max(pressure, 0.0))
+        return flow / self.compliance
+
+    def to_dict(self):
+        return {
+            "supply_pressure": self.supply_pressure,
+            "compliance": self.compliance,
+            "supply_coefficients": self.supply_coefficients,
+            "vent_coefficients": self.vent_coefficients,
+            "valve_delay": self.valve_delay,
+            "initial_pressure": self.initial_pressure,
+        }
+
+    def save(self, path):
+        with open(path, "w") as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as file:
+            return cls(**json.load(file))
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def load_trial_rows(path):
+    """
+    Read time, input/balloon pressures and valve states from a trial data.csv.
+
+    :param path: The CSV itself or a trial folder from ./data/ containing it.
+    """
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            candidate = os.path.join(path, name)
+            if name.endswith(".csv") and _has_sensor_columns(candidate):
+                path = candidate
+                break
+        else:
+            raise FileNotFoundError(f"No trial data CSV found in {path}")
+    rows = []
+    with open(path, "r", newline="") as file:
+        for row in csv.DictReader(file):
+            t = _to_float(row.get("time"))
+            if t is None:
+                continue
+            rows.append({
+                "time": t,
+                "input": _to_float(row.get("pressure0_convert")),
+                "pressure1": _to_float(row.get("pressure1_convert")),
+                "pressure2": _to_float(row.get("pressure2_convert")),
+                "valve1": row.get("valve1_state"),
+                "valve2": row.get("valve2_state"),
+            })
+    return rows
+
+
+def _has_sensor_columns(path):
+    with open(path, "r", newline="") as file:
+        header = next(csv.reader(file), [])
+    return "time" in header and "pressure0_convert" in header and "valve1_state" in header
+
+
+def fit_plant(paths, compliance=1.0, valve_delay=0.02):
+    """
+    Fit a PneumaticPlant to the data.csv of past trials.
+
+    The supply pressure is the median input pressure. Each flow coefficient is the
+    least-squares fit of dp/dt against sqrt(pressure difference) over consecutive
+    samples in which the valve stayed open. Pressure traces only determine
+    coefficient / compliance, so the coefficients are scaled by the given compliance.
+    """
+    supplies = []
+    initial = []
+    # (valve, state) -> [sum x*y, sum x*x]
+    sums = {(valve, state): [0.0, 0.0] for valve in VALVES for state in ("supply", "vent")}
+    trials = [load_trial_rows(path) for path in paths]
+    for rows in trials:
+        supplies.extend(row["input"] for row in rows if row["input"] is not None)
+    if not supplies:
+        raise ValueError("No input pressure samples found in the given trials")
+    supply_pressure = statistics.median(supplies)
+
+    for rows in trials:
+        if rows:
+            first = [rows[0][VALVE_SENSORS[valve][0]] for valve in VALVES]
+            initial.extend(p for p in first if p is not None)
+        for prev, row in zip(rows, rows[1:]):
+            dt = row["time"] - prev["time"]
+            if dt <= 0:
+                continue
+            for valve in VALVES:
+                state = prev[valve]
+                if state not in ("supply", "vent") or row[valve] != state:
+                    continue
+                sensor = VALVE_SENSORS[valve][0]
+                p0, p1 = prev[sensor], row[sensor]
+                if p0 is None or p1 is None:
+                    continue
+                if state == "supply":
+                    x, y = math.sqrt(max(supply_pressure - p0, 0.0)), (p1 - p0) / dt
+                else:
+                    x, y = math.sqrt(max(p0, 0.0)), (p0 - p1) / dt
+                sums[(valve, state)][0] += x * y
+                sums[(valve, state)][1] += x * x
+
+    coefficients = {}
+    for (valve, state), (xy, xx) in sums.items():
+        if xx > 0 and xy > 0:
+            coefficients[(valve, state)] = xy / xx * compliance
+        else:
+            print(f"[simulator] no {state} samples for {valve}; using coefficient 1.0")
+            coefficients[(valve, state)] = compliance
+    return PneumaticPlant(
+        supply_pressure=supply_pressure,
+        compliance=compliance,
+        supply_coefficients={valve: coefficients[(valve, "supply")] for valve in VALVES},
+        vent_coefficients={valve: coefficients[(valve, "vent")] for valve in VALVES},
+        valve_delay=valve_delay,
+        initial_pressure=statistics.median(initial) if initial else 0.12,
+    )
+
+
+class VirtualClock:
+    """
+    Stands in for time.monotonic()/time.sleep(): sleeping integrates the plant
+    instead of waiting, and `on_sample(t)` is called at the sensor rate.
+    """
+
+    def __init__(self, plant, on_sample, dt=0.005, sample_period=0.01):
+        self.plant = plant
+        self.on_sample = on_sample
+        self.dt = dt
+        self.sample_period = sample_period
+        self.t = 0.0
+        self._next_sample = 0.0
+
+    def now(self):
+        return self.t
+
+    def sleep(self, seconds):
+        end = self.t + max(seconds, 0.0)
+        while end - self.t > 1e-9:
+            dt = min(self.dt, end - self.t)
+            self.plant.advance(self.t, dt)
+            self.t += dt
+            if self.t >= self._next_sample:
+                self._next_sample += self.sample_period
+                self.on_sample(self.t)
+        # Land exactly on `end` so deadline loops in the scheduler terminate
+        self.t = max(self.t, end)
+
+
+class SimulatedValve:
+    """The ValveController calls PressureTargetController makes, commanding one balloon of the plant."""
+
+    def __init__(self, app, name):
+        self.app = app
+        self.name = name
+
+    def supply(self):
+        self.app.set_valves("supply", self.name)
+
+    def vent(self):
+        self.app.set_valves("vent", self.name)
+
+    def neutral(self):
+        self.app.set_valves("neutral", self.name)
+
+
+class SimulatedApp:
+    """
+    The parts of App that ProtocolExecutor uses, driving a PneumaticPlant on a VirtualClock.
+
+    :param answers: Values for "Wait for User Input" steps, by variable name.
+    :param miss_tolerance: psi a SmartInflateML peak may be off its target before it counts as a miss.
+    :param peak_controller: PeakController correcting SmartInflateML times from cycle to cycle.
+    """
+
+    def __init__(self, plant, inflation_model=None, deflation_model=None, answers=None,
+                 lead_seconds=0.05, timeout=30.0, miss_tolerance=0.1, stable_psi=0.05,
+                 dt=0.005, sample_period=0.01, peak_controller=None):
+        self.plant = plant
+        self.clock = VirtualClock(plant, self.on_sample, dt, sample_period)
+        self.inflation_model = inflation_model
+        self.deflation_model = deflation_model
+        self.peak_controller = peak_controller
+        self.answers = dict(answers or {})
+        self.miss_tolerance = miss_tolerance
+        self.smart_stable_psi = stable_psi
+
+        # Protocol state, as on App
+        self.stop_flag = False
+        self.protocol_step = None
+        self.protocol_command = None
+        self.protocol_cycle = None
+        self.total_steps = 0
+        self.total_commands = 0
+        self.variables = VariableStore(clock=self.clock.now)
+        self.init = None
+        self.target_pressure = 0
+        self.target_time = 0
+        self.avg_IAP = plant.initial_pressure
+        self.pressure0_convert = plant.supply_pressure
+        self.pressure1_convert = plant.pressures["valve1"]
+        self.pressure2_convert = plant.pressures["valve2"]
+        self.step_metrics = StepMetrics()
+        self.rolling_stats = RollingPressureStats(window_seconds=5.0, clock=self.clock.now, sleep=self.clock.sleep)
+        # Pressure-mode steps run the App's controller on the simulated stream
+        self.valves = {name: SimulatedValve(self, name) for name in VALVES}
+        self.listeners = []
+        self.pressure_controller = PressureTargetController(
+            convert=lambda sensor, value: value,
+            subscribe=self.listeners.append,
+            unsubscribe=self.listeners.remove,
+            lead_seconds=lead_seconds, timeout=timeout, clock=self.clock.now, wait=self.wait_event)
+
+        # Simulation results
+        self.steps = []  # (step index, cycle, command, StepAggregate) of every executed step
+        self.cycle_peaks = collections.OrderedDict()  # top-level cycle -> (peak pressure1, peak pressure2)
+        self.smart_misses = []  # (step index, cycle, target, {valve: peak})
+        self._current = None  # ((step, cycle), StepAggregate) receiving samples
+        self._smart_checks = []
+
+    def on_sample(self, t):
+        p0 = self.plant.supply_pressure
+        p1 = self.pressure1_convert = self.plant.pressures["valve1"]
+        p2 = self.pressure2_convert = self.plant.pressures["valve2"]
+        self.pressure0_convert = p0
+        self.rolling_stats.add_sample(t, p0, p1, p2)
+        if self.peak_controller is not None:
+            self.peak_controller.add_sample(t, p1, p2)
+        for listener in list(self.listeners):
+            listener(t, (p0, p1, p2, 0.0))
+
+        # SmartInflateML peaks are followed until the close command has reached the balloon
+        if self._smart_checks:
+            for check in list(self._smart_checks):
+                peaks = check["peaks"]
+                for valve in peaks:
+                    peaks[valve] = max(peaks[valve], self.plant.pressures[valve])
+                if t >= check["until"]:
+                    self._finish_smart_check(check)
+
+        step = self.protocol_step
+        if step is None:
+            return
+        cycle = self.protocol_cycle
+        key = (step, cycle)
+        if self._current is None or self._current[0] != key:
+            aggregate = StepAggregate()
+            self.steps.append((step, cycle, self.protocol_command, aggregate))
+            self._current = (key, aggregate)
+        self._current[1].add(t, p0, p1, p2)
+        self.step_metrics.add_sample(step, cycle, t, p0, p1, p2)
+        if cycle is not None:
+            top_cycle = cycle.split(".")[0]
+            peak1, peak2 = self.cycle_peaks.get(top_cycle, (p1, p2))
+            self.cycle_peaks[top_cycle] = (max(peak1, p1), max(peak2, p2))
+
+    def check_smart_target(self, step):
+        """Compare the peak reached by a SmartInflateML step with its target once the valves have closed."""
+        valves = VALVES if step.valve == "both" else (step.valve,)
+        peaks = {valve: self.plant.pressures[valve] for valve in valves}
+        if self._current is not None:
+            for valve in valves:
+                peak = self._current[1].channels[VALVE_SENSORS[valve][0]].max
+                if peak is not None:
+                    peaks[valve] = max(peaks[valve], peak)
+        self._smart_checks.append({
+            "step": step.index,
+            "cycle": self.protocol_cycle,
+            "target": step.target,
+            "peaks": peaks,
+            "until": self.clock.now() + self.plant.valve_delay + 2 * self.clock.sample_period,
+        })
+
+    def _finish_smart_check(self, check):
+        self._smart_checks.remove(check)
+        if any(abs(peak - check["target"]) > self.miss_tolerance for peak in check["peaks"].values()):
+            self.smart_misses.append((check["step"], check["cycle"], check["target"], check["peaks"]))
+
+    def finish(self):
+        # Let the last valve commands reach the balloons, then close open peak checks
+        self.protocol_step = None
+        self.clock.sleep(max(self.plant.valve_delay + 2 * self.clock.sample_period,
+                             self.pressure_controller.settle_seconds))
+        self.pressure_controller.release()
+        for check in list(self._smart_checks):
+            self._finish_smart_check(check)
+
+    # Executor-facing methods, mirroring App
+
+    def calculate_metric(self, metric, protocol_step, protocol_cycle=None):
+        return self.step_metrics.metric(metric, protocol_step, protocol_cycle)
+
+    def set_valves(self, action, valve):
+        now = self.clock.now()
+        for name in (VALVES if valve == "both" else (valve,)):
+            self.plant.command(now, name, action)
+
+    def close_valves(self):
+        self.set_valves("neutral", "both")
+
+    def inflate(self, time_or_pressure, value, valve, scheduler=None):
+        self._drive("supply", "inflate", time_or_pressure, value, valve, scheduler)
+
+    def deflate(self, time_or_pressure, value, valve, scheduler=None):
+        self._drive("vent", "deflate", time_or_pressure, value, valve, scheduler)
+
+    def _drive(self, action, direction, time_or_pressure, value, valve, scheduler):
+        if time_or_pressure.lower() == "pressure":
+            self.pressure_target(direction, value, valve)
+        elif scheduler is not None:
+            scheduler.pulse(lambda: self.set_valves(action, valve), lambda: self.set_valves("neutral", valve),
+                            value, f"{action} {valve}")
+        else:
+            self.set_valves(action, valve)
+            self.clock.sleep(value)
+            self.set_valves("neutral", valve)
+
+    def wait_event(self, event, seconds):
+        """threading.Event.wait on the virtual clock: the samples that set `event` arrive while it sleeps."""
+        end = self.clock.now() + seconds
+        while not event.is_set() and self.clock.now() < end:
+            self.clock.sleep(min(self.clock.sample_period, end - self.clock.now()))
+        return event.is_set()
+
+    def pressure_target(self, direction, target, valve):
+        """Drive the balloon(s) of `valve` to `target` psi with the App's PressureTargetController."""
+        return self.pressure_controller.run(self.valves, direction, target, valve,
+                                            step=self.protocol_step, cycle=self.protocol_cycle)
+
+    def _measure_all(self, channels, seconds):
+        return self.rolling_stats.wait_all_stable(channels, self.smart_stable_psi, seconds)
+
+    def _measure(self, channel, seconds):
+        return self._measure_all((channel,), seconds)[channel]
+
+    def _measure_pressure0_avg(self, seconds):
+        stats = self._measure("input", seconds)
+        return stats.mean if stats.count else 0.0
+
+    def _measure_internal_avg(self, seconds):
+        stats = self._measure("internal", seconds)
+        return stats.mean if stats.count else 0.0
+
+    def _measure_internal_max(self, seconds):
+        stats = self._measure("internal", seconds)
+        return stats.max if stats.count else 0.0
+
+    def wait_for_user_input(self, popup_name, variable_name, response_type):
+        if variable_name not in self.answers:
+            raise ValueError(f"No answer for '{popup_name}'; pass --answer {variable_name}=<value>")
+        self.variables.persist(variable_name, self.answers[variable_name], response_type)
+
+
+class SimulationExecutor(ProtocolExecutor):
+    """ProtocolExecutor that also checks every SmartInflateML step against its target."""
+
+    def run_smart_inflate(self, step):
+        super().run_smart_inflate(step)
+        self.app.check_smart_target(step)
+
+
+class SimulationResult:
+    HEADER = ["step", "cycle", "command", "start_s", "duration_s",
+              "pressure1_start", "pressure1_end", "pressure1_max",
+              "pressure2_start", "pressure2_end", "pressure2_max"]
+
+    def __init__(self, name, app, wall_seconds, learning=None):
+        self.name = name
+        self.learning = learning or {}  # OnlineTimingLearner.summary()
+        self.steps = app.steps
+        self.duration = app.clock.now()
+        self.cycle_peaks = app.cycle_peaks
+        self.smart_misses = app.smart_misses
+        self.overshoot = app.pressure_controller.overshoot_stats()  # PressureTargetController per valve
+        self.wall_seconds = wall_seconds
+
+    @property
+    def speedup(self):
+        return self.duration / self.wall_seconds if self.wall_seconds > 0 else float("inf")
+
+    def rows(self):
+        for step, cycle, command, aggregate in self.steps:
+            ch = aggregate.channels
+            yield [step, cycle or "", command, ch["time"].first, ch["time"].duration,
+                   ch["pressure1"].first, ch["pressure1"].last, ch["pressure1"].max,
+                   ch["pressure2"].first, ch["pressure2"].last, ch["pressure2"].max]
+
+    def write_csv(self, path):
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(self.HEADER)
+            writer.writerows(self.rows())
+
+    def print_summary(self, max_rows=40):
+        print(f"Protocol {self.name}: {self.duration:.1f} s simulated in {self.wall_seconds:.2f} s "
+              f"({self.speedup:.0f}x real time), {len(self.steps)} steps executed")
+        print(f"{'step':>5} {'cycle':>7} {'start s':>9} {'dur s':>7} {'p1 end':>7} {'p1 max':>7} "
+              f"{'p2 end':>7} {'p2 max':>7}  command")
+        for i, row in enumerate(self.rows()):
+            if i == max_rows:
+                print(f"  ... {len(self.steps) - max_rows} more steps (use --csv for all of them)")
+                break
+            step, cycle, command, start, duration, _, p1_end, p1_max, _, p2_end, p2_max = row
+            print(f"{step:>5} {cycle:>7} {start:>9.2f} {duration:>7.2f} {p1_end:>7.3f} {p1_max:>7.3f} "
+                  f"{p2_end:>7.3f} {p2_max:>7.3f}  {command}")
+        if self.cycle_peaks:
+            print("Peak pressure per cycle (pressure1 / pressure2, PSI):")
+            for cycle, (peak1, peak2) in self.cycle_peaks.items():
+                print(f"  cycle {cycle}: {peak1:.3f} / {peak2:.3f}")
+        if self.smart_misses:
+            print(f"SmartInflateML target misses: {len(self.smart_misses)}")
+            for step, cycle, target, peaks in self.smart_misses:
+                reached = ", ".join(f"{valve} {peak:.3f}" for valve, peak in peaks.items())
+                where = f"step {step}" + (f", cycle {cycle}" if cycle else "")
+                print(f"  {where}: target {target} PSI, reached {reached}")
+        else:
+            print("SmartInflateML target misses: none")
+        for valve, (count, mean, max_abs, timeouts) in self.overshoot.items():
+            if count:
+                print(f"Pressure-mode {valve}: {count} targets, overshoot mean {mean:+.3f} / max {max_abs:.3f} PSI, "
+                      f"{timeouts} timed out")
+        for name, (count, shipped_error, online_error, active) in self.learning.items():
+            if count:
+                print(f"Online {name} model: {count} observations, mean error {shipped_error:.3f} s shipped, "
+                      f"{online_error:.3f} s online ({'online' if active else 'shipped'} model in use at the end)")
+
+
+def load_timing_models(folder=Path(__file__).parent):
+    """Load the ML timing models the way App.load_inflation_model/load_deflation_model do; missing models are None."""
+    registry = ModelRegistry(folder / "model_registry.json")
+    models = []
+    for name in ("inflation_time", "deflation_time"):
+        try:
+            models.append(registry.load(name))
+        except Exception as e:
+            print(f"[simulator] {name} load failed: {e}")
+            models.append(None)
+    return tuple(models)
+
+
+def simulate(protocol, plant, verbose=False, learn=True, **app_options):
+    """
+    Run a CompiledProtocol against `plant` on a virtual clock.
+
+    :param learn: Refine the timing models from the Smart steps, as the App does.
+    :param app_options: Passed to SimulatedApp (models, answers, tolerances, step sizes).
+    :return: SimulationResult
+    """
+    plant.reset()
+    app = SimulatedApp(plant, **app_options)
+    scheduler = StepScheduler(clock=app.clock.now, sleep=app.clock.sleep, spin_seconds=0)
+    learner = OnlineTimingLearner(threaded=False) if learn else None
+    executor = SimulationExecutor(app, scheduler=scheduler, learner=learner)
+    started = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        if not verbose:
+            # The executor prints every step; that would dominate the run time
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+        executor.run(protocol)
+        app.finish()
+    return SimulationResult(protocol.name, app, time.perf_counter() - started,
+                            learner.summary() if learner else None)
+
+
+def parse_answer(text):
+    name, sep, value = text.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"expected name=value, got {text!r}")
+    return name.strip(), value.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dry-run a protocol against a pneumatic model of the rig.")
+    parser.add_argument("protocol", help="Protocol file, e.g. protocols/smart.txt")
+    parser.add_argument("--plant", help="Plant parameters saved with --save-plant")
+    parser.add_argument("--fit", nargs="+", metavar="TRIAL", help="Fit the plant to trial folders or data.csv files")
+    parser.add_argument("--compliance", type=float, default=1.0, help="Balloon compliance used when fitting")
+    parser.add_argument("--valve-delay", type=float, default=0.02, help="Valve dead time in seconds used when fitting")
+    parser.add_argument("--save-plant", help="Write the plant parameters to this JSON file")
+    parser.add_argument("--answer", type=parse_answer, action="append", default=[], metavar="NAME=VALUE",
+                        help="Value for a 'Wait for User Input' variable")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="SmartInflateML miss tolerance in PSI")
+    parser.add_argument("--no-models", action="store_true", help="Do not load the ML timing models")
+    parser.add_argument("--no-learning", action="store_true", help="Keep the shipped timing models for the whole run")
+    parser.add_argument("--no-peak-control", action="store_true",
+                        help="Do not correct SmartInflateML times from the peaks of earlier cycles")
+    parser.add_argument("--csv", help="Write the per-step results to this CSV")
+    parser.add_argument("--verbose", action="store_true", help="Show the executor's output")
+    args = parser.parse_args()
+
+    if args.fit:
+        plant = fit_plant(args.fit, compliance=args.compliance, valve_delay=args.valve_delay)
+    elif args.plant:
+        plant = PneumaticPlant.load(args.plant)
+    else:
+        plant = PneumaticPlant()
+    print(f"[simulator] plant: {json.dumps(plant.to_dict())}")
+    if args.save_plant:
+        plant.save(args.save_plant)
+
+    try:
+        protocol = compile_protocol_file(args.protocol)
+    except ProtocolError as e:
+        print(f"Invalid protocol: {e}")
+        raise SystemExit(1)
+
+    inflation_model, deflation_model = (None, None) if args.no_models else load_timing_models()
+    peak_controller = None if args.no_peak_control else PeakController(plant=plant)
+    result = simulate(protocol, plant, verbose=args.verbose, learn=not args.no_learning,
+                      peak_controller=peak_controller,
+                      inflation_model=inflation_model, deflation_model=deflation_model,
+                      answers=dict(args.answer), miss_tolerance=args.tolerance)
+    result.print_summary()
+    if args.csv:
+        result.write_csv(args.csv)
+        print(f"Per-step results written to {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Headless trial-to-video renderer.
+
+Takes a finished trial folder from ./data/<trial>/ and renders its pressure
+graph to an MP4 without a display, using the Agg backend only. The timeline
+is split into chunks that are rendered in a process pool, each chunk piped
+into its own ffmpeg segment, and the segments are then concatenated with a
+stream copy. The graph looks the same as the live GraphRecorderApp in
+graph.py: a scrolling window over the last `window` seconds of data.
+
+Usage:
+    python render_trial_video.py ./data/20250101_0000_01
+    python render_trial_video.py ./data/20250101_0000_01 --fps 30 --workers 4 --window 30
+"""
+import argparse
+import bisect
+import csv
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use("Agg")
+
+from graph_recorder import FFmpegWriter, PressureFrameRenderer
+
+
+def find_trial_csv(trial_folder):
+    """
+    Return the path of the sensor-data CSV inside a trial folder.
+
+    create_folder_with_files() names it after the folder, but the name is not
+    always identical, so pick the CSV that has the expected sensor columns.
+    """
+    for name in sorted(os.listdir(trial_folder)):
+        if not name.endswith(".csv") or name == "calibration.csv":
+            continue
+        path = os.path.join(trial_folder, name)
+        with open(path, "r", newline="") as file:
+            header = next(csv.reader(file), [])
+        if "time" in header and "pressure0_convert" in header:
+            return path
+    raise FileNotFoundError(f"No trial data CSV found in {trial_folder}")
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def load_trial_data(csv_path):
+    """
+    Read time, input/balloon pressures and target pressure from a trial CSV.
+
+    :return: dict of equal-length lists, sorted by time.
+    """
+    data = {"time": [], "input": [], "pressure1": [], "pressure2": [], "target": []}
+    with open(csv_path, "r", newline="") as file:
+        for row in csv.DictReader(file):
+            t = _to_float(row.get("time"))
+            if t is None:
+                continue
+            data["time"].append(t)
+            data["input"].append(_to_float(row.get("pressure0_convert")))
+            data["pressure1"].append(_to_float(row.get("pressure1_convert")))
+            data["pressure2"].append(_to_float(row.get("pressure2_convert")))
+            data["target"].append(_to_float(row.get("self_target_pressure")))
+    times = data["time"]
+    if any(later < earlier for earlier, later in zip(times, times[1:])):
+        # Rendering looks frames up with bisect; restore time order (stable, so ties keep file order)
+        order = sorted(range(len(times)), key=times.__getitem__)
+        data = {key: [values[i] for i in order] for key, values in data.items()}
+    return data
+
+
+def _render_chunk(args):
+    """
+    Worker: render frames [first_frame, last_frame) into one MP4 segment.
+
+    The chunk only receives the samples it can actually see, i.e. from one
+    window before its first frame up to its last frame.
+    """
+    segment_path, first_frame, last_frame, fps, window, y_range, dark, data = args
+    renderer = PressureFrameRenderer(dark=dark, y_range=y_range)
+    width, height = renderer.frame_size()
+    writer = FFmpegWriter(segment_path, width, height, fps=fps)
+    times = data["time"]
+    t0 = times[0] if times else 0.0
+
+    try:
+        for frame in range(first_frame, last_frame):
+            frame_time = t0 + frame / fps
+            lo = bisect.bisect_left(times, frame_time - window)
+            hi = bisect.bisect_right(times, frame_time)
+            target = data["target"][hi - 1] if hi > 0 else None
+            writer.write(renderer.render(times[lo:hi], data["input"][lo:hi],
+                                         data["pressure1"][lo:hi], data["pressure2"][lo:hi],
+                                         target_pressure=target, window=window))
+    finally:
+        returncode = writer.close()
+    if returncode != 0:
+        raise RuntimeError(f"ffmpeg failed while writing {segment_path}")
+    return segment_path
+
+
+def _slice_data(data, start_time, end_time):
+    lo = bisect.bisect_left(data["time"], start_time)
+    hi = bisect.bisect_right(data["time"], end_time)
+    return {key: values[lo:hi] for key, values in data.items()}
+
+
+def concat_segments(segment_paths, output_path, ffmpeg_path=None):
+    """Join MP4 segments encoded with identical settings using a stream copy."""
+    ffmpeg_path = ffmpeg_path or shutil.which("ffmpeg")
+    list_path = os.path.join(os.path.dirname(segment_paths[0]), "segments.txt")
+    with open(list_path, "w") as file:
+        for path in segment_paths:
+            file.write(f"file '{os.path.abspath(path)}'\n")
+    subprocess.run([ffmpeg_path, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+                    "-i", list_path, "-c", "copy", "-movflags", "+faststart", output_path],
+                   check=True)
+
+
+def render_trial_video(trial_folder, output_path=None, fps=30, window=30, workers=None,
+                       y_range=None, dark=True, chunk_seconds=60):
+    """
+    Render the pressure graph of a finished trial to an MP4.
+
+    :param trial_folder: Path to ./data/<trial>/.
+    :param output_path: Defaults to <trial_folder>/<trial>_pressure.mp4.
+    :param workers: Number of render processes (default: all cores).
+    :param chunk_seconds: Length of video rendered by each task.
+    :return: Path of the written MP4.
+    """
+    if shutil.which("ffmpeg") is None:
+        raise RuntimeError("ffmpeg was not found on PATH; cannot render video.")
+
+    trial_folder = os.path.normpath(trial_folder)
+    trial_name = os.path.basename(trial_folder)
+    if output_path is None:
+        output_path = os.path.join(trial_folder, f"{trial_name}_pressure.mp4")
+
+    data = load_trial_data(find_trial_csv(trial_folder))
+    if len(data["time"]) < 2:
+        raise ValueError(f"Trial {trial_name} does not contain enough samples to render.")
+
+    t0 = data["time"][0]
+    duration = data["time"][-1] - t0
+    total_frames = int(math.ceil(duration * fps)) + 1
+    frames_per_chunk = max(1, int(chunk_seconds * fps))
+
+    start = time.time()
+    with tempfile.TemporaryDirectory(prefix="meshalyzer_render_") as tmp_dir:
+        tasks = []
+        for index, first_frame in enumerate(range(0, total_frames, frames_per_chunk)):
+            last_frame = min(first_frame + frames_per_chunk, total_frames)
+            chunk_data = _slice_data(data, t0 + first_frame / fps - window, t0 + last_frame / fps)
+            segment_path = os.path.join(tmp_dir, f"segment_{index:05d}.mp4")
+            tasks.append((segment_path, first_frame, last_frame, fps, window, y_range, dark, chunk_data))
+
+        print(f"Rendering {trial_name}: {total_frames} frames in {len(tasks)} chunks...")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            segment_paths = list(pool.map(_render_chunk, tasks))
+
+        concat_segments(segment_paths, output_path)
+
+    elapsed = time.time() - start
+    print(f"Saved {output_path}: {duration:.1f} s of trial rendered in {elapsed:.1f} s "
+          f"({duration / elapsed if elapsed > 0 else float('inf'):.1f}x real time)")
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a finished trial's pressure graph to video.")
+    parser.add_argument("trial_folder", help="Trial folder, e.g. ./data/20250101_0000_01")
+    parser.add_argument("-o", "--output", help="Output MP4 path")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--window", type=float, default=30, help="Visible time window in seconds")
+    parser.add_argument("--workers", type=int, default=None, help="Render processes (default: all cores)")
+    parser.add_argument("--ymin", type=float, default=None)
+    parser.add_argument("--ymax", type=float, default=None)
+    parser.add_argument("--light", action="store_true", help="Render with a light background")
+    args = parser.parse_args()
+
+    y_range = (args.ymin, args.ymax) if args.ymin is not None and args.ymax is not None else None
+    render_trial_video(args.trial_folder, output_path=args.output, fps=args.fps, window=args.window,
+                       workers=args.workers, y_range=y_range, dark=not args.light)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Always-on rolling statistics of the calibrated pressures.
+
+The App adds every calibrated sample of the PressureReceiver stream
+(~100 Hz) here, and a time-based window of
+the last few seconds is kept per channel with a running sum, sum of squares
+and a monotonic queue for the maximum. Mean, max and standard deviation are
+therefore available in O(1) at any moment. Smart steps used to block for
+5 s per measurement (10-15 s per cycle) sampling the same values at 20 Hz;
+now they read the window and only wait while it does not yet cover the
+full window or the pressure is still moving.
+"""
+import collections
+import threading
+import time
+
+CHANNELS = ("input", "pressure1", "pressure2", "internal")
+
+# Snapshot of one window; mean/max/std are None while the window is empty
+WindowStats = collections.namedtuple("WindowStats", "count mean max std span")
+
+
+class RollingWindow:
+    # Running sums are rebuilt from the samples after this many evictions to stop float drift
+    RESUM_EVERY = 10000
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.samples = collections.deque()  # (t, value)
+        self._maxima = collections.deque()  # (t, value), values strictly decreasing
+        self._sum = 0.0
+        self._sum_sq = 0.0
+        self._evictions = 0
+
+    def add(self, t, value):
+        self.samples.append((t, value))
+        self._sum += value
+        self._sum_sq += value * value
+        maxima = self._maxima
+        while maxima and maxima[-1][1] <= value:
+            maxima.pop()
+        maxima.append((t, value))
+        self.evict(t)
+
+    def evict(self, now):
+        """Drop samples older than `seconds` before `now`."""
+        cutoff = now - self.seconds
+        samples = self.samples
+        while samples and samples[0][0] < cutoff:
+            _, value = samples.popleft()
+            self._sum -= value
+            self._sum_sq -= value * value
+            self._evictions += 1
+        while self._maxima and self._maxima[0][0] < cutoff:
+            self._maxima.popleft()
+        if self._evictions >= self.RESUM_EVERY:
+            self._sum = sum(value for _, value in samples)
+            self._sum_sq = sum(value * value for _, value in samples)
+            self._evictions = 0
+
+    def stats(self):
+        n = len(self.samples)
+        if n == 0:
+            return WindowStats(0, None, None, None, 0.0)
+        mean = self._sum / n
+        variance = max(self._sum_sq / n - mean * mean, 0.0)
+        return WindowStats(n, mean, self._maxima[0][1], variance ** 0.5,
+                           self.samples[-1][0] - self.samples[0][0])
+
+
+class RollingPressureStats:
+    """
+    :param window_seconds: Length of every channel's window.
+    :param clock/sleep: Time source of the samples and how to wait (injectable for simulation).
+    :param coverage: Fraction of the window the samples must span before it counts as full.
+    """
+
+    def __init__(self, window_seconds=5.0, clock=time.monotonic, sleep=time.sleep,
+                 coverage=0.9, poll_seconds=0.05):
+        self.window_seconds = window_seconds
+        self.clock = clock
+        self.sleep = sleep
+        self.coverage = coverage
+        self.poll_seconds = poll_seconds
+        self.windows = {channel: RollingWindow(window_seconds) for channel in CHANNELS}
+        self._lock = threading.Lock()
+
+    def add_sample(self, t, input_pressure, pressure1, pressure2):
+        with self._lock:
+            windows = self.windows
+            windows["input"].add(t, input_pressure)
+            windows["pressure1"].add(t, pressure1)
+            windows["pressure2"].add(t, pressure2)
+            windows["internal"].add(t, (pressure1 + pressure2) / 2)
+
+    def stats(self, channel):
+        with self._lock:
+            window = self.windows[channel]
+            window.evict(self.clock())
+            return window.stats()
+
+    def is_stable(self, stats, max_std):
+        return (stats.count > 1 and stats.span >= self.coverage * self.window_seconds
+                and stats.std <= max_std)
+
+    def wait_stable(self, channel, max_std, timeout):
+        """
+        Return the channel's WindowStats as soon as the window is full and its standard
+        deviation is at most `max_std` psi, or after `timeout` seconds with whatever it holds.
+        """
+        return self.wait_all_stable((channel,), max_std, timeout)[channel]
+
+    def wait_all_stable(self, channels, max_std, timeout):
+        """{channel: WindowStats} once every channel's window is stable, or after `timeout` seconds in total."""
+        deadline = self.clock() + timeout
+        while True:
+            stats = {channel: self.stats(channel) for channel in channels}
+            if all(self.is_stable(s, max_std) for s in stats.values()) or self.clock() >= deadline:
+                return stats
+            self.sleep(self.poll_seconds)
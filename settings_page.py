@@ -66,6 +66,41 @@ class SettingsPage(ctk.CTkFrame):
                 "description": "Hex or color name for theme accent.",
                 "type": "str"
             },
+            "fast_start": {
+                "title": "Fast Start",
+                "description": "Skip the boot video on startup (models still load in the background).",
+                "type": "bool"
+            },
+            "profile_startup": {
+                "title": "Profile Startup",
+                "description": "Print per-import and per-phase startup timings to the console.",
+                "type": "bool"
+            },
+            "pressure_lead_s": {
+                "title": "Pressure Lead",
+                "description": "Seconds ahead a pressure target is predicted to cover valve dead time.",
+                "type": "float"
+            },
+            "pressure_timeout_s": {
+                "title": "Pressure Timeout",
+                "description": "Close the valves if a pressure target is not reached within this many seconds.",
+                "type": "float"
+            },
+            "pressure_settle_s": {
+                "title": "Pressure Settle",
+                "description": "Seconds the pressure is followed after closing to measure overshoot.",
+                "type": "float"
+            },
+            "pressure_stale_s": {
+                "title": "Pressure Stale",
+                "description": "Close the valves if no pressure sample has arrived for this many seconds.",
+                "type": "float"
+            },
+            "smart_stable_psi": {
+                "title": "Smart Step Stability",
+                "description": "Smart steps start at once when the last 5 s of pressure vary less than this (std, PSI).",
+                "type": "float"
+            },
             "color_scheme": {
                 "title": "Color Scheme",
                 "description": "Choose the color scheme.",
@@ -145,6 +180,21 @@ class SettingsPage(ctk.CTkFrame):
         restore_button = ctk.CTkButton(button_frame, text="Restore", command=self.restore_defaults)
         restore_button.pack(side="left", padx=10)
 
+    def on_show(self):
+        """
+        Refresh the widgets from settings.txt when the cached page is shown again,
+        unless the user has unsaved edits on it.
+        """
+        if self.settings_modified:
+            return
+        self.settings = read_settings()
+        for key, widgets in self.setting_widgets.items():
+            if key in self.settings:
+                if widgets["definition"]["type"] == "bool":
+                    widgets["input_var"].set(self.str_to_bool(self.settings[key]))
+                else:
+                    widgets["input_var"].set(self.settings[key])
+
     def str_to_bool(self, s):
         return s.lower() in ("true", "1", "yes")
 
@@ -196,6 +246,12 @@ class SettingsPage(ctk.CTkFrame):
         except Exception as e:
             print("Error parsing graph_time_range:", e)
         self.app.accent_color = new_settings.get("accent_color", self.app.accent_color)
+        for key in ("pressure_lead_s", "pressure_timeout_s", "pressure_settle_s", "pressure_stale_s",
+                    "smart_stable_psi"):
+            try:
+                setattr(self.app, key, float(new_settings[key]))
+            except (KeyError, ValueError) as e:
+                print(f"Error parsing {key}:", e)
         self.app.color_scheme = new_settings.get("color_scheme", "System")
         self.save_apply_button.configure(state="disabled", fg_color="gray")
         self.settings_modified = False
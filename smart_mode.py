@@ -1,9 +1,9 @@
-import joblib
 import numpy as np
 
-# Load your trained model
-model_path = "/Users/colehanan/Desktop/WashuClasses/MeshAlyzer/getting_Q/inflation_time_model.pkl"
-model = joblib.load(model_path)
+from model_registry import ModelRegistry
+
+# Load the registered inflation-time model
+model = ModelRegistry().load("inflation_time")
 
 def predict_duration(avg_pre, avg_input, avg_post):
     X = np.array([[avg_pre, avg_input, avg_post]])
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Startup profiling and lazy imports for main.py.
+
+StartupProfiler times every top-level import (while its import timer is
+installed) and every init phase marked with checkpoint(), and prints a
+report once the home screen is usable. LazyModule defers a heavy import until
+the first attribute access, and warm_up() imports modules or runs loaders on
+a background thread after the first paint.
+"""
+import builtins
+import importlib
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+
+class StartupProfiler:
+    """
+    Collects per-import and per-phase timings from process start to a usable UI.
+
+    Imports are timed by wrapping builtins.__import__; only the outermost
+    import of each statement is recorded, so a module's time includes the
+    modules it pulls in.
+    """
+
+    def __init__(self, enabled=True, min_import_seconds=0.005):
+        self.enabled = enabled
+        self.min_import_seconds = min_import_seconds
+        self.start = time.perf_counter()
+        self.imports = []  # (module name, seconds, how) with how in {"startup", "lazy", "warm-up"}
+        self.phases = []  # (phase name, seconds)
+        self.events = {}  # milestone name -> seconds since start
+        self._last_checkpoint = self.start
+        self._lock = threading.Lock()
+        self._original_import = None
+        self._depth = threading.local()
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def install_import_timer(self):
+        if self._original_import is not None:
+            return
+        original_import = builtins.__import__
+        self._original_import = original_import
+
+        def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+            depth = getattr(self._depth, "value", 0)
+            self._depth.value = depth + 1
+            t0 = time.perf_counter()
+            try:
+                return original_import(name, globals, locals, fromlist, level)
+            finally:
+                self._depth.value = depth
+                if depth == 0:
+                    self.record_import(name, time.perf_counter() - t0, "startup")
+
+        builtins.__import__ = timed_import
+
+    def uninstall_import_timer(self):
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    @contextmanager
+    def timing_import(self, name, how):
+        """Time an explicit import without also recording the imports it triggers."""
+        depth = getattr(self._depth, "value", 0)
+        self._depth.value = depth + 1
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._depth.value = depth
+            self.record_import(name, time.perf_counter() - t0, how)
+
+    def record_import(self, name, seconds, how):
+        if seconds < self.min_import_seconds:
+            return
+        with self._lock:
+            self.imports.append((name, seconds, how))
+
+    def record_phase(self, phase, seconds):
+        with self._lock:
+            self.phases.append((phase, seconds))
+
+    def checkpoint(self, phase):
+        """Record the time spent since the previous checkpoint under `phase`."""
+        now = time.perf_counter()
+        with self._lock:
+            self.phases.append((phase, now - self._last_checkpoint))
+            self._last_checkpoint = now
+
+    def mark(self, event):
+        """Record a milestone such as "first paint" (seconds since start)."""
+        with self._lock:
+            self.events.setdefault(event, self.elapsed())
+
+    def report(self):
+        with self._lock:
+            imports = sorted(self.imports, key=lambda item: item[1], reverse=True)
+            phases = list(self.phases)
+            events = sorted(self.events.items(), key=lambda item: item[1])
+        lines = ["---- startup profile ----", "imports (cumulative, slowest first):"]
+        for name, seconds, how in imports:
+            lines.append(f"  {seconds:7.3f} s  {name}" + (f"  [{how}]" if how != "startup" else ""))
+        lines.append("init phases:")
+        for name, seconds in phases:
+            lines.append(f"  {seconds:7.3f} s  {name}")
+        lines.append("milestones:")
+        for name, seconds in events:
+            lines.append(f"  {seconds:7.3f} s  {name}")
+        return "\n".join(f"[startup] {line}" for line in lines)
+
+    def print_report(self):
+        if self.enabled:
+            print(self.report())
+
+
+def setting_enabled(path, key):
+    """A true/false key of a settings file, read without importing anything else."""
+    try:
+        with open(path) as file:
+            for line in file:
+                name, sep, value = line.partition("=")
+                if sep and name.strip() == key:
+                    return value.strip().lower() in ("true", "1", "yes")
+    except OSError:
+        pass
+    return False
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is imported on first attribute access.
+
+        cv2 = LazyModule("cv2", profiler)
+        cv2.VideoCapture(...)   # imports cv2 here
+    """
+
+    def __init__(self, name, profiler=None):
+        self.__dict__["_name"] = name
+        self.__dict__["_profiler"] = profiler
+        self.__dict__["_module"] = None
+        self.__dict__["_lock"] = threading.Lock()
+
+    def load(self, how="lazy"):
+        module = self.__dict__["_module"]
+        if module is not None:
+            return module
+        with self.__dict__["_lock"]:
+            if self.__dict__["_module"] is None:
+                profiler = self._profiler
+                with profiler.timing_import(self._name, how) if profiler is not None else nullcontext():
+                    module = importlib.import_module(self._name)
+                self.__dict__["_module"] = module
+        return self.__dict__["_module"]
+
+    def is_loaded(self):
+        return self.__dict__["_module"] is not None
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self.is_loaded() else "not loaded"
+        return f"<LazyModule {self._name} ({state})>"
+
+
+def warm_up(tasks, profiler=None, on_done=None):
+    """
+    Run warm-up work on a daemon thread.
+
+    :param tasks: Iterable of LazyModule instances (imported) or (name, callable)
+                  pairs (called); each is timed as a warm-up phase.
+    :param on_done: Optional callable invoked on the warm-up thread when finished.
+    :return: The started thread.
+    """
+    def run():
+        for task in tasks:
+            try:
+                if isinstance(task, LazyModule):
+                    task.load(how="warm-up")
+                else:
+                    name, func = task
+                    t0 = time.perf_counter()
+                    func()
+                    if profiler is not None:
+                        profiler.record_phase(f"warm-up: {name}", time.perf_counter() - t0)
+            except Exception as e:
+                print(f"[startup] warm-up task {task!r} failed: {e}")
+        if on_done is not None:
+            on_done()
+
+    thread = threading.Thread(target=run, name="startup-warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Online per-step metric aggregators for protocol runs.
+
+read_sensors annotates every sample with the current protocol step and
+feeds it here, where running first/last/min/max/count values are kept per
+step and channel. The metrics a protocol can save after an Inflate/Deflate
+step (max_force, final_angle, total_time, ...) are therefore available in
+O(1) as soon as the step ends, without re-reading data.csv. Inside Repeat
+blocks every cycle of a step gets its own aggregate; only the most recent
+`max_aggregates` are kept, so memory does not grow with the cycle count.
+
+Channel names follow the home screen: "angle" is the input pressure
+(pressure0_convert) and "force" is the mean balloon pressure of
+pressure1_convert and pressure2_convert.
+"""
+import collections
+import threading
+
+# metric name -> (channel, statistic)
+METRICS = {
+    "min_force": ("force", "min"),
+    "max_force": ("force", "max"),
+    "final_force": ("force", "last"),
+    "min_angle": ("angle", "min"),
+    "max_angle": ("angle", "max"),
+    "final_angle": ("angle", "last"),
+    "start_time": ("time", "first"),
+    "final_time": ("time", "last"),
+    "total_time": ("time", "duration"),
+}
+
+
+class ChannelAggregate:
+    __slots__ = ("count", "first", "last", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.first = None
+        self.last = None
+        self.min = None
+        self.max = None
+
+    def update(self, value):
+        if value is None:
+            return
+        if self.count == 0:
+            self.first = self.min = self.max = value
+        elif value < self.min:
+            self.min = value
+        elif value > self.max:
+            self.max = value
+        self.last = value
+        self.count += 1
+
+    @property
+    def duration(self):
+        """last - first; for the time channel this is the step's duration."""
+        if self.count == 0:
+            return None
+        return self.last - self.first
+
+
+class StepAggregate:
+    CHANNELS = ("time", "angle", "pressure1", "pressure2", "force")
+
+    def __init__(self):
+        self.channels = {name: ChannelAggregate() for name in self.CHANNELS}
+
+    def add(self, t, input_pressure, pressure1, pressure2):
+        channels = self.channels
+        channels["time"].update(t)
+        channels["angle"].update(input_pressure)
+        channels["pressure1"].update(pressure1)
+        channels["pressure2"].update(pressure2)
+        if pressure1 is not None and pressure2 is not None:
+            channels["force"].update((pressure1 + pressure2) / 2)
+
+    @property
+    def count(self):
+        return self.channels["time"].count
+
+
+class StepMetrics:
+    def __init__(self, max_aggregates=256):
+        self.max_aggregates = max_aggregates
+        self._steps = collections.OrderedDict()  # (step, cycle) -> StepAggregate
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self._steps.clear()
+
+    def add_sample(self, step, cycle, t, input_pressure, pressure1, pressure2):
+        if step is None:
+            return
+        key = (step, cycle)
+        with self._lock:
+            aggregate = self._steps.get(key)
+            if aggregate is None:
+                aggregate = self._steps[key] = StepAggregate()
+                while len(self._steps) > self.max_aggregates:
+                    self._steps.popitem(last=False)
+            aggregate.add(t, input_pressure, pressure1, pressure2)
+
+    def step(self, step, cycle=None):
+        """Return the StepAggregate of `step` in `cycle`, or None if no samples were recorded for it."""
+        return self._steps.get((step, cycle))
+
+    def metric(self, metric, step, cycle=None):
+        """
+        Value of a named metric (see METRICS) over the samples of `step` in `cycle`.
+
+        :raises ValueError: for an unknown metric or a step without data, like the
+                            old data.csv-based calculate_metric.
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric: {metric}")
+        channel, statistic = METRICS[metric]
+        with self._lock:
+            aggregate = self._steps.get((step, cycle))
+            value = None
+            if aggregate is not None and aggregate.count:
+                value = getattr(aggregate.channels[channel], statistic)
+        if value is None:
+            raise ValueError(f"No data found for protocol step {step}")
+        return value
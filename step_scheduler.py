@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Deadline scheduler for protocol valve edges and waits.
+
+Every timed edge (valve open, valve close, end of a wait) is planned on an
+absolute time.monotonic() timeline rather than by chaining time.sleep()
+calls. The next deadline is computed from the previous *planned* time, not
+from when the previous edge actually happened, so prints, file I/O and
+thread scheduling delay an edge by a few milliseconds at most instead of
+adding up over a 15-cycle protocol. Planned and actual times of every edge
+are recorded and written as timing.csv into the trial folder; for long runs
+they are streamed to a log file as they happen so memory does not grow with
+the number of cycles.
+
+Parallel tracks (one per valve) run on the same timeline: run_tracks()
+keeps a cursor per track and fires the edges of all tracks on one thread
+in planned-time order, so the valves of two staggered tracks switch within
+the same few milliseconds of their plan as a single sequence would.
+"""
+import csv
+import heapq
+import time
+
+
+class StepScheduler:
+    """
+    :param clock: Monotonic clock in seconds (injectable for tests/simulation).
+    :param sleep: Sleep function matching `clock`.
+    :param spin_seconds: The last part of every wait is spent polling the clock
+                         instead of sleeping, because sleep() tends to overshoot.
+    """
+
+    HEADER = ["step", "line", "cycle", "edge", "planned_s", "actual_s", "error_ms"]
+
+    def __init__(self, clock=time.monotonic, sleep=time.sleep, spin_seconds=0.002):
+        self.clock = clock
+        self.sleep = sleep
+        self.spin_seconds = spin_seconds
+        self.origin = None
+        self.cursor = None  # planned time of the most recent edge
+        self.records = []  # (step, line, cycle, edge, planned_s, actual_s) relative to origin
+        self.step = None
+        self.line_number = None
+        self.cycle = None
+        self.edges = 0
+        self._error_sum_ms = 0.0
+        self._error_max_ms = 0.0
+        self._log_file = None
+        self._log = None
+
+    def start(self, log_path=None):
+        """
+        Start a new timeline; planned and actual times are reported relative to now.
+
+        :param log_path: If given, edges are streamed to this CSV instead of being kept in `records`.
+        """
+        self.close_log()
+        self.origin = self.clock()
+        self.cursor = self.origin
+        self.records = []
+        self.edges = 0
+        self._error_sum_ms = 0.0
+        self._error_max_ms = 0.0
+        if log_path is not None:
+            self._log_file = open(log_path, "w", newline="")
+            self._log = csv.writer(self._log_file)
+            self._log.writerow(self.HEADER)
+
+    def close_log(self):
+        if self._log_file is not None:
+            self._log_file.close()
+            self._log_file = None
+            self._log = None
+
+    def set_step(self, step, cycle=None):
+        self.step = step.index
+        self.line_number = step.line_number
+        self.cycle = cycle
+
+    def resync(self):
+        """
+        Move the timeline to the current time.
+
+        Called after anything that is not time-planned (pressure-mode steps, ML
+        measurements, user input), so the next edge is not scheduled in the past.
+        """
+        self.cursor = self.clock()
+
+    def sleep_until(self, deadline):
+        while True:
+            remaining = deadline - self.clock()
+            if remaining <= 0:
+                return
+            if remaining > self.spin_seconds:
+                self.sleep(remaining - self.spin_seconds)
+
+    def edge(self, name, action=None):
+        """Run `action` at the current planned time and record when it actually ran."""
+        self._fire(self.cursor, name, action)
+
+    def _fire(self, planned, name, action):
+        self.sleep_until(planned)
+        if action is not None:
+            action()
+        self._record(name, planned - self.origin, self.clock() - self.origin)
+
+    def _record(self, name, planned, actual):
+        error_ms = abs(actual - planned) * 1000
+        self.edges += 1
+        self._error_sum_ms += error_ms
+        self._error_max_ms = max(self._error_max_ms, error_ms)
+        record = (self.step, self.line_number, self.cycle, name, planned, actual)
+        if self._log is not None:
+            self._log.writerow(self._format(record))
+        else:
+            self.records.append(record)
+
+    def wait(self, seconds, name="wait end"):
+        """Advance the planned timeline by `seconds` and block until then."""
+        self.cursor += seconds
+        self.edge(name)
+
+    def pulse(self, open_action, close_action, seconds, name):
+        """Open at the planned time, close exactly `seconds` of planned time later."""
+        self.edge(f"{name} open", open_action)
+        self.cursor += seconds
+        self.edge(f"{name} close", close_action)
+
+    def run_tracks(self, tracks, barriers):
+        """
+        Run several timelines concurrently, starting at the current planned time.
+
+        Each track is an iterator of commands on its own cursor:
+            ("wait", seconds)                      advance the track's cursor
+            ("edge", name, action, step, cycle)    run `action` at the track's cursor
+            ("sync", label)                        wait for the other tracks of `label`
+        Edges of all tracks fire in planned-time order. A sync releases once every
+        unfinished track in barriers[label] (a set of track positions) has reached it,
+        at the latest of their planned times. Afterwards the timeline continues from
+        the end of the longest track.
+        """
+        start = self.cursor
+        end = start
+        runnable = [(start, position) for position in range(len(tracks))]
+        heapq.heapify(runnable)
+        arrived = {label: {} for label in barriers}  # label -> {track position: planned arrival}
+        finished = set()
+
+        def release_ready():
+            for label, waiting in arrived.items():
+                if waiting and all(position in waiting or position in finished for position in barriers[label]):
+                    release = max(waiting.values())
+                    for position in waiting:
+                        heapq.heappush(runnable, (release, position))
+                    waiting.clear()
+
+        while runnable:
+            cursor, position = heapq.heappop(runnable)
+            command = next(tracks[position], None)
+            if command is None:
+                finished.add(position)
+                end = max(end, cursor)
+                release_ready()
+            elif command[0] == "wait":
+                heapq.heappush(runnable, (cursor + command[1], position))
+            elif command[0] == "edge":
+                _, name, action, step, cycle = command
+                self.set_step(step, cycle)
+                self._fire(cursor, name, action)
+                heapq.heappush(runnable, (cursor, position))
+            else:
+                arrived[command[1]][position] = cursor
+                release_ready()
+        self.cursor = end
+
+    def summary(self):
+        """Return (edges, mean |error| ms, max |error| ms) of the recorded edges."""
+        if not self.edges:
+            return 0, 0.0, 0.0
+        return self.edges, self._error_sum_ms / self.edges, self._error_max_ms
+
+    @staticmethod
+    def _format(record):
+        step, line, cycle, name, planned, actual = record
+        return [step, line, cycle or "", name, f"{planned:.6f}", f"{actual:.6f}",
+                f"{(actual - planned) * 1000:.3f}"]
+
+    def write_csv(self, path):
+        """Write the edges kept in memory (used when no log_path was given to start())."""
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(self.HEADER)
+            for record in self.records:
+                writer.writerow(self._format(record))
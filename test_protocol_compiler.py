@@ -0,0 +1,102 @@
+"""Behaviour checks of the block validation in protocol_compiler.py (run with pytest)."""
+import pytest
+
+from protocol_compiler import ParallelBlock, ProtocolError, RepeatBlock, Track, Wait, compile_protocol
+from variable_store import Expression
+
+
+def compile_lines(*lines):
+    return compile_protocol("\n".join(lines), "test")
+
+
+def error_of(*lines):
+    with pytest.raises(ProtocolError) as info:
+        compile_lines(*lines)
+    return info.value
+
+
+PARALLEL = [
+    "Parallel {",
+    "Track valve1 {",
+    "Inflate: time, 1, valve1",
+    "Sync: loaded",
+    "Deflate: time, 1, valve1",
+    "}",
+    "Track valve2 {",
+    "Wait: 0.5",
+    "Inflate: time, 0.5, valve2",
+    "Sync: loaded",
+    "}",
+    "}",
+]
+
+
+def test_nested_repeat_variables_and_lengths():
+    protocol = compile_lines("Repeat 3 {", "Repeat 2 {", "Wait: 1", "}", "Inflate: time, 1, both", "}")
+    outer = protocol.steps[0]
+    assert isinstance(outer, RepeatBlock) and (outer.count, outer.variable) == (3, "cycle")
+    inner = outer.body[0]
+    assert (inner.count, inner.variable) == (2, "cycle_1")
+    assert protocol.executed_length(protocol.steps) == 3 * (2 + 1)
+
+
+def test_repeat_errors():
+    assert error_of("Repeat 2.5 {", "Wait: 1", "}").line_number == 1
+    assert "negative" in error_of("Repeat -1 {", "}").message
+    assert "already used" in error_of("Repeat 2 as n {", "Repeat 2 as n {", "}", "}").message
+    assert error_of("Wait: 1", "Repeat 2 {", "Wait: 1").line_number == 2  # never closed
+    assert error_of("Wait: 1", "}").line_number == 2  # unmatched
+
+
+def test_parallel_tracks():
+    protocol = compile_lines(*PARALLEL)
+    block = protocol.steps[0]
+    assert isinstance(block, ParallelBlock)
+    assert [track.valve for track in block.tracks] == ["valve1", "valve2"]
+    assert all(isinstance(track, Track) for track in block.tracks)
+
+
+@pytest.mark.parametrize("lines, message", [
+    (["Parallel {", "}"], "at least one Track"),
+    (["Parallel {", "Wait: 1", "}"], "only contain Track"),
+    (["Track valve1 {", "}"], "directly inside a Parallel"),
+    (["Parallel {", "Track valve1 {", "}", "Track valve1 {", "}", "}"], "already has a Track"),
+    (["Parallel {", "Track valve1 {", "Inflate: pressure, 1, valve1", "}", "}"], "time mode"),
+    (["Parallel {", "Track valve1 {", "Inflate: time, 1, valve2", "}", "}"], "must use valve1"),
+    (["Parallel {", "Track valve1 {", "SmartDeflateML: valve1", "}", "}"], "not allowed inside a Track"),
+    (["Parallel {", "Track valve1 {", "Parallel {", "}", "}", "}"], "cannot be nested"),
+    (["Parallel {", "Track valve1 {", "Repeat 2 as n {", "Wait: 1", "}", "}",
+      "Track valve2 {", "Repeat 2 as n {", "Wait: 1", "}", "}", "}"], "more than one Track"),
+])
+def test_parallel_errors(lines, message):
+    assert message in error_of(*lines).message
+
+
+def test_sync_must_balance():
+    assert "only used by Track" in error_of(
+        "Parallel {", "Track valve1 {", "Sync: a", "}", "Track valve2 {", "Wait: 1", "}", "}").message
+    unbalanced = error_of("Parallel {", "Track valve1 {", "Repeat 2 {", "Sync: a", "}", "}",
+                          "Track valve2 {", "Sync: a", "}", "}")
+    assert "different number of times" in unbalanced.message
+    assert unbalanced.line_number == 1
+    # Reached twice in both tracks, once through a Repeat
+    compile_lines("Parallel {", "Track valve1 {", "Repeat 2 {", "Sync: a", "}", "}",
+                  "Track valve2 {", "Sync: a", "Sync: a", "}", "}")
+
+
+def test_sync_outside_track():
+    assert "only allowed inside a Track" in error_of("Sync: a").message
+
+
+def test_expression_arguments_are_compiled_once():
+    step = compile_lines("Wait: (peak * 0.5)").steps[0]
+    assert isinstance(step, Wait)
+    assert isinstance(step.seconds, Expression) and step.seconds.names == {"peak"}
+    assert "not allowed" in error_of("Wait: (peak.real)").message
+    assert "must be a number" in error_of("SmartDeflateML: (peak * 0.5), both").message
+
+
+def test_required_subsystems_follow_the_steps():
+    assert compile_lines("Wait: 1").required_subsystems == {"valves", "calibration"}
+    assert "inflation_model" in compile_lines("SmartInflateML: 3, both").required_subsystems
+    assert compile_lines("SmartDeflateML: both").required_subsystems == {"valves", "calibration", "deflation_model"}
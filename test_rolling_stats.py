@@ -0,0 +1,78 @@
+"""Behaviour checks of rolling_stats.py (run with pytest)."""
+import statistics
+
+import pytest
+
+from rolling_stats import RollingPressureStats, RollingWindow
+
+
+class FakeClock:
+    def __init__(self):
+        self.t = 0.0
+
+    def now(self):
+        return self.t
+
+    def sleep(self, seconds):
+        self.t += seconds
+
+
+def test_window_evicts_old_samples():
+    window = RollingWindow(1.0)
+    for i in range(30):
+        window.add(i * 0.25, float(i))
+    stats = window.stats()
+    # Samples older than 1 s before the newest (t = 7.25) are gone
+    kept = [float(i) for i in range(25, 30)]
+    assert stats.count == len(kept)
+    assert stats.mean == pytest.approx(statistics.fmean(kept))
+    assert stats.std == pytest.approx(statistics.pstdev(kept))
+    assert stats.span == pytest.approx(1.0)
+
+
+def test_max_follows_eviction():
+    window = RollingWindow(1.0)
+    for t, value in [(0.0, 5.0), (0.5, 1.0), (0.8, 3.0), (1.2, 2.0)]:
+        window.add(t, value)
+    assert window.stats().max == 3.0  # 5.0 at t = 0 has left the window
+    window.evict(1.9)
+    assert window.stats().max == 2.0
+    window.evict(5.0)
+    assert window.stats() == (0, None, None, None, 0.0)
+
+
+def test_max_queue_stays_decreasing():
+    window = RollingWindow(10.0)
+    for t, value in enumerate([1.0, 4.0, 2.0, 2.0, 3.0, 0.5]):
+        window.add(float(t), value)
+    values = [value for _, value in window._maxima]
+    assert values == [4.0, 3.0, 0.5]
+
+
+def test_resum_keeps_the_running_sums_exact():
+    window = RollingWindow(1.0)
+    window.RESUM_EVERY = 5
+    for i in range(50):
+        window.add(i * 0.1, 1e6 + (i % 3))
+    kept = [1e6 + (i % 3) for i in range(40, 50)]
+    assert window.stats().mean == pytest.approx(statistics.fmean(kept))
+
+
+def test_wait_all_stable_shares_one_deadline():
+    clock = FakeClock()
+    stats = RollingPressureStats(window_seconds=1.0, clock=clock.now, sleep=clock.sleep)
+    stats.add_sample(0.0, 1.0, 2.0, 4.0)
+    result = stats.wait_all_stable(("input", "pressure1", "internal"), 0.05, timeout=2.0)
+    # Never stable, so it returns after the one timeout, not one per channel
+    assert clock.t == pytest.approx(2.0, abs=stats.poll_seconds)
+    assert set(result) == {"input", "pressure1", "internal"}
+
+
+def test_wait_stable_returns_at_once_when_settled():
+    clock = FakeClock()
+    stats = RollingPressureStats(window_seconds=1.0, clock=clock.now, sleep=clock.sleep)
+    for i in range(11):
+        stats.add_sample(i * 0.1, 5.0, 1.0, 1.0)
+    clock.t = 1.0
+    assert stats.wait_stable("input", 0.05, timeout=5.0).mean == 5.0
+    assert clock.t == 1.0
@@ -0,0 +1,67 @@
+"""Behaviour checks of the expression whitelist in variable_store.py (run with pytest)."""
+import pytest
+
+from variable_store import Expression, VariableStore
+
+
+def store(**values):
+    variables = VariableStore()
+    for name, value in values.items():
+        variables.set(name, value)
+    return variables
+
+
+def test_arithmetic_and_allowed_calls():
+    expression = Expression("(max(peak, 2) * 0.8 + cycle // 2 - abs(-1) + round(2.5) ** 2 % 3)")
+    assert expression.names == {"peak", "cycle"}
+    assert expression.evaluate(store(peak=3.0, cycle=5)) == pytest.approx(3.0 * 0.8 + 2 - 1 + 4 % 3)
+
+
+def test_variable_name_and_string_indirection():
+    assert Expression("peak").evaluate(store(peak=1.5)) == 1.5
+    assert Expression("target").evaluate(store(peak=1.5, target="peak")) == 1.5
+
+
+@pytest.mark.parametrize("text", [
+    "peak.real",  # attribute access
+    "(().__class__.__bases__)",
+    "peak[0]",  # subscript
+    "(lambda: 1)()",  # lambda
+    "(lambda x: x)",
+    "'text'",  # non-numeric constants
+    "(None)",
+    "(b'bytes')",
+    "(max(1, 2, key=abs))",  # keyword call
+    "(__import__('os'))",  # call of anything but the whitelisted functions
+    "(open('x'))",
+    "(peak if peak else 1)",
+    "(peak < 1)",
+    "([1, 2])",
+    "(x := 1)",
+])
+def test_rejected(text):
+    with pytest.raises(ValueError):
+        Expression(text)
+
+
+def test_invalid_syntax():
+    with pytest.raises(ValueError):
+        Expression("(peak +)")
+
+
+def test_arithmetic_error_is_a_value_error():
+    with pytest.raises(ValueError, match="cannot evaluate"):
+        Expression("(peak / zero)").evaluate(store(peak=1.0, zero=0))
+    with pytest.raises(ValueError, match="cannot evaluate"):
+        Expression("(10.0 ** 400)").evaluate(store())
+
+
+def test_unknown_variable():
+    with pytest.raises(ValueError, match="not set"):
+        Expression("(missing + 1)").evaluate(store())
+
+
+def test_no_builtins_at_evaluation():
+    # Names are looked up in the store only, so builtins are variables like any other
+    with pytest.raises(ValueError):
+        Expression("(len)").evaluate(store())
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Training pipeline for the inflation and deflation time models.
+
+Q_value_calc.py and deflate_model.py used to re-read every CSV and build the
+training rows one df.iterrows() dict at a time, then fit one forest with
+default settings. This module is what both of them use now:
+
+- load_dataset() reads the summary CSVs (the calibrate page's, and the
+  rows trial_segmenter.py mined from recorded trials) and optionally the
+  timing_observations.csv of trial folders on a thread pool into one
+  columnar DataFrame. Every file's frame is cached in .timing_dataset.pkl
+  next to the data, keyed by size and modification time, so a retrain only
+  parses files that are new or changed.
+- training_arrays() selects features and target with column operations.
+- fit_model() runs a k-fold grid search over the forest settings on all
+  cores and reports hold-out and cross-validated error.
+- save_model() writes the pickle, the compiled forest and the registry
+  entry. Files are read in sorted order and every random state is fixed,
+  so the same data gives byte-identical artifacts.
+
+Usage:
+    python timing_model_training.py [--data getting_Q] [--model inflation|deflation|both]
+"""
+import argparse
+import concurrent.futures
+import os
+import time
+from pathlib import Path
+
+import pandas as pd
+
+ROOT = Path(__file__).parent
+DATA_DIR = ROOT / "getting_Q"
+CACHE_NAME = ".timing_dataset.pkl"
+
+SUMMARY_COLUMNS = ["avg_pre", "avg_in", "avg_post", "inflate_s", "vent_duration"]
+
+# Model feature -> summary column, in the order the models take them
+FEATURES = {
+    "inflation": {"initial_pressure": "avg_pre", "supply_pressure": "avg_in", "target_pressure": "avg_post"},
+    "deflation": {"initial_pressure": "avg_post", "pre_inflation_pressure": "avg_pre", "supply_pressure": "avg_in"},
+}
+# (summary column, name of the target)
+TARGETS = {"inflation": ("inflate_s", "duration"), "deflation": ("vent_duration", "deflation_time")}
+REGISTRY_NAMES = {"inflation": "inflation_time", "deflation": "deflation_time"}
+MODEL_PATHS = {"inflation": ROOT / "inflation_time_model.pkl", "deflation": ROOT / "deflation_time_model.pkl"}
+
+PARAM_GRID = {
+    "n_estimators": [100],
+    "max_depth": [None, 8, 16],
+    "min_samples_leaf": [1, 2, 4],
+    "max_features": [1.0, 0.67],
+}
+
+
+class TrainingResult:
+    def __init__(self, model, X_test, y_test, predictions, metrics, params):
+        self.model = model
+        self.X_test = X_test
+        self.y_test = y_test
+        self.predictions = predictions
+        self.metrics = metrics
+        self.params = params
+
+
+def _read_file(path):
+    """One source file as float columns SUMMARY_COLUMNS."""
+    if path.name.endswith("timing_observations.csv"):
+        # Online observations (see online_timing_learner.py): the duration column is either target
+        frame = pd.read_csv(path, usecols=["model", "avg_pre", "avg_in", "avg_post", "duration_s"])
+        frame["inflate_s"] = frame["duration_s"].where(frame["model"] == "inflation")
+        frame["vent_duration"] = frame["duration_s"].where(frame["model"] == "deflation")
+    else:
+        frame = pd.read_csv(path, usecols=lambda column: column in SUMMARY_COLUMNS)
+    return frame.reindex(columns=SUMMARY_COLUMNS).apply(pd.to_numeric, errors="coerce")
+
+
+def load_dataset(folder=DATA_DIR, extra_files=(), workers=None, use_cache=True):
+    """
+    All summary rows of `folder` (plus `extra_files`) as one DataFrame with a "source" column.
+
+    :return: (DataFrame, sorted list of the files it was read from)
+    """
+    folder = Path(folder)
+    files = sorted(set(folder.glob("*summary_*.csv")) | {Path(p) for p in extra_files})
+    cache_path = folder / CACHE_NAME
+    cache = {}
+    if use_cache and cache_path.exists():
+        try:
+            cache = pd.read_pickle(cache_path)
+        except Exception as e:
+            print(f"Ignoring unreadable dataset cache {cache_path}: {e}")
+
+    stamps = {}
+    for path in files:
+        stat = path.stat()
+        stamps[str(path)] = (stat.st_size, stat.st_mtime_ns)
+    stale = [path for path in files if cache.get(str(path), (None, None))[0] != stamps[str(path)]]
+    if stale:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            for path, frame in zip(stale, pool.map(_read_file, stale)):
+                cache[str(path)] = (stamps[str(path)], frame)
+    fresh = {str(path): cache[str(path)] for path in files}
+    if use_cache and (stale or len(fresh) != len(cache)):
+        pd.to_pickle(fresh, cache_path)
+
+    frames = [fresh[str(path)][1].assign(source=path.name) for path in files]
+    if not frames:
+        return pd.DataFrame(columns=SUMMARY_COLUMNS + ["source"]), files
+    return pd.concat(frames, ignore_index=True), files
+
+
+def training_arrays(data, kind):
+    """(X, y) for the `kind` ("inflation" or "deflation") model; rows missing a value are dropped."""
+    columns = FEATURES[kind]
+    target_column, target_name = TARGETS[kind]
+    rows = data.dropna(subset=[*columns.values(), target_column])
+    X = rows[list(columns.values())].set_axis(list(columns), axis=1).reset_index(drop=True)
+    y = rows[target_column].rename(target_name).reset_index(drop=True)
+    return X, y
+
+
+def fit_model(X, y, search=True, folds=5, test_size=0.2, seed=42, n_jobs=-1, param_grid=None):
+    """
+    Fit a RandomForestRegressor on a training split: a k-fold grid search over
+    `param_grid` when `search`, otherwise the shipped settings with k-fold CV for the score.
+
+    :return: TrainingResult with hold-out mse/r2 and cross-validated cv_mse
+    """
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.metrics import mean_squared_error, r2_score
+    from sklearn.model_selection import GridSearchCV, KFold, cross_val_score, train_test_split
+
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=seed)
+    cv = KFold(n_splits=max(2, min(folds, len(X_train))), shuffle=True, random_state=seed)
+    forest = RandomForestRegressor(n_estimators=100, random_state=seed)
+    if search:
+        # Folds and settings are spread over the cores; every forest itself fits on one
+        grid = GridSearchCV(forest, param_grid or PARAM_GRID, cv=cv, scoring="neg_mean_squared_error",
+                            n_jobs=n_jobs)
+        grid.fit(X_train, y_train)
+        model, params, cv_mse = grid.best_estimator_, grid.best_params_, -grid.best_score_
+    else:
+        scores = cross_val_score(forest, X_train, y_train, cv=cv, scoring="neg_mean_squared_error", n_jobs=n_jobs)
+        model = forest.set_params(n_jobs=n_jobs).fit(X_train, y_train)
+        model.set_params(n_jobs=None)  # the app predicts single rows
+        params, cv_mse = {}, -scores.mean()
+
+    predictions = model.predict(X_test)
+    metrics = {"mse": mean_squared_error(y_test, predictions), "r2": r2_score(y_test, predictions),
+               "cv_mse": cv_mse, "rows": len(X)}
+    return TrainingResult(model, X_test, y_test, predictions, metrics, params)
+
+
+def save_model(kind, result, files, path=None, register=True):
+    """Write the pickle and its compiled forest, and register the new version."""
+    import joblib
+    from compiled_forest import CompiledForest, compiled_path
+    from model_registry import ModelRegistry
+
+    path = Path(path or MODEL_PATHS[kind])
+    joblib.dump(result.model, path)
+    CompiledForest.from_sklearn(result.model).save(compiled_path(path))
+    print(f"Model saved to {path} (compiled: {compiled_path(path)})")
+    if register:
+        return ModelRegistry().register(REGISTRY_NAMES[kind], path, loader="forest",
+                                        features=list(FEATURES[kind]), target=TARGETS[kind][1],
+                                        training_files=files, metrics=result.metrics)
+
+
+def plot_results(kind, result):
+    import matplotlib.pyplot as plt
+    y_test, predictions = result.y_test, result.predictions
+    plt.figure(figsize=(8, 6))
+    plt.scatter(y_test, predictions, alpha=0.7)
+    lims = [min(y_test.min(), predictions.min()), max(y_test.max(), predictions.max())]
+    plt.plot(lims, lims, '--', color='red', label='Ideal (y = x)')
+    plt.xlabel(f"Actual {kind.capitalize()} Time [s]")
+    plt.ylabel(f"Predicted {kind.capitalize()} Time [s]")
+    plt.title(f"Predicted vs Actual {kind.capitalize()} Time")
+    plt.grid(True)
+    plt.legend()
+    plt.tight_layout()
+    plt.show()
+
+
+def train(kind, data, files, search=True, folds=5, n_jobs=-1, plot=False, register=True):
+    X, y = training_arrays(data, kind)
+    if len(X) < 2:
+        print(f"Not enough {kind} rows to train on ({len(X)})")
+        return None
+    start = time.perf_counter()
+    result = fit_model(X, y, search=search, folds=folds, n_jobs=n_jobs)
+    m = result.metrics
+    print(f"{kind.capitalize()} Time Model ({len(X)} rows, {time.perf_counter() - start:.1f} s)\n"
+          f"• Mean Squared Error: {m['mse']:.5f}\n• R² Score: {m['r2']:.5f}\n"
+          f"• {folds}-fold CV MSE: {m['cv_mse']:.5f}" + (f"\n• Settings: {result.params}" if result.params else ""))
+    if plot:
+        plot_results(kind, result)
+    save_model(kind, result, files, register=register)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the Smart step timing models from the summary CSVs.")
+    parser.add_argument("--data", default=str(DATA_DIR), help="Folder with the calibrate page's summary CSVs")
+    parser.add_argument("--observations", nargs="*", default=[],
+                        help="timing_observations.csv files of trials to train on as well")
+    parser.add_argument("--model", choices=("inflation", "deflation", "both"), default="both")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--no-search", action="store_true", help="Keep the shipped forest settings")
+    parser.add_argument("--jobs", type=int, default=-1, help="Worker processes (-1 = all cores)")
+    parser.add_argument("--no-cache", action="store_true", help="Re-read every CSV")
+    parser.add_argument("--no-register", action="store_true", help="Do not add the models to the registry")
+    parser.add_argument("--plot", action="store_true", help="Plot predicted vs actual times")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    data, files = load_dataset(args.data, extra_files=args.observations, use_cache=not args.no_cache)
+    print(f"Loaded {len(data)} rows from {len(files)} files in {time.perf_counter() - start:.2f} s")
+    kinds = ("inflation", "deflation") if args.model == "both" else (args.model,)
+    for kind in kinds:
+        train(kind, data, files, search=not args.no_search, folds=args.folds, n_jobs=args.jobs,
+              plot=args.plot, register=not args.no_register)
+    print(f"Done in {time.perf_counter() - start:.1f} s (cpu count {os.cpu_count()})")
+
+
+if __name__ == "__main__":
+    main()
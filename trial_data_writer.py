@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Streams protocol sensor samples to data.csv while the protocol runs.
+
+read_sensors used to collect every sample in App.sensor_data and write the
+whole list when the protocol ended, so memory grew with the length of the
+run. TrialDataWriter appends each row as it arrives and only remembers the
+row count and the last sample time, which create_folder_with_files needs
+for information.txt.
+"""
+import csv
+import threading
+
+HEADER = [
+    'time', 'LPS_pressure', 'LPS_temperature', 'pressure0', 'pressure0_convert',
+    'pressure1', 'pressure1_convert', 'pressure2', 'pressure2_convert',
+    'pressure3', 'valve1_state', 'valve2_state',
+    'self_target_pressure', 'self_target_time', 'clamp_state', 'self_protocol_step', 'cycle'
+]
+
+
+class TrialDataWriter:
+    def __init__(self, path='data.csv', flush_every=50):
+        self.path = path
+        self.flush_every = flush_every
+        self.rows = 0
+        self.last_time = None
+        self._file = None
+        self._writer = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        """Start a new data.csv (truncating the previous one) and write the header."""
+        with self._lock:
+            self._close()
+            self._file = open(self.path, 'w', newline='')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(HEADER)
+            self.rows = 0
+            self.last_time = None
+
+    def is_open(self):
+        return self._file is not None
+
+    def write(self, sample):
+        """Append one sample (a dict keyed by HEADER; missing keys are written empty)."""
+        with self._lock:
+            if self._writer is None:
+                return
+            self._writer.writerow([sample.get(key, '') for key in HEADER])
+            self.rows += 1
+            self.last_time = sample.get('time')
+            if self.rows % self.flush_every == 0:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._writer = None
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Mines valve-timing training rows from recorded protocol trials.
+
+The timing models are trained from the calibrate page's summary CSVs only
+(inflate_s, vent_duration, avg_in, avg_pre, avg_post), but every trial in
+./data/ already logs valve1_state/valve2_state next to the calibrated
+pressures. This segmenter turns those logs into rows of the same schema:
+
+- each valve's state column is run-length encoded, and every
+  neutral -> supply/vent -> neutral interval is one event; edges are placed
+  halfway between the samples either side of the state change
+- avg_pre/avg_post are the valve's own balloon pressure (valve1 -> pressure1,
+  valve2 -> pressure2) averaged over up to `window_s` of neutral time before
+  and after the event, avg_in the supply pressure before it, all computed for
+  every event at once from cumulative sums
+- a vent event follows the deflation model's convention: avg_post is the
+  pressure before venting and avg_pre the pressure it vented down to
+
+Trials are scanned in parallel, one process per file. The rows are written to
+getting_Q/trials_summary_segmented.csv, which timing_model_training.py
+picks up with the calibrate page's summaries.
+
+Usage:
+    python trial_segmenter.py [--data data] [--out getting_Q/trials_summary_segmented.csv]
+"""
+import argparse
+import concurrent.futures
+import csv
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).parent
+DATA_DIR = ROOT / "data"
+OUT_PATH = ROOT / "getting_Q" / "trials_summary_segmented.csv"
+
+VALVE_CHANNELS = {"valve1": "pressure1_convert", "valve2": "pressure2_convert"}
+INPUT_CHANNEL = "pressure0_convert"
+REQUIRED_COLUMNS = ["time", INPUT_CHANNEL, *VALVE_CHANNELS.values(), *(f"{v}_state" for v in VALVE_CHANNELS)]
+
+# Calibrate page summary columns, then where each row came from
+OUT_COLUMNS = ["trial", "inflate_s", "vent_s", "vent_duration", "avg_in", "avg_pre", "avg_post",
+               "source", "valve", "start_s"]
+
+
+def _window_means(t, values, starts, ends):
+    """Mean of `values` over t in [starts[i], ends[i]) for every i; NaN samples are skipped."""
+    valid = ~np.isnan(values)
+    sums = np.concatenate(([0.0], np.cumsum(np.where(valid, values, 0.0))))
+    counts = np.concatenate(([0], np.cumsum(valid)))
+    i = np.searchsorted(t, starts, side="left")
+    j = np.searchsorted(t, ends, side="left")
+    n = counts[j] - counts[i]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(n > 0, (sums[j] - sums[i]) / n, np.nan)
+
+
+def segment_trial(frame, window_s=5.0, min_window_s=1.0, settle_s=0.0, min_event_s=0.02):
+    """
+    Summary rows of every clean supply/vent event in one trial's samples.
+
+    :param window_s: Longest averaging window before and after an event (the calibrate page uses 5 s).
+    :param min_window_s: Events with less neutral time than this on either side are skipped.
+    :param settle_s: Time after the valve closes that is left out of the post window.
+    :return: DataFrame with OUT_COLUMNS except "source"
+    """
+    frame = frame.sort_values("time", kind="stable")
+    t = pd.to_numeric(frame["time"], errors="coerce").to_numpy(float)
+    keep = ~np.isnan(t)
+    t = t[keep]
+    supply = pd.to_numeric(frame[INPUT_CHANNEL], errors="coerce").to_numpy(float)[keep]
+    out = []
+    for valve, channel in VALVE_CHANNELS.items():
+        if len(t) < 3:
+            break
+        state = frame[f"{valve}_state"].astype(str).str.strip().to_numpy()[keep]
+        pressure = pd.to_numeric(frame[channel], errors="coerce").to_numpy(float)[keep]
+
+        # Runs of equal state; a run's boundaries are halfway between the samples around each change
+        change = np.flatnonzero(state[1:] != state[:-1]) + 1
+        run_first = np.concatenate(([0], change))
+        boundaries = np.concatenate(([t[0]], (t[change - 1] + t[change]) / 2, [t[-1]]))
+        run_begin, run_end = boundaries[:-1], boundaries[1:]
+        run_state = state[run_first]
+
+        # Events: supply or vent runs with a neutral run on both sides
+        k = np.arange(1, len(run_first) - 1)
+        k = k[np.isin(run_state[k], ("supply", "vent"))
+              & (run_state[k - 1] == "neutral") & (run_state[k + 1] == "neutral")]
+        if not len(k):
+            continue
+        begin, end = run_begin[k], run_end[k]
+        pre_start = np.maximum(begin - window_s, run_begin[k - 1])
+        post_start = end + settle_s
+        post_end = np.minimum(post_start + window_s, run_end[k + 1])
+        ok = ((end - begin >= min_event_s) & (begin - pre_start >= min_window_s)
+              & (post_end - post_start >= min_window_s))
+        k, begin, end, pre_start, post_start, post_end = (a[ok] for a in (k, begin, end, pre_start,
+                                                                           post_start, post_end))
+
+        before = _window_means(t, pressure, pre_start, begin)
+        after = _window_means(t, pressure, post_start, post_end)
+        avg_in = _window_means(t, supply, pre_start, begin)
+        duration = end - begin
+        is_supply = run_state[k] == "supply"
+        out.append(pd.DataFrame({
+            "inflate_s": np.where(is_supply, duration, np.nan),
+            "vent_s": np.where(is_supply, np.nan, duration),
+            "vent_duration": np.where(is_supply, np.nan, duration),
+            "avg_in": avg_in,
+            "avg_pre": np.where(is_supply, before, after),
+            "avg_post": np.where(is_supply, after, before),
+            "valve": valve,
+            "start_s": begin,
+        }))
+    if not out:
+        return pd.DataFrame(columns=[c for c in OUT_COLUMNS if c != "source"])
+    rows = pd.concat(out, ignore_index=True).dropna(subset=["avg_in", "avg_pre", "avg_post"])
+    rows = rows.sort_values(["start_s", "valve"], kind="stable").reset_index(drop=True)
+    rows.insert(0, "trial", np.arange(1, len(rows) + 1))
+    return rows
+
+
+def is_trial_csv(path):
+    """True for a trial's sample log (it has the valve state and pressure columns)."""
+    try:
+        with open(path, newline="") as file:
+            header = next(csv.reader(file), [])
+    except OSError:
+        return False
+    return all(column in header for column in REQUIRED_COLUMNS)
+
+
+def segment_file(path, **options):
+    frame = pd.read_csv(path, usecols=REQUIRED_COLUMNS)
+    rows = segment_trial(frame, **options)
+    rows.insert(len(rows.columns) - 2, "source", str(path))
+    return rows
+
+
+def segment_trials(folder=DATA_DIR, jobs=None, **options):
+    """Rows of every trial CSV under `folder`, in file order, scanned in parallel."""
+    files = sorted(p for p in Path(folder).rglob("*.csv") if is_trial_csv(p))
+    if not files:
+        return pd.DataFrame(columns=OUT_COLUMNS), files
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(segment_file, path, **options) for path in files]
+        frames = []
+        for path, future in zip(files, futures):
+            try:
+                frames.append(future.result())
+            except Exception as e:
+                print(f"Skipping {path}: {e}")
+    frames = [frame for frame in frames if len(frame)]
+    if not frames:
+        return pd.DataFrame(columns=OUT_COLUMNS), files
+    return pd.concat(frames, ignore_index=True)[OUT_COLUMNS], files
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract valve-timing summary rows from recorded trials.")
+    parser.add_argument("--data", default=str(DATA_DIR), help="Folder with the trial folders")
+    parser.add_argument("--out", default=str(OUT_PATH), help="Summary CSV to write")
+    parser.add_argument("--window", type=float, default=5.0, help="Averaging window before/after an event (s)")
+    parser.add_argument("--min-window", type=float, default=1.0,
+                        help="Skip events with less neutral time than this on either side (s)")
+    parser.add_argument("--settle", type=float, default=0.0, help="Time after an event left out of avg_post (s)")
+    parser.add_argument("--jobs", type=int, help="Worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    rows, files = segment_trials(args.data, jobs=args.jobs, window_s=args.window,
+                                 min_window_s=args.min_window, settle_s=args.settle)
+    Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+    rows.to_csv(args.out, index=False)
+    supply = int(rows["inflate_s"].notna().sum())
+    print(f"{len(files)} trials -> {supply} supply and {len(rows) - supply} vent events in "
+          f"{time.perf_counter() - start:.1f} s, written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Typed protocol variables and compiled argument expressions.
+
+Protocol variables (cycle counters, saved metrics, user input, the Smart
+steps' peak_pressure/avg_IAP) live in a VariableStore. Every variable has a
+type (int, float or string) fixed by its first assignment or declaration.
+Writes replace the whole mapping, so the control thread reads without
+taking a lock. Values that belong in variables.txt are only recorded in
+memory while the protocol runs and written with the trial folder in a
+single write by a background thread, so saving a variable adds no disk I/O
+to the step path.
+
+Step arguments that are not plain numbers, like "peak" or
+"(peak * 0.8 + cycle / 10)", are compiled once per protocol into an
+Expression by protocol_compiler and evaluated against the store when the
+step runs.
+"""
+import ast
+import collections
+import threading
+import time
+
+TYPES = {"int": int, "float": float, "string": str}
+
+# Functions an expression may call
+FUNCTIONS = {"min": min, "max": max, "abs": abs, "round": round, "int": int, "float": float}
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Name, ast.Load, ast.Constant, ast.Call,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow, ast.USub, ast.UAdd,
+)
+
+Variable = collections.namedtuple("Variable", "value type")
+
+
+class Expression:
+    """
+    A step argument that names a variable or is a "(expression)" of variables.
+
+    Only numbers, variable names, + - * / // % **, and calls to min, max, abs, round,
+    int and float are allowed. The text is parsed and compiled once.
+
+    :raises ValueError: if the text is not a valid expression.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        source = text[1:-1] if text.startswith("(") and text.endswith(")") else text
+        try:
+            tree = ast.parse(source.strip(), mode="eval")
+        except SyntaxError:
+            raise ValueError(f"invalid expression {text!r}") from None
+        names = set()
+        for node in ast.walk(tree):
+            if not isinstance(node, _ALLOWED_NODES):
+                raise ValueError(f"{type(node).__name__} is not allowed in expression {text!r}")
+            if isinstance(node, ast.Call):
+                if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS or node.keywords:
+                    raise ValueError(f"only {', '.join(FUNCTIONS)} can be called in expression {text!r}")
+            elif isinstance(node, ast.Name) and node.id not in FUNCTIONS:
+                names.add(node.id)
+            elif isinstance(node, ast.Constant) and not isinstance(node.value, (int, float)):
+                raise ValueError(f"only numbers are allowed in expression {text!r}")
+        self.names = frozenset(names)
+        self._code = compile(tree, f"<{text}>", "eval")
+
+    def evaluate(self, store):
+        """Numeric value with the variables of `store`; raises ValueError for an unknown variable."""
+        namespace = {name: store.number(name) for name in self.names}
+        try:
+            return eval(self._code, {"__builtins__": {}, **FUNCTIONS}, namespace)
+        except ArithmeticError as e:
+            raise ValueError(f"cannot evaluate {self.text!r}: {e}") from None
+
+    def __eq__(self, other):
+        return isinstance(other, Expression) and other.text == self.text
+
+    def __hash__(self):
+        return hash(self.text)
+
+    def __repr__(self):
+        return f"Expression({self.text!r})"
+
+    def __str__(self):
+        return self.text
+
+
+class VariableStore:
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._values = {}  # name -> Variable; replaced, never mutated, so reads need no lock
+        self._history = []  # (time, name, value) of persisted assignments
+        self._lock = threading.Lock()
+        self._writer = None
+
+    def clear(self):
+        """Forget all variables and the recorded history (a new protocol run)."""
+        with self._lock:
+            self._values = {}
+            self._history = []
+
+    def get(self, name, default=None):
+        variable = self._values.get(name)
+        return default if variable is None else variable.value
+
+    def type_of(self, name):
+        variable = self._values.get(name)
+        return None if variable is None else variable.type
+
+    def number(self, name):
+        """
+        Numeric value of `name`. A string variable is taken as the name of another
+        variable and followed, for at most 10 steps.
+        """
+        value = self.get(name)
+        hops = 0
+        while isinstance(value, str) and hops < 10:
+            value = self.get(value)
+            hops += 1
+        if value is None:
+            raise ValueError(f"Variable '{name}' is not set.")
+        try:
+            return float(value)
+        except ValueError:
+            raise ValueError(f"Value for '{name}' is not a valid number.") from None
+
+    def set(self, name, value, type_name=None):
+        """
+        Assign `value`, converted to the variable's type: `type_name` ("int", "float" or
+        "string"), else the type it already has, else the type of `value`.
+
+        :raises ValueError: if the value cannot be converted to the variable's type.
+        """
+        with self._lock:
+            current = self._values.get(name)
+            if type_name is None:
+                type_name = current.type if current is not None else _type_name(value)
+            converted = _convert(value, type_name, name)
+            values = dict(self._values)
+            values[name] = Variable(converted, type_name)
+            self._values = values
+        return converted
+
+    def persist(self, name, value, type_name=None):
+        """set() the variable and record the assignment for variables.txt."""
+        converted = self.set(name, value, type_name)
+        with self._lock:
+            self._history.append((self.clock(), name, converted))
+        return converted
+
+    def snapshot(self):
+        return {name: variable.value for name, variable in self._values.items()}
+
+    @property
+    def history(self):
+        return list(self._history)
+
+    def write(self, path):
+        """
+        Write variables.txt: every persisted assignment followed by the final value of
+        every variable, in the old "date, name, value" format and in one write.
+        """
+        with self._lock:
+            history = list(self._history)
+            values = self._values
+        now = time.strftime('%Y-%m-%d %H:%M:%S')
+        lines = [f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(t))}, {name}, {value}\n"
+                 for t, name, value in history]
+        lines.extend(f"{now}, {name}, {variable.value}\n" for name, variable in values.items())
+        with open(path, 'w') as file:
+            file.write("".join(lines))
+
+    def write_async(self, path):
+        """write() on a background thread; see wait_written()."""
+        self.wait_written()
+        self._writer = threading.Thread(target=self.write, args=(path,), daemon=True)
+        self._writer.start()
+        return self._writer
+
+    def wait_written(self, timeout=None):
+        if self._writer is not None:
+            self._writer.join(timeout)
+            self._writer = None
+
+
+def _type_name(value):
+    if isinstance(value, bool) or isinstance(value, str):
+        return "string"
+    if isinstance(value, int):
+        return "int"
+    return "float"
+
+
+def _convert(value, type_name, name):
+    if type_name not in TYPES:
+        raise ValueError(f"unknown variable type {type_name!r}")
+    try:
+        if type_name == "int" and isinstance(value, float) and not value.is_integer():
+            raise ValueError
+        return TYPES[type_name](value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Variable '{name}' is {type_name}, got {value!r}") from None